@@ -11,6 +11,8 @@ from datetime import datetime, timezone
 from typing import List, Dict, Any, Optional
 from dotenv import load_dotenv
 
+from timestamps import later, to_epoch_us
+
 load_dotenv()
 
 # -----------------------------
@@ -103,6 +105,7 @@ def fetch_pull_requests(since_ts: Optional[str]) -> List[Dict[str, Any]]:
 
     page = 1
     results: List[Dict[str, Any]] = []
+    since_us = to_epoch_us(since_ts) if since_ts else None
 
     while True:
         prs = github_get(
@@ -120,7 +123,7 @@ def fetch_pull_requests(since_ts: Optional[str]) -> List[Dict[str, Any]]:
             break
 
         for pr in prs:
-            if since_ts and pr["updated_at"] <= since_ts:
+            if since_us is not None and to_epoch_us(pr["updated_at"]) <= since_us:
                 continue
             results.append(pr)
 
@@ -165,8 +168,7 @@ if __name__ == "__main__":
 
         existing_pr_ids.add(pr_id)
 
-        if not max_updated_at or pr["updated_at"] > max_updated_at:
-            max_updated_at = pr["updated_at"]
+        max_updated_at = later(max_updated_at, pr["updated_at"])
 
     if new_records:
         if os.path.exists(OUTPUT_FILE):
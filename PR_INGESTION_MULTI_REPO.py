@@ -1,20 +1,29 @@
-import os
-import json
-import requests
-from datetime import datetime, timezone
-from typing import List, Dict, Any, Optional
-from dotenv import load_dotenv
+"""
+Merged pull request ingestion across REPOSITORIES (REST listing + GraphQL
+detail). Run as a script, or call ingest_repo() per scheduled job
+(ingestion_daemon) with checkpoints kept warm between calls. Each page is
+staged durably as it is fetched and merged into the output file every
+MERGE_EVERY_PAGES pages, and an interrupted fetch resumes from its
+backfill_journal entry.
+"""
 
-load_dotenv()
+import os
+import time
+from typing import List, Dict, Any, Iterator, Optional, Tuple
+
+import json_store
+from backfill_journal import journal
+from key_index import ID_WIDTH, KeyIndex, id_key
+from pipeline import prefetch
+from github_client import github_get, github_graphql_cached
+from payload_decoder import PULL_LIST_SCHEMA
+from repo_discovery import repo_key, split_full_name
+from timestamps import as_epoch_us, epoch_of, from_epoch_us, normalize, now_iso, to_epoch_us
 
 # -------------------------------------------------
 # Configuration
 # -------------------------------------------------
 
-ACCESS_TOKEN = os.getenv("ACCESS_TOKEN")
-if not ACCESS_TOKEN:
-    raise RuntimeError("ACCESS_TOKEN is not set")
-
 REPO_OWNER = "hrishi-york"
 
 REPOSITORIES = [
@@ -26,64 +35,104 @@ REPOSITORIES = [
 OUTPUT_FILE = "github_pr_merged_events.json"
 
 BASE_URL = "https://api.github.com"
-GRAPHQL_URL = "https://api.github.com/graphql"
 
 PER_PAGE = 100
-TIMEOUT = 10
-
-HEADERS = {
-    "Authorization": f"Bearer {ACCESS_TOKEN}",
-    "Accept": "application/vnd.github+json",
-}
 
-session = requests.Session()
-session.headers.update(HEADERS)
+# Warm state is re-read from disk this often to pick up other writers.
+STATE_TTL_SECONDS = float(os.getenv("INGEST_STATE_TTL", "3600"))
 
 # -------------------------------------------------
-# REST + GraphQL helpers
+# Storage helpers
 # -------------------------------------------------
 
 
-def github_get(url: str, params: Optional[Dict[str, Any]] = None) -> Any:
-    r = session.get(url, params=params, timeout=TIMEOUT)
-    r.raise_for_status()
-    return r.json()
+def load_existing_records() -> List[Dict[str, Any]]:
+    return json_store.load_records(OUTPUT_FILE)
 
 
-def github_graphql(query: str, variables: dict) -> dict:
-    r = session.post(
-        GRAPHQL_URL,
-        json={"query": query, "variables": variables},
-        timeout=TIMEOUT,
-    )
-    r.raise_for_status()
-    return r.json()
+def build_checkpoint(records: List[Dict[str, Any]]) -> Dict[str, int]:
+    """Latest updated_at (epoch microseconds) per repo."""
+    checkpoint: Dict[str, int] = {}
+    for r in records:
+        if "repo_name" in r and r.get("updated_at"):
+            repo = repo_key(r.get("repo_owner", REPO_OWNER), r["repo_name"], REPO_OWNER)
+            ts = epoch_of(r, "updated_at")
+            if repo not in checkpoint or ts > checkpoint[repo]:
+                checkpoint[repo] = ts
+    return checkpoint
 
 
-# -------------------------------------------------
-# Storage helpers
-# -------------------------------------------------
+def update_checkpoint(meta: Dict[str, Any], records: List[Dict[str, Any]]) -> None:
+    checkpoint = meta.setdefault("checkpoint", {})
+    for key, ts in build_checkpoint(records).items():
+        if key not in checkpoint or ts > as_epoch_us(checkpoint[key]):
+            checkpoint[key] = ts
 
 
-def load_existing_records() -> List[Dict[str, Any]]:
-    if not os.path.exists(OUTPUT_FILE):
-        return []
-    with open(OUTPUT_FILE, "r") as f:
-        return json.load(f)
+def record_repo(r: Dict[str, Any]) -> str:
+    return repo_key(r.get("repo_owner", REPO_OWNER), r["repo_name"], REPO_OWNER)
 
 
-def build_checkpoint(records: List[Dict[str, Any]]) -> Dict[str, str]:
-    checkpoint = {}
-    for r in records:
-        if "repo_name" in r and r.get("updated_at"):
-            repo = r["repo_name"]
-            if repo not in checkpoint or r["updated_at"] > checkpoint[repo]:
-                checkpoint[repo] = r["updated_at"]
-    return checkpoint
+def pr_key(r: Dict[str, Any]) -> Tuple[str, bytes]:
+    return record_repo(r), id_key(r["pr_id"])
+
+
+pr_index = KeyIndex(
+    "pr_merged",
+    OUTPUT_FILE,
+    ID_WIDTH,
+    repo_of=record_repo,
+    key_of=lambda r: id_key(r["pr_id"]),
+    update_meta=update_checkpoint,
+)
+
+
+class PRState:
+    def __init__(self) -> None:
+        self.checkpoint: Dict[str, int] = {}
+        self.loaded_at: Optional[float] = None
+        # Keys of records staged in page_log and not merged yet.
+        self.staged: set = set()
+
+    def refresh(self) -> None:
+        if (
+            self.loaded_at is not None
+            and time.monotonic() - self.loaded_at < STATE_TTL_SECONDS
+        ):
+            return
+
+        pr_index.open()
+        self.checkpoint = {
+            k: as_epoch_us(v) for k, v in pr_index.meta.get("checkpoint", {}).items()
+        }
+        self.loaded_at = time.monotonic()
+
+    def is_new(self, repo: str, pr_id: int) -> bool:
+        key = (repo, id_key(pr_id))
+        return key not in self.staged and not pr_index.contains(*key)
+
+    def stage(self, records: List[Dict[str, Any]]) -> None:
+        self.staged.update(map(pr_key, records))
+
+    def add(self, records: List[Dict[str, Any]]) -> None:
+        for r in records:
+            repo = record_repo(r)
+            ts = r["updated_at_us"]
+            if ts > self.checkpoint.get(repo, -1):
+                self.checkpoint[repo] = ts
+
+
+state = PRState()
 
 
-def existing_pr_ids(records: List[Dict[str, Any]]) -> set:
-    return {r["pr_id"] for r in records if "pr_id" in r}
+def merge_pages(records: List[Dict[str, Any]]) -> int:
+    # Checked against the index under the lock; the file is only appended to.
+    appended = pr_index.append(records)
+    state.staged.difference_update(map(pr_key, records))
+    return appended
+
+
+page_log = json_store.PageLog(OUTPUT_FILE, merge_pages)
 
 
 # -------------------------------------------------
@@ -135,6 +184,11 @@ query ($owner: String!, $repo: String!, $number: Int!) {
 # -------------------------------------------------
 
 
+def is_merged(pr_data: Dict[str, Any]) -> bool:
+    repository = (pr_data.get("data") or {}).get("repository") or {}
+    return bool((repository.get("pullRequest") or {}).get("mergedAt"))
+
+
 def infer_merge_type_graphql(pr_data: Dict[str, Any]) -> str:
     pr = pr_data["data"]["repository"]["pullRequest"]
 
@@ -167,99 +221,141 @@ def infer_merge_type_graphql(pr_data: Dict[str, Any]) -> str:
 # -------------------------------------------------
 
 
-def fetch_pull_requests(repo: str, since_ts: Optional[str]) -> List[Dict[str, Any]]:
-    page = 1
-    results = []
+def iter_pull_request_pages(
+    repo: str, since_us: Optional[int], owner: str = REPO_OWNER, start_page: int = 1
+) -> Iterator[Tuple[int, List[Dict[str, Any]]]]:
+    # Newest updates first, stopping at the checkpoint instead of paging
+    # through the repo's whole PR history on every run.
+    page = start_page
 
     while True:
         prs = github_get(
-            f"{BASE_URL}/repos/{REPO_OWNER}/{repo}/pulls",
+            f"{BASE_URL}/repos/{owner}/{repo}/pulls",
             params={
                 "state": "all",
                 "sort": "updated",
-                "direction": "asc",
+                "direction": "desc",
                 "per_page": PER_PAGE,
                 "page": page,
             },
+            schema=PULL_LIST_SCHEMA,
         )
 
         if not prs:
-            break
+            return
 
-        for pr in prs:
-            if since_ts and pr["updated_at"] <= since_ts:
-                continue
-            results.append(pr)
+        for i, pr in enumerate(prs):
+            if since_us is not None and to_epoch_us(pr["updated_at"]) <= since_us:
+                yield page, prs[:i]
+                return
+
+        yield page, prs
 
         page += 1
 
-    return results
+
+def build_merged_record(
+    repo: str, pr: Dict[str, Any], owner: str = REPO_OWNER
+) -> Dict[str, Any]:
+    # A merged PR's commits and merge commit are final: re-runs and
+    # reprocessing read them from the immutable cache.
+    gql_data = github_graphql_cached(
+        PR_GRAPHQL_QUERY,
+        {
+            "owner": owner,
+            "repo": repo,
+            "number": pr["number"],
+        },
+        immutable=is_merged,
+    )
+
+    pr_node = gql_data["data"]["repository"]["pullRequest"]
+    commits = pr_node["commits"]["nodes"]
+    merge_commit = pr_node.get("mergeCommit")
+
+    return normalize({
+        # REST id, the key existing records and the dedup set use
+        "pr_id": pr["id"],
+        "pr_number": pr_node["number"],
+        "source_branch": pr_node["headRefName"],
+        "source_sha": commits[-1]["commit"]["oid"] if commits else None,
+        "target_branch": pr_node["baseRefName"],
+        "base_sha": pr_node["baseRefOid"],
+        "merge_type": infer_merge_type_graphql(gql_data),
+        "merge_commit_sha": (merge_commit["oid"] if merge_commit else None),
+        "repo_owner": owner,
+        "repo_name": repo,
+        "created_at": pr_node["createdAt"],
+        "updated_at": pr_node["updatedAt"],
+        "merged_at": pr_node["mergedAt"],
+        "ingested_at": now_iso(),
+    })
 
 
 # -------------------------------------------------
-# Main execution
+# Ingest
 # -------------------------------------------------
 
-if __name__ == "__main__":
 
-    existing = load_existing_records()
-    checkpoint = build_checkpoint(existing)
-    seen_pr_ids = existing_pr_ids(existing)
-
-    new_events: List[Dict[str, Any]] = []
-
-    for repo in REPOSITORIES:
-        print(f"Fetching PRs for {repo}")
-
-        since_ts = checkpoint.get(repo)
-        prs = fetch_pull_requests(repo, since_ts)
-
-        for pr in prs:
-            if not pr.get("merged_at"):
-                continue
-
-            if pr["id"] in seen_pr_ids:
-                continue
-
-            gql_data = github_graphql(
-                PR_GRAPHQL_QUERY,
-                {
-                    "owner": REPO_OWNER,
-                    "repo": repo,
-                    "number": pr["number"],
-                },
-            )
-
-            pr_node = gql_data["data"]["repository"]["pullRequest"]
-            commits = pr_node["commits"]["nodes"]
-            merge_commit = pr_node.get("mergeCommit")
-
-            record = {
-                "pr_id": pr_node["id"],
-                "pr_number": pr_node["number"],
-                "source_branch": pr_node["headRefName"],
-                "source_sha": commits[-1]["commit"]["oid"] if commits else None,
-                "target_branch": pr_node["baseRefName"],
-                "base_sha": pr_node["baseRefOid"],
-                "merge_type": infer_merge_type_graphql(gql_data),
-                "merge_commit_sha": (merge_commit["oid"] if merge_commit else None),
-                "repo_owner": REPO_OWNER,
-                "repo_name": repo,
-                "created_at": pr_node["createdAt"],
-                "updated_at": pr_node["updatedAt"],
-                "merged_at": pr_node["mergedAt"],
-                "ingested_at": datetime.now(timezone.utc).isoformat(),
-            }
+def ingest_repo(repo: str) -> int:
+    """repo is a bare name (REPO_OWNER) or "owner/name"."""
+    state.refresh()
+
+    owner, repo_name = split_full_name(repo, REPO_OWNER)
+    repo_id = repo_key(owner, repo_name, REPO_OWNER)
+
+    key = f"pr_merged:{repo_id}"
+    since, start_page = journal.resume(key, state.checkpoint.get(repo_id))
+    since_us = as_epoch_us(since)
+
+    print(
+        f"Fetching PRs for {repo} | "
+        f"since={from_epoch_us(since_us) if since_us is not None else None}"
+    )
+
+    appended = 0
 
-            new_events.append(record)
-            seen_pr_ids.add(pr["id"])
+    # The next page downloads while this one is enriched and written.
+    pages = prefetch(iter_pull_request_pages(repo_name, since_us, owner, start_page))
+
+    for page, prs in pages:
+        new_events = [
+            build_merged_record(repo_name, pr, owner)
+            for pr in prs
+            if pr.get("merged_at") and state.is_new(repo_id, pr["id"])
+        ]
+
+        if not new_events:
+            continue
+
+        # Written before the events move the checkpoint past the pages
+        # still to fetch.
+        journal.advance(key, since_us, page)
+
+        state.stage(new_events)
+        appended += page_log.append(new_events)
+        state.add(new_events)
+
+    # Merged before the journal entry goes, so a crash resumes instead.
+    appended += page_log.flush()
+    journal.finish(key)
+
+    return appended
+
+
+def ingest_all() -> int:
+    return sum(ingest_repo(repo) for repo in REPOSITORIES)
+
+
+# -------------------------------------------------
+# Main execution
+# -------------------------------------------------
+
+if __name__ == "__main__":
 
-    if new_events:
-        all_records = existing + new_events
-        with open(OUTPUT_FILE, "w") as f:
-            json.dump(all_records, f, indent=2)
+    appended = ingest_all()
 
-        print(f"New PRs ingested: {len(new_events)}")
-        print(f"Total PRs stored: {len(all_records)}")
+    if appended:
+        print(f"New PRs ingested: {appended}")
     else:
         print("No new PRs found")
@@ -11,6 +11,8 @@ from datetime import datetime, timezone
 from typing import List, Dict, Any, Optional
 from dotenv import load_dotenv
 
+from timestamps import later, to_epoch_us
+
 load_dotenv()
 
 # -------------------------------------------------
@@ -101,6 +103,7 @@ def fetch_pull_requests(since_ts: Optional[str]) -> List[Dict[str, Any]]:
 
     page = 1
     results: List[Dict[str, Any]] = []
+    since_us = to_epoch_us(since_ts) if since_ts else None
 
     while True:
         prs = github_get(
@@ -118,7 +121,7 @@ def fetch_pull_requests(since_ts: Optional[str]) -> List[Dict[str, Any]]:
             break
 
         for pr in prs:
-            if since_ts and pr["updated_at"] <= since_ts:
+            if since_us is not None and to_epoch_us(pr["updated_at"]) <= since_us:
                 continue
             results.append(pr)
 
@@ -176,8 +179,7 @@ if __name__ == "__main__":
 
         emitted_pr_ids.add(pr_id)
 
-        if not max_seen_updated_at or pr["updated_at"] > max_seen_updated_at:
-            max_seen_updated_at = pr["updated_at"]
+        max_seen_updated_at = later(max_seen_updated_at, pr["updated_at"])
 
     # -------------------------------------------------
     # PERSIST RESULTS
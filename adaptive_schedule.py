@@ -0,0 +1,105 @@
+"""
+Adaptive per-repo polling intervals
+
+Each scheduled job reports how many new items (commits, deployment updates,
+merged PRs) its run found. AdaptiveInterval keeps an exponentially weighted
+change rate per job and derives the next interval from it: a run that finds
+nothing doubles the interval (up to max_interval), a run that finds changes
+tightens it towards one poll per TARGET_CHANGES_PER_POLL changes (down to
+min_interval). Learned intervals are persisted so a restart does not begin
+polling quiet repos at full speed again.
+"""
+
+import os
+import json
+from typing import Any, Dict, Optional
+
+# -----------------------------
+# CONFIG
+# -----------------------------
+
+STATE_FILE = "adaptive_schedule_state.json"
+
+MIN_INTERVAL_SECONDS = float(os.getenv("POLL_MIN_INTERVAL", "60"))
+MAX_INTERVAL_SECONDS = float(os.getenv("POLL_MAX_INTERVAL", str(6 * 3600)))
+
+BACKOFF_FACTOR = 2.0
+RATE_SMOOTHING = 0.3
+TARGET_CHANGES_PER_POLL = 1.0
+
+# -----------------------------
+# POLICY
+# -----------------------------
+
+
+class AdaptiveInterval:
+    def __init__(
+        self,
+        interval: float,
+        min_interval: float = MIN_INTERVAL_SECONDS,
+        max_interval: float = MAX_INTERVAL_SECONDS,
+        backoff: float = BACKOFF_FACTOR,
+        smoothing: float = RATE_SMOOTHING,
+    ) -> None:
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.smoothing = smoothing
+
+        self.interval = self._clamp(interval)
+        # changes per second, None until the first observation
+        self.rate: Optional[float] = None
+
+    def _clamp(self, interval: float) -> float:
+        return min(self.max_interval, max(self.min_interval, interval))
+
+    def observe(self, new_items: Optional[int], elapsed: float) -> float:
+        """
+        Fold one run's result in and return the next interval. new_items is
+        None when the run failed, which backs off like a quiet run.
+        """
+        if new_items is None:
+            self.interval = self._clamp(self.interval * self.backoff)
+            return self.interval
+
+        sample = new_items / max(elapsed, 1.0)
+        self.rate = (
+            sample
+            if self.rate is None
+            else self.smoothing * sample + (1 - self.smoothing) * self.rate
+        )
+
+        if new_items == 0:
+            self.interval = self._clamp(self.interval * self.backoff)
+        else:
+            # Activity never loosens the interval, only tightens it.
+            target = TARGET_CHANGES_PER_POLL / self.rate
+            self.interval = self._clamp(min(self.interval, target))
+
+        return self.interval
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"interval": self.interval, "rate": self.rate}
+
+    def restore(self, saved: Dict[str, Any]) -> None:
+        self.interval = self._clamp(saved.get("interval", self.interval))
+        self.rate = saved.get("rate")
+
+
+# -----------------------------
+# PERSISTENCE
+# -----------------------------
+
+
+def load_state(path: str = STATE_FILE) -> Dict[str, Dict[str, Any]]:
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_state(policies: Dict[str, AdaptiveInterval], path: str = STATE_FILE) -> None:
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({name: p.to_dict() for name, p in policies.items()}, f, indent=2)
+    os.replace(tmp_path, path)
@@ -0,0 +1,132 @@
+"""
+Bounded admission queue with load shedding for the webhook receivers
+"""
+
+import os
+import time
+import queue
+import atexit
+import threading
+from typing import Any, Callable, Dict, List
+
+# -----------------------------
+# CONFIG
+# -----------------------------
+
+# Shedding starts once the queue reaches HIGH_WATER and stops again only
+# after the workers have drained it down to LOW_WATER (hysteresis, so the
+# receiver does not flap between accepting and rejecting on every request).
+QUEUE_HIGH_WATER = int(os.getenv("WEBHOOK_QUEUE_HIGH_WATER", "500"))
+QUEUE_LOW_WATER = int(os.getenv("WEBHOOK_QUEUE_LOW_WATER", "250"))
+RETRY_AFTER_SECONDS = int(os.getenv("WEBHOOK_RETRY_AFTER", "30"))
+SINK_WORKERS = int(os.getenv("WEBHOOK_SINK_WORKERS", "1"))
+DRAIN_TIMEOUT = 10
+
+# -----------------------------
+# ADMISSION QUEUE
+# -----------------------------
+
+
+class AdmissionQueue:
+    """
+    Decouples request handling from slow sink writes.
+
+    Handlers call offer() and answer immediately; worker threads feed the
+    queued items to the sink. When the queue is saturated offer() returns
+    False and the handler should reply 503 with a Retry-After header.
+    """
+
+    def __init__(
+        self,
+        sink: Callable[[Any], None],
+        high_water: int = QUEUE_HIGH_WATER,
+        low_water: int = QUEUE_LOW_WATER,
+        workers: int = SINK_WORKERS,
+        retry_after: int = RETRY_AFTER_SECONDS,
+    ) -> None:
+        if low_water >= high_water:
+            raise ValueError("low_water must be below high_water")
+
+        self.sink = sink
+        self.high_water = high_water
+        self.low_water = low_water
+        self.workers = workers
+        self.retry_after = retry_after
+
+        self._queue: "queue.Queue[Any]" = queue.Queue(maxsize=high_water)
+        self._lock = threading.Lock()
+        self._threads: List[threading.Thread] = []
+        self._shedding = False
+
+        self.accepted = 0
+        self.shed = 0
+        self.processed = 0
+        self.sink_errors = 0
+
+    def start(self) -> "AdmissionQueue":
+        for i in range(self.workers):
+            t = threading.Thread(
+                target=self._worker, name=f"admission-sink-{i}", daemon=True
+            )
+            t.start()
+            self._threads.append(t)
+
+        atexit.register(self.drain)
+        return self
+
+    def offer(self, item: Any) -> bool:
+        with self._lock:
+            depth = self._queue.qsize()
+
+            if self._shedding and depth <= self.low_water:
+                self._shedding = False
+            elif not self._shedding and depth >= self.high_water:
+                self._shedding = True
+
+            if self._shedding:
+                self.shed += 1
+                return False
+
+            try:
+                self._queue.put_nowait(item)
+            except queue.Full:
+                self._shedding = True
+                self.shed += 1
+                return False
+
+            self.accepted += 1
+            return True
+
+    def drain(self, timeout: float = DRAIN_TIMEOUT) -> bool:
+        deadline = time.monotonic() + timeout
+        while self._queue.unfinished_tasks:
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(0.05)
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "queue_depth": self._queue.qsize(),
+            "high_water": self.high_water,
+            "low_water": self.low_water,
+            "shedding": self._shedding,
+            "accepted": self.accepted,
+            "shed": self.shed,
+            "processed": self.processed,
+            "sink_errors": self.sink_errors,
+        }
+
+    def _worker(self) -> None:
+        while True:
+            item = self._queue.get()
+            try:
+                self.sink(item)
+                with self._lock:
+                    self.processed += 1
+            except Exception as e:
+                with self._lock:
+                    self.sink_errors += 1
+                print("Sink write failed:", e)
+            finally:
+                self._queue.task_done()
@@ -0,0 +1,354 @@
+"""
+Columnar export of the ingested commit, deployment and PR events
+
+The ingesters keep writing their JSON files; this stage mirrors them into a
+partitioned analytics dataset under EXPORT_DIR:
+
+    <dataset>/repo=<owner>__<name>/month=<YYYY-MM>/part-0.parquet
+
+with typed columns (timestamps as UTC microsecond timestamps, ids as
+int64) and repeated names dictionary-encoded. Each run only rewrites the
+partitions whose records changed since the last export (tracked by digest
+in STATE_FILE), so appending a day of events touches the current month of
+the repos that had activity, and a source file that has not changed since
+the last run is not read at all.
+
+EXPORT_FORMAT=arrow writes uncompressed Arrow IPC files instead, which
+load() memory-maps and reads without copying or decoding.
+
+Usage:
+    python analytics_export.py [dataset ...] [--full]
+"""
+
+import os
+import sys
+import json
+import shutil
+import hashlib
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.ipc as ipc
+import pyarrow.parquet as pq
+from pyarrow.fs import LocalFileSystem
+
+import json_store
+from timestamps import US_PER_SECOND, epoch_of
+
+# -----------------------------
+# CONFIG
+# -----------------------------
+
+EXPORT_DIR = os.getenv("EXPORT_DIR", "analytics")
+EXPORT_FORMAT = os.getenv("EXPORT_FORMAT", "parquet")  # parquet | arrow
+STATE_FILE = os.path.join(EXPORT_DIR, "export_state.json")
+
+PARQUET_COMPRESSION = os.getenv("PARQUET_COMPRESSION", "zstd")
+
+EXTENSIONS = {"parquet": "parquet", "arrow": "arrow"}
+
+# -----------------------------
+# SCHEMAS
+# -----------------------------
+
+NAME = pa.dictionary(pa.int32(), pa.string())
+TIMESTAMP = pa.timestamp("us", tz="UTC")
+
+DATASETS: Dict[str, Dict[str, Any]] = {
+    "commits": {
+        "source": "github_commits_branch_aware.json",
+        "time": "commit_timestamp",
+        "schema": pa.schema(
+            [
+                ("event_type", NAME),
+                ("commit_sha", pa.string()),
+                ("commit_timestamp", TIMESTAMP),
+                ("repo_owner", NAME),
+                ("repo_name", NAME),
+                ("branch", NAME),
+                ("author", NAME),
+                ("author_email", NAME),
+                ("parent_shas", pa.list_(pa.string())),
+                ("ingested_at", TIMESTAMP),
+            ]
+        ),
+    },
+    "deployments": {
+        "source": "github_deployments_multi_repo.json",
+        "time": "deployment_created_at",
+        "schema": pa.schema(
+            [
+                ("event_type", NAME),
+                ("deployment_id", pa.int64()),
+                ("repo_owner", NAME),
+                ("repo_name", NAME),
+                ("environment", NAME),
+                ("ref", NAME),
+                ("commit_sha", pa.string()),
+                ("deployment_created_at", TIMESTAMP),
+                ("status", NAME),
+                ("status_created_at", TIMESTAMP),
+                ("performed_via", NAME),
+                ("creator", NAME),
+                ("source", NAME),
+                ("reconciled", pa.bool_()),
+                ("unlisted", pa.bool_()),
+                ("ingested_at", TIMESTAMP),
+            ]
+        ),
+    },
+    "pr_merged": {
+        "source": "github_pr_merged_events.json",
+        "time": "merged_at",
+        "schema": pa.schema(
+            [
+                ("pr_id", pa.int64()),
+                ("pr_number", pa.int64()),
+                ("source_branch", NAME),
+                ("source_sha", pa.string()),
+                ("target_branch", NAME),
+                ("base_sha", pa.string()),
+                ("merge_type", NAME),
+                ("merge_commit_sha", pa.string()),
+                ("repo_owner", NAME),
+                ("repo_name", NAME),
+                ("created_at", TIMESTAMP),
+                ("updated_at", TIMESTAMP),
+                ("merged_at", TIMESTAMP),
+                ("ingested_at", TIMESTAMP),
+            ]
+        ),
+    },
+    "pr_created": {
+        "source": "incremental_github_pr_created_events.json",
+        "time": "created_at",
+        "schema": pa.schema(
+            [
+                ("pr_id", pa.int64()),
+                ("pr_number", pa.int64()),
+                ("created_at", TIMESTAMP),
+                ("author", NAME),
+                ("base_ref", NAME),
+                ("head_ref", NAME),
+                ("head_sha", pa.string()),
+                ("repo_name", NAME),
+                ("ingested_at", TIMESTAMP),
+            ]
+        ),
+    },
+}
+
+PARTITIONING = ds.partitioning(
+    pa.schema([("repo", pa.string()), ("month", pa.string())]), flavor="hive"
+)
+
+# -----------------------------
+# CONVERSION
+# -----------------------------
+
+
+def to_table(records: Sequence[Dict[str, Any]], schema: pa.Schema) -> pa.Table:
+    """
+    Records as a table of schema; keys outside it are not exported.
+    Timestamp columns come from the records' epoch microsecond columns.
+    """
+    columns = []
+    for field in schema:
+        if field.type == TIMESTAMP:
+            values = [epoch_of(r, field.name) for r in records]
+        else:
+            values = [r.get(field.name) for r in records]
+        columns.append(pa.array(values, type=field.type))
+    return pa.Table.from_arrays(columns, schema=schema)
+
+
+def partition_of(record: Dict[str, Any], time_field: str) -> str:
+    owner = record.get("repo_owner")
+    repo = f"{owner}__{record['repo_name']}" if owner else record["repo_name"]
+
+    # Months in UTC, whatever offset the source string carries.
+    us = epoch_of(record, time_field)
+    month = (
+        datetime.fromtimestamp(us // US_PER_SECOND, timezone.utc).strftime("%Y-%m")
+        if us is not None
+        else "unknown"
+    )
+
+    return os.path.join(f"repo={repo}", f"month={month}")
+
+
+def _digest(records: List[Dict[str, Any]]) -> str:
+    blob = json.dumps(records, sort_keys=True, separators=(",", ":"))
+    return hashlib.blake2b(blob.encode(), digest_size=16).hexdigest()
+
+
+# -----------------------------
+# STATE
+# -----------------------------
+
+
+def _stat(path: str) -> Optional[List[int]]:
+    if not os.path.exists(path):
+        return None
+    st = os.stat(path)
+    return [st.st_size, st.st_mtime_ns]
+
+
+def load_state(path: str = STATE_FILE) -> Dict[str, Any]:
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_state(state: Dict[str, Any], path: str = STATE_FILE) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(state, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+# -----------------------------
+# WRITE
+# -----------------------------
+
+
+def _write_file(table: pa.Table, path: str, fmt: str) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+
+    if fmt == "arrow":
+        with pa.OSFile(tmp_path, "wb") as sink:
+            with ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+    else:
+        pq.write_table(
+            table,
+            tmp_path,
+            compression=PARQUET_COMPRESSION,
+            use_dictionary=True,
+        )
+
+    os.replace(tmp_path, path)
+
+
+def export_dataset(
+    name: str, state: Dict[str, Any], full: bool = False, fmt: str = EXPORT_FORMAT
+) -> Tuple[int, int]:
+    """Bring one dataset up to date. Returns (partitions written, removed)."""
+    spec = DATASETS[name]
+    source = spec["source"]
+    root = os.path.join(EXPORT_DIR, name)
+
+    entry = state.get(name, {})
+    if full or entry.get("format") != fmt:
+        entry = {}
+        shutil.rmtree(root, ignore_errors=True)
+
+    source_stat = _stat(source)
+    if entry and entry.get("source") == source_stat:
+        return 0, 0
+
+    partitions: Dict[str, List[Dict[str, Any]]] = {}
+    for r in json_store.load_records(source):
+        if r.get("repo_name") is None:
+            continue
+        partitions.setdefault(partition_of(r, spec["time"]), []).append(r)
+
+    previous: Dict[str, str] = entry.get("partitions", {})
+    digests: Dict[str, str] = {}
+    written = 0
+    part_name = f"part-0.{EXTENSIONS[fmt]}"
+
+    for part, records in partitions.items():
+        records.sort(key=lambda r: epoch_of(r, spec["time"]) or 0)
+        digests[part] = _digest(records)
+        if previous.get(part) == digests[part]:
+            continue
+        _write_file(to_table(records, spec["schema"]), os.path.join(root, part, part_name), fmt)
+        written += 1
+
+    removed = 0
+    for part in previous.keys() - digests.keys():
+        shutil.rmtree(os.path.join(root, part), ignore_errors=True)
+        removed += 1
+
+    state[name] = {"source": source_stat, "format": fmt, "partitions": digests}
+    return written, removed
+
+
+def export(names: Optional[List[str]] = None, full: bool = False) -> Dict[str, Tuple[int, int]]:
+    state = load_state()
+    results = {}
+
+    for name in names or list(DATASETS):
+        results[name] = export_dataset(name, state, full)
+        save_state(state)
+
+    return results
+
+
+# -----------------------------
+# READ
+# -----------------------------
+
+
+def export_format(name: str) -> str:
+    """The format name was last exported in, which may differ from EXPORT_FORMAT."""
+    return load_state().get(name, {}).get("format", EXPORT_FORMAT)
+
+
+def dataset(name: str, fmt: Optional[str] = None) -> ds.Dataset:
+    """
+    The exported dataset, with repo and month partition columns, read in
+    the format recorded for it in STATE_FILE unless fmt is given. Files are
+    opened memory-mapped: Arrow IPC columns are used in place, Parquet
+    pages are decoded straight from the mapping.
+    """
+    if fmt is None:
+        fmt = export_format(name)
+
+    return ds.dataset(
+        os.path.join(EXPORT_DIR, name),
+        schema=DATASETS[name]["schema"].append(pa.field("repo", pa.string())).append(
+            pa.field("month", pa.string())
+        ),
+        format="ipc" if fmt == "arrow" else "parquet",
+        partitioning=PARTITIONING,
+        filesystem=LocalFileSystem(use_mmap=True),
+    )
+
+
+def load(
+    name: str,
+    columns: Optional[List[str]] = None,
+    repo: Optional[str] = None,
+    months: Optional[List[str]] = None,
+) -> pa.Table:
+    """Read a dataset, pruning partitions by repo (owner__name) and month."""
+    condition = None
+    if repo is not None:
+        condition = ds.field("repo") == repo
+    if months is not None:
+        in_months = ds.field("month").isin(months)
+        condition = in_months if condition is None else condition & in_months
+
+    return dataset(name).to_table(columns=columns, filter=condition)
+
+
+# -----------------------------
+# MAIN
+# -----------------------------
+
+if __name__ == "__main__":
+
+    names = [a for a in sys.argv[1:] if not a.startswith("--")] or None
+    results = export(names, full="--full" in sys.argv)
+
+    print("--------------------------------")
+    for name, (written, removed) in results.items():
+        print(f"{name}: {written} partitions written, {removed} removed")
+    print(f"Dataset directory: {EXPORT_DIR}")
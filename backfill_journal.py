@@ -0,0 +1,86 @@
+"""
+Per-page progress journal for resumable fetches
+
+The ingesters write each fetched page as soon as it is processed instead of
+holding a whole backfill in memory. Their checkpoints are derived from the
+records written, so a fetch that stops half way (crash, rate-limit death)
+would otherwise leave the checkpoint at the newest record and the older
+pages would never be fetched. While a fetch is in progress its journal entry
+holds the lower bound it started from and the page being written; the next
+run resumes from that entry instead of the record checkpoint.
+
+Entries are written before the page's records, so on resume the last page
+is read again. Records are keyed (commit_sha, deployment_id, pr_id) and
+written idempotently, so the overlap is skipped, and new items arriving at
+the head of a listing only push unread items to later pages.
+"""
+
+import os
+import json
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional, Tuple
+
+import json_store
+
+# -----------------------------
+# CONFIG
+# -----------------------------
+
+JOURNAL_FILE = os.getenv("BACKFILL_JOURNAL_FILE", "backfill_journal.json")
+
+# -----------------------------
+# JOURNAL
+# -----------------------------
+
+
+def _load(path: str) -> Dict[str, Dict[str, Any]]:
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _save(entries: Dict[str, Dict[str, Any]], path: str) -> None:
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(entries, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+class Journal:
+    def __init__(self, path: str = JOURNAL_FILE) -> None:
+        self.path = path
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """The open entry for key: {"since", "page", "updated_at"}, or None."""
+        with json_store.locked(self.path):
+            return _load(self.path).get(key)
+
+    def resume(self, key: str, since: Any) -> Tuple[Any, int]:
+        """(since, first page) for a fetch of key, continuing an open entry."""
+        entry = self.get(key)
+        if entry is None:
+            return since, 1
+
+        print(f"  ↳ resuming {key} at page {entry['page']} | since={entry['since']}")
+        return entry["since"], entry["page"]
+
+    def advance(self, key: str, since: Any, page: int) -> None:
+        """Record that page is about to be written; call before writing it."""
+        with json_store.locked(self.path):
+            entries = _load(self.path)
+            entries[key] = {
+                "since": since,
+                "page": page,
+                "updated_at": datetime.now(timezone.utc).isoformat(),
+            }
+            _save(entries, self.path)
+
+    def finish(self, key: str) -> None:
+        with json_store.locked(self.path):
+            entries = _load(self.path)
+            if entries.pop(key, None) is not None:
+                _save(entries, self.path)
+
+
+journal = Journal()
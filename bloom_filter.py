@@ -0,0 +1,154 @@
+"""
+Persisted scalable Bloom filter for dedup pre-checks
+
+Most dedup lookups are for keys that are genuinely new. A Bloom filter
+answers "definitely not seen" for those from memory, so the exact lookup
+(the memory-mapped key index, or a database round trip) is only paid for
+keys the filter has probably seen.
+
+ScalableBloomFilter grows as keys are added instead of being sized for the
+final count up front: once a layer holds its capacity a new layer with
+twice the capacity and a tighter error rate is started, which keeps the
+overall false-positive rate under the configured one.
+"""
+
+import os
+import math
+import struct
+import hashlib
+from typing import Iterable, List
+
+# -----------------------------
+# CONFIG
+# -----------------------------
+
+BLOOM_FP_RATE = float(os.getenv("BLOOM_FP_RATE", "0.01"))
+BLOOM_INITIAL_CAPACITY = int(os.getenv("BLOOM_INITIAL_CAPACITY", "65536"))
+
+GROWTH = 2
+TIGHTENING = 0.5
+
+MAGIC = b"BLM1"
+FILE_HEADER = struct.Struct("<4sdI")  # magic, fp rate, layer count
+LAYER_HEADER = struct.Struct("<QQQI")  # capacity, count, bits, hashes
+
+# -----------------------------
+# FILTER
+# -----------------------------
+
+
+class BloomFilter:
+    def __init__(self, capacity: int, fp_rate: float) -> None:
+        self.capacity = capacity
+        self.count = 0
+        self.bits = max(8, math.ceil(-capacity * math.log(fp_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.bits / capacity * math.log(2)))
+        self.array = bytearray((self.bits + 7) // 8)
+
+    def _positions(self, key: bytes) -> Iterable[int]:
+        # Double hashing: k positions from two 64-bit halves of one digest.
+        digest = hashlib.blake2b(key, digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return ((h1 + i * h2) % self.bits for i in range(self.hashes))
+
+    def add(self, key: bytes) -> bool:
+        """Set key's bits; False if they were all set already."""
+        added = False
+        for pos in self._positions(key):
+            byte, bit = divmod(pos, 8)
+            if not self.array[byte] & (1 << bit):
+                self.array[byte] |= 1 << bit
+                added = True
+        if added:
+            self.count += 1
+        return added
+
+    def __contains__(self, key: bytes) -> bool:
+        return all(
+            self.array[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(key)
+        )
+
+
+class ScalableBloomFilter:
+    def __init__(
+        self,
+        fp_rate: float = BLOOM_FP_RATE,
+        initial_capacity: int = BLOOM_INITIAL_CAPACITY,
+    ) -> None:
+        self.fp_rate = fp_rate
+        self.initial_capacity = initial_capacity
+        self.layers: List[BloomFilter] = []
+
+    def _layer_for_add(self) -> BloomFilter:
+        if not self.layers or self.layers[-1].count >= self.layers[-1].capacity:
+            n = len(self.layers)
+            # Error rates fp * (1 - r) * r^i sum to at most fp.
+            self.layers.append(
+                BloomFilter(
+                    self.initial_capacity * GROWTH**n,
+                    self.fp_rate * (1 - TIGHTENING) * TIGHTENING**n,
+                )
+            )
+        return self.layers[-1]
+
+    def __contains__(self, key: bytes) -> bool:
+        return any(key in layer for layer in self.layers)
+
+    def add(self, key: bytes) -> None:
+        if key not in self:
+            self._layer_for_add().add(key)
+
+    def update(self, keys: Iterable[bytes]) -> None:
+        for key in keys:
+            self.add(key)
+
+    def __len__(self) -> int:
+        return sum(layer.count for layer in self.layers)
+
+    # -----------------------------
+    # PERSISTENCE
+    # -----------------------------
+
+    def save(self, path: str) -> None:
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(FILE_HEADER.pack(MAGIC, self.fp_rate, len(self.layers)))
+            for layer in self.layers:
+                f.write(
+                    LAYER_HEADER.pack(
+                        layer.capacity, layer.count, layer.bits, layer.hashes
+                    )
+                )
+                f.write(layer.array)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(
+        cls,
+        path: str,
+        fp_rate: float = BLOOM_FP_RATE,
+        initial_capacity: int = BLOOM_INITIAL_CAPACITY,
+    ) -> "ScalableBloomFilter":
+        """The filter saved at path, or an empty one when there is none."""
+        bloom = cls(fp_rate, initial_capacity)
+        if not os.path.exists(path):
+            return bloom
+
+        with open(path, "rb") as f:
+            magic, saved_rate, n_layers = FILE_HEADER.unpack(f.read(FILE_HEADER.size))
+            if magic != MAGIC:
+                raise ValueError(f"Not a Bloom filter file: {path}")
+
+            bloom.fp_rate = saved_rate
+            for _ in range(n_layers):
+                capacity, count, bits, hashes = LAYER_HEADER.unpack(
+                    f.read(LAYER_HEADER.size)
+                )
+                layer = BloomFilter.__new__(BloomFilter)
+                layer.capacity, layer.count = capacity, count
+                layer.bits, layer.hashes = bits, hashes
+                layer.array = bytearray(f.read((bits + 7) // 8))
+                bloom.layers.append(layer)
+
+        return bloom
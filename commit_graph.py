@@ -0,0 +1,351 @@
+"""
+Compact per-repo commit DAG with generation numbers
+
+Commits are mapped to dense integer ids. Parent links live in flat arrays
+(first parent per node, plus a side table for merge commits), and every
+node carries a generation number (1 + max parent generation) used to prune
+ancestor walks. The graph is updated incrementally as commits are ingested
+and persisted to one small binary file per repository (owner/name.bin).
+
+Parents may arrive after their children (the commits API pages newest
+first); such parents exist as placeholder nodes until their own parents are
+known, and generations are recomputed lazily when that happens.
+"""
+
+import os
+import heapq
+import struct
+from array import array
+from collections import defaultdict
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import json_store
+
+# -----------------------------
+# CONFIG
+# -----------------------------
+
+GRAPH_DIR = "commit_graphs"
+
+# Owner of records written before they carried one.
+REPO_OWNER = "hrishi-york"
+
+MAGIC = b"CGR1"
+NO_PARENT = -1
+
+# Paint flags for range walks
+_HEAD = 1
+_BASE = 2
+
+# -----------------------------
+# GRAPH
+# -----------------------------
+
+
+class CommitGraph:
+    def __init__(self) -> None:
+        self._ids: Dict[str, int] = {}
+        self._shas: List[str] = []
+        self._first_parent = array("q")
+        self._extra_parents: Dict[int, array] = {}
+        self._known = bytearray()
+        self._generation = array("q")
+        self._dirty = False
+
+    def __len__(self) -> int:
+        return len(self._shas)
+
+    def __contains__(self, sha: str) -> bool:
+        node = self._ids.get(sha)
+        return node is not None and bool(self._known[node])
+
+    # -----------------------------
+    # UPDATES
+    # -----------------------------
+
+    def _node(self, sha: str) -> int:
+        node = self._ids.get(sha)
+        if node is None:
+            node = len(self._shas)
+            self._ids[sha] = node
+            self._shas.append(sha)
+            self._first_parent.append(NO_PARENT)
+            self._known.append(0)
+            self._generation.append(1)
+        return node
+
+    def parents(self, node: int) -> Sequence[int]:
+        first = self._first_parent[node]
+        if first == NO_PARENT:
+            return ()
+        extra = self._extra_parents.get(node)
+        return (first, *extra) if extra is not None else (first,)
+
+    def add_commit(self, sha: str, parent_shas: Sequence[str]) -> None:
+        placeholder = sha in self._ids
+        node = self._node(sha)
+        if self._known[node]:
+            return
+
+        parents = [self._node(p) for p in parent_shas]
+        self._known[node] = 1
+
+        if parents:
+            self._first_parent[node] = parents[0]
+            if len(parents) > 1:
+                self._extra_parents[node] = array("q", parents[1:])
+
+        # A placeholder that already has children gains ancestors, so every
+        # generation above it may shift: recompute on the next query.
+        generation = 1 + max((self._generation[p] for p in parents), default=0)
+        if placeholder and generation != self._generation[node]:
+            self._dirty = True
+        self._generation[node] = generation
+
+    def add_commits(self, commits: Iterable[Tuple[str, Sequence[str]]]) -> None:
+        for sha, parent_shas in commits:
+            self.add_commit(sha, parent_shas)
+
+    def _refresh_generations(self) -> None:
+        if not self._dirty:
+            return
+
+        n = len(self._shas)
+        generation = array("q", bytes(8 * n))
+
+        for root in range(n):
+            if generation[root]:
+                continue
+
+            # Iterative post-order so deep linear histories do not recurse.
+            stack = [root]
+            while stack:
+                node = stack[-1]
+                pending = [p for p in self.parents(node) if not generation[p]]
+                if pending:
+                    stack.extend(pending)
+                    continue
+                stack.pop()
+                if not generation[node]:
+                    generation[node] = 1 + max(
+                        (generation[p] for p in self.parents(node)), default=0
+                    )
+
+        self._generation = generation
+        self._dirty = False
+
+    def commits(self) -> Iterator[Tuple[str, List[str]]]:
+        """Known commits and their parents, oldest generation first."""
+        self._refresh_generations()
+        nodes = sorted(
+            (n for n in range(len(self._shas)) if self._known[n]),
+            key=self._generation.__getitem__,
+        )
+        for node in nodes:
+            yield self._shas[node], [self._shas[p] for p in self.parents(node)]
+
+    # -----------------------------
+    # QUERIES
+    # -----------------------------
+
+    def is_ancestor(self, ancestor_sha: str, sha: str) -> bool:
+        """True when ancestor_sha is reachable from sha (a commit is its own ancestor)."""
+        target = self._ids.get(ancestor_sha)
+        start = self._ids.get(sha)
+        if target is None or start is None:
+            return False
+        if target == start:
+            return True
+
+        self._refresh_generations()
+        floor = self._generation[target]
+
+        seen = {start}
+        stack = [start]
+        while stack:
+            for p in self.parents(stack.pop()):
+                if p == target:
+                    return True
+                # Everything below the target's generation cannot reach it.
+                if p not in seen and self._generation[p] > floor:
+                    seen.add(p)
+                    stack.append(p)
+
+        return False
+
+    def range(self, base_sha: Optional[str], head_sha: str) -> List[str]:
+        """
+        Commits reachable from head_sha but not from base_sha (git log
+        base..head), newest generation first. Walks stop as soon as every
+        open branch of the head walk is known to be reachable from base.
+        """
+        head = self._ids.get(head_sha)
+        if head is None:
+            return []
+
+        self._refresh_generations()
+
+        flags: Dict[int, int] = {head: _HEAD}
+        heap = [(-self._generation[head], head)]
+        head_only = {head}
+
+        base = self._ids.get(base_sha) if base_sha else None
+        if base is not None:
+            flags[base] = flags.get(base, 0) | _BASE
+            heapq.heappush(heap, (-self._generation[base], base))
+            head_only.discard(base)
+
+        processed: Dict[int, int] = {}
+        result: List[str] = []
+
+        while heap and head_only:
+            _, node = heapq.heappop(heap)
+            flag = flags[node]
+            if processed.get(node) == flag:
+                continue
+            processed[node] = flag
+            head_only.discard(node)
+
+            if flag == _HEAD:
+                result.append(self._shas[node])
+
+            for p in self.parents(node):
+                merged = flags.get(p, 0) | flag
+                if merged == flags.get(p):
+                    continue
+                flags[p] = merged
+                heapq.heappush(heap, (-self._generation[p], p))
+                if merged == _HEAD:
+                    head_only.add(p)
+                else:
+                    head_only.discard(p)
+
+        return result
+
+    # -----------------------------
+    # PERSISTENCE
+    # -----------------------------
+
+    def save(self, path: str) -> None:
+        n = len(self._shas)
+        extra_pairs = array("q")
+        for node, parents in self._extra_parents.items():
+            for p in parents:
+                extra_pairs.extend((node, p))
+
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(MAGIC)
+            f.write(struct.pack("<QQ", n, len(extra_pairs) // 2))
+            f.write(b"".join(bytes.fromhex(sha) for sha in self._shas))
+            f.write(self._first_parent.tobytes())
+            f.write(bytes(self._known))
+            f.write(extra_pairs.tobytes())
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "CommitGraph":
+        graph = cls()
+        if not os.path.exists(path):
+            return graph
+
+        with open(path, "rb") as f:
+            if f.read(4) != MAGIC:
+                raise ValueError(f"Not a commit graph file: {path}")
+
+            n, n_extra = struct.unpack("<QQ", f.read(16))
+            raw_shas = f.read(20 * n)
+            graph._shas = [raw_shas[i : i + 20].hex() for i in range(0, 20 * n, 20)]
+            graph._ids = {sha: i for i, sha in enumerate(graph._shas)}
+            graph._first_parent.frombytes(f.read(8 * n))
+            graph._known = bytearray(f.read(n))
+
+            extra_pairs = array("q")
+            extra_pairs.frombytes(f.read(16 * n_extra))
+            for i in range(0, len(extra_pairs), 2):
+                graph._extra_parents.setdefault(extra_pairs[i], array("q")).append(
+                    extra_pairs[i + 1]
+                )
+
+        graph._generation = array("q", bytes(8 * n))
+        graph._dirty = True
+        return graph
+
+
+# -----------------------------
+# PER-REPO STORE
+# -----------------------------
+
+Repo = Tuple[str, str]
+
+
+def graph_path(owner: str, repo_name: str) -> str:
+    return os.path.join(GRAPH_DIR, owner, f"{repo_name}.bin")
+
+
+def _legacy_path(repo_name: str) -> str:
+    # Graphs were first keyed by name alone, all for the default owner.
+    return os.path.join(GRAPH_DIR, f"{repo_name}.bin")
+
+
+def load_graph(owner: str, repo_name: str) -> CommitGraph:
+    path = graph_path(owner, repo_name)
+    if not os.path.exists(path) and owner == REPO_OWNER:
+        path = _legacy_path(repo_name)
+    return CommitGraph.load(path)
+
+
+def has_graph(owner: str, repo_name: str) -> bool:
+    return os.path.exists(graph_path(owner, repo_name)) or (
+        owner == REPO_OWNER and os.path.exists(_legacy_path(repo_name))
+    )
+
+
+class GraphUpdates:
+    """
+    Commits of one run folded into in-memory graphs per repo and written
+    once by save(): under each graph file's lock, the stored graph is
+    reloaded and the run's commits added to it, so concurrent ingesters
+    keep each other's edges.
+    """
+
+    def __init__(self) -> None:
+        self.graphs: Dict[Repo, CommitGraph] = defaultdict(CommitGraph)
+
+    def add(self, records: Iterable[Dict]) -> None:
+        by_repo: Dict[Repo, List[Tuple[str, Sequence[str]]]] = defaultdict(list)
+        for r in records:
+            if "parent_shas" in r:
+                repo = (r.get("repo_owner", REPO_OWNER), r["repo_name"])
+                by_repo[repo].append((r["commit_sha"], r["parent_shas"]))
+
+        for repo, commits in by_repo.items():
+            # Oldest first keeps placeholders (and generation refreshes) rare.
+            self.graphs[repo].add_commits(reversed(commits))
+
+    def save(self) -> Dict[Repo, int]:
+        """Merge into the stored graphs. Returns the node count per repo."""
+        sizes = {}
+
+        for (owner, repo_name), pending in self.graphs.items():
+            path = graph_path(owner, repo_name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+
+            with json_store.locked(path):
+                graph = load_graph(owner, repo_name)
+                graph.add_commits(pending.commits())
+                graph.save(path)
+            sizes[(owner, repo_name)] = len(graph)
+
+        self.graphs.clear()
+        return sizes
+
+
+def update_from_records(records: Iterable[Dict]) -> Dict[Repo, int]:
+    """
+    Fold commit records carrying parent_shas into their repos' graphs.
+    Returns the node count per updated repo.
+    """
+    updates = GraphUpdates()
+    updates.add(records)
+    return updates.save()
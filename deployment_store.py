@@ -0,0 +1,192 @@
+"""
+Deployment records keyed by deployment_id, merged in place
+
+Shared by the deployment webhook receiver (push) and the incremental
+deployment ingester (pull) so both converge on one record per deployment
+holding its latest known status.
+"""
+
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+import json_store
+import dora_rollups
+from timestamps import base_field, epoch_of, normalize
+
+# -----------------------------
+# CONFIG
+# -----------------------------
+
+OUTPUT_FILE = "github_deployments_multi_repo.json"
+EVENT_LOG_FILE = "github_deployment_events.ndjson"
+
+# States after which GitHub does not move a deployment on by itself, so the
+# poller does not need to re-request its statuses.
+TERMINAL_STATES = {"success", "failure", "error", "inactive"}
+
+# States whose status list never changes again, so it can be cached for
+# good. A successful deployment still turns inactive later, and a failed
+# one can be re-run and post in_progress / success.
+FINAL_STATES = {"inactive"}
+
+STATUS_FIELDS = ("status", "status_created_at")
+
+# What DORA metrics and lead time need from the deployment itself.
+DEPLOYMENT_FIELDS = ("commit_sha", "ref", "deployment_created_at", "environment")
+
+# -----------------------------
+# FILE HELPERS
+# -----------------------------
+
+
+def load_records(path: str = OUTPUT_FILE) -> List[Dict[str, Any]]:
+    return json_store.load_records(path)
+
+
+def append_event_log(events: List[Dict[str, Any]], path: str = EVENT_LOG_FILE) -> None:
+    with open(path, "a", encoding="utf-8") as f:
+        f.writelines(json_store.dumps(e) + "\n" for e in events)
+
+
+# -----------------------------
+# MERGE
+# -----------------------------
+
+
+def is_terminal(record: Optional[Dict[str, Any]]) -> bool:
+    return bool(record) and record.get("status") in TERMINAL_STATES
+
+
+def is_complete(record: Optional[Dict[str, Any]]) -> bool:
+    return bool(record) and all(record.get(f) for f in DEPLOYMENT_FIELDS)
+
+
+def statuses_are_final(statuses: List[Dict[str, Any]]) -> bool:
+    # Newest first, as the statuses endpoint lists them.
+    return bool(statuses) and statuses[0].get("state") in FINAL_STATES
+
+
+def _status_is_newer(incoming: Dict[str, Any], current: Dict[str, Any]) -> bool:
+    if incoming.get("status") is None:
+        return False
+    current_at = epoch_of(current, "status_created_at")
+    if current_at is None:
+        return True
+    incoming_at = epoch_of(incoming, "status_created_at")
+    return incoming_at is not None and incoming_at >= current_at
+
+
+def merge_into(
+    records: List[Dict[str, Any]],
+    updates: List[Dict[str, Any]],
+    by_id: Optional[Dict[int, Dict[str, Any]]] = None,
+) -> int:
+    """
+    Merge updates into records by deployment_id. Non-null fields overwrite,
+    except status fields which only move forward in time. Updates get their
+    epoch timestamp columns here. by_id, an index of records kept by the
+    caller, is used and updated instead of being built. Returns the number
+    of records appended.
+    """
+    if by_id is None:
+        by_id = {r["deployment_id"]: r for r in records}
+    appended = 0
+
+    for update in updates:
+        normalize(update)
+        current = by_id.get(update["deployment_id"])
+
+        if current is None:
+            record = dict(update)
+            records.append(record)
+            by_id[record["deployment_id"]] = record
+            appended += 1
+            continue
+
+        newer_status = _status_is_newer(update, current)
+
+        for key, value in update.items():
+            field = base_field(key)
+            if value is None:
+                continue
+            if field in STATUS_FIELDS and not newer_status:
+                continue
+            if key == "source" and current.get("source") != "webhook":
+                continue
+            if field == "ingested_at" and current.get("ingested_at"):
+                continue
+            current[key] = value
+
+    return appended
+
+
+def merge_records(updates: List[Dict[str, Any]], path: str = OUTPUT_FILE) -> int:
+    touched_ids = {u["deployment_id"] for u in updates}
+
+    with json_store.locked(path):
+        records = json_store.load_records(path)
+        appended = merge_into(records, updates)
+        json_store.save_records(records, path)
+
+    # Only the merged records, so rollups stay O(new events) per call.
+    dora_rollups.update([r for r in records if r["deployment_id"] in touched_ids])
+    return appended
+
+
+# -----------------------------
+# WEBHOOK NORMALIZATION
+# -----------------------------
+
+
+def _split_repo(full_name: str) -> tuple:
+    owner, _, name = full_name.partition("/")
+    return owner, name
+
+
+def from_deployment_event(event: Dict[str, Any]) -> Dict[str, Any]:
+    owner, name = _split_repo(event["repo"])
+
+    return {
+        "event_type": "deployment",
+        "deployment_id": event["deployment_id"],
+        "repo_owner": owner,
+        "repo_name": name,
+        "environment": event["environment"],
+        "ref": event["ref"],
+        "commit_sha": event["sha"],
+        "deployment_created_at": event["created_at"],
+        "status": None,
+        "status_created_at": None,
+        "creator": event["creator"],
+        "source": "webhook",
+        "ingested_at": datetime.now(timezone.utc).isoformat(),
+    }
+
+
+def from_deployment_status_event(event: Dict[str, Any]) -> Dict[str, Any]:
+    owner, name = _split_repo(event["repo"])
+
+    return {
+        "event_type": "deployment",
+        "deployment_id": event["deployment_id"],
+        "repo_owner": owner,
+        "repo_name": name,
+        "environment": event["environment"],
+        "ref": event["ref"],
+        "commit_sha": event["sha"],
+        "deployment_created_at": event["deployment_created_at"],
+        "status": event["state"],
+        "status_created_at": event["created_at"],
+        "source": "webhook",
+        "ingested_at": datetime.now(timezone.utc).isoformat(),
+    }
+
+
+def persist_webhook_event(event: Dict[str, Any]) -> None:
+    if event["event_type"] == "deployment":
+        update = from_deployment_event(event)
+    else:
+        update = from_deployment_status_event(event)
+
+    append_event_log([event])
+    merge_records([update])
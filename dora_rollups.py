@@ -0,0 +1,416 @@
+"""
+Incrementally maintained DORA rollups per repo / environment
+
+Daily and ISO-weekly buckets of deployment counts, change failure rate and
+time to restore, kept in SQLite (STATE_FILE). update() folds only the
+deployment records it is given (the ones an ingester just appended or
+changed): already folded ids are skipped by primary key, and only the
+buckets the new deployments fall in are written. Each stream (repo,
+environment) keeps a watermark, the newest deployment folded into it. A
+deployment older than its stream's watermark (a late webhook, a backfilled
+page) re-folds that stream from the start of the deployment's week, so
+open failures and restore times are computed in deployment order.
+
+Every contribution of a deployment, restores included, goes to the buckets
+of its deployment_created_at. rebuild() exists for a full recompute.
+"""
+
+import sys
+import sqlite3
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import json_store
+from timestamps import US_PER_SECOND, epoch_of
+
+# -----------------------------
+# CONFIG
+# -----------------------------
+
+STATE_FILE = "dora_rollups.sqlite"
+DEPLOYMENTS_FILE = "github_deployments_multi_repo.json"
+
+# "inactive" is a formerly successful deployment superseded by a newer one.
+SUCCESS_STATES = {"success", "inactive"}
+FAILURE_STATES = {"failure", "error"}
+
+PERIODS = ("daily", "weekly")
+COUNTERS = ("deployments", "successes", "failures", "restores", "restore_seconds")
+
+# (created_us, status_us, failed), in deployment order
+Event = Tuple[int, int, bool]
+
+# -----------------------------
+# STATE
+# -----------------------------
+
+
+def connect(path: str = STATE_FILE) -> sqlite3.Connection:
+    con = sqlite3.connect(path, timeout=30, isolation_level=None)
+    con.execute("PRAGMA journal_mode = WAL")
+    con.executescript(
+        """
+        CREATE TABLE IF NOT EXISTS folded (
+            deployment_id INTEGER PRIMARY KEY,
+            repo_name TEXT NOT NULL,
+            environment TEXT NOT NULL,
+            created_us INTEGER NOT NULL,
+            status_us INTEGER NOT NULL,
+            failed INTEGER NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS folded_stream
+            ON folded (repo_name, environment, created_us);
+
+        CREATE TABLE IF NOT EXISTS streams (
+            repo_name TEXT NOT NULL,
+            environment TEXT NOT NULL,
+            watermark INTEGER NOT NULL,
+            open_failure_us INTEGER,
+            PRIMARY KEY (repo_name, environment)
+        );
+
+        CREATE TABLE IF NOT EXISTS buckets (
+            period TEXT NOT NULL,
+            repo_name TEXT NOT NULL,
+            environment TEXT NOT NULL,
+            start TEXT NOT NULL,
+            start_us INTEGER NOT NULL,
+            deployments INTEGER NOT NULL DEFAULT 0,
+            successes INTEGER NOT NULL DEFAULT 0,
+            failures INTEGER NOT NULL DEFAULT 0,
+            restores INTEGER NOT NULL DEFAULT 0,
+            restore_seconds REAL NOT NULL DEFAULT 0,
+            PRIMARY KEY (period, repo_name, environment, start)
+        );
+        """
+    )
+    return con
+
+
+# -----------------------------
+# FOLDING
+# -----------------------------
+
+
+def _us(dt: datetime) -> int:
+    return int(dt.timestamp()) * US_PER_SECOND
+
+
+def bucket_starts(created_us: int) -> Dict[str, Tuple[str, int]]:
+    """Label and start (epoch us) of the daily and weekly bucket of a time."""
+    when = datetime.fromtimestamp(created_us // US_PER_SECOND, timezone.utc)
+    day = when.replace(hour=0, minute=0, second=0, microsecond=0)
+    monday = day - timedelta(days=day.weekday())
+    year, week, _ = when.isocalendar()
+    return {
+        "daily": (day.date().isoformat(), _us(day)),
+        "weekly": (f"{year}-W{week:02d}", _us(monday)),
+    }
+
+
+def fold_events(
+    events: Iterable[Event], open_failure_us: Optional[int] = None
+) -> Tuple[Dict[Tuple[str, str, int], Dict[str, float]], Optional[int]]:
+    """
+    Fold one stream's events, in deployment order, starting from its open
+    failure (if any). Returns the bucket increments keyed by (period, label,
+    start_us) and the failure still open afterwards.
+    """
+    buckets: Dict[Tuple[str, str, int], Dict[str, float]] = {}
+
+    def bump(created_us: int, field: str, amount: float = 1) -> None:
+        for period, (label, start_us) in bucket_starts(created_us).items():
+            bucket = buckets.setdefault(
+                (period, label, start_us), dict.fromkeys(COUNTERS, 0)
+            )
+            bucket[field] += amount
+
+    for created_us, status_us, failed in events:
+        bump(created_us, "deployments")
+
+        if failed:
+            bump(created_us, "failures")
+            # Restore time runs from the first failure of an outage.
+            if open_failure_us is None:
+                open_failure_us = status_us
+            continue
+
+        bump(created_us, "successes")
+
+        if open_failure_us is not None:
+            bump(created_us, "restores")
+            bump(
+                created_us,
+                "restore_seconds",
+                max(0, status_us - open_failure_us) / US_PER_SECOND,
+            )
+            open_failure_us = None
+
+    return buckets, open_failure_us
+
+
+def _write_buckets(
+    con: sqlite3.Connection,
+    repo: str,
+    environment: str,
+    buckets: Dict[Tuple[str, str, int], Dict[str, float]],
+) -> None:
+    con.executemany(
+        """
+        INSERT INTO buckets (period, repo_name, environment, start, start_us,
+                             deployments, successes, failures, restores, restore_seconds)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT (period, repo_name, environment, start) DO UPDATE SET
+            deployments = deployments + excluded.deployments,
+            successes = successes + excluded.successes,
+            failures = failures + excluded.failures,
+            restores = restores + excluded.restores,
+            restore_seconds = restore_seconds + excluded.restore_seconds
+        """,
+        [
+            (period, repo, environment, label, start_us, *(b[c] for c in COUNTERS))
+            for (period, label, start_us), b in buckets.items()
+        ],
+    )
+
+
+def _open_failure_before(
+    con: sqlite3.Connection, repo: str, environment: str, start_us: int
+) -> Optional[int]:
+    """The failure still open at start_us: the first since the last success."""
+    stream = (repo, environment, start_us)
+
+    last_success = con.execute(
+        """
+        SELECT created_us, deployment_id FROM folded
+        WHERE repo_name = ? AND environment = ? AND created_us < ? AND NOT failed
+        ORDER BY created_us DESC, deployment_id DESC LIMIT 1
+        """,
+        stream,
+    ).fetchone() or (-1, -1)
+
+    row = con.execute(
+        """
+        SELECT status_us FROM folded
+        WHERE repo_name = ? AND environment = ? AND created_us < ? AND failed
+          AND (created_us, deployment_id) > (?, ?)
+        ORDER BY created_us, deployment_id LIMIT 1
+        """,
+        (*stream, *last_success),
+    ).fetchone()
+
+    return row[0] if row else None
+
+
+def _refold(con: sqlite3.Connection, repo: str, environment: str, since_us: int) -> None:
+    """Recompute a stream's buckets from the week containing since_us on."""
+    start_us = bucket_starts(since_us)["weekly"][1]
+    open_failure_us = _open_failure_before(con, repo, environment, start_us)
+
+    con.execute(
+        "DELETE FROM buckets WHERE repo_name = ? AND environment = ? AND start_us >= ?",
+        (repo, environment, start_us),
+    )
+    events = [
+        (created_us, status_us, bool(failed))
+        for created_us, status_us, failed in con.execute(
+            """
+            SELECT created_us, status_us, failed FROM folded
+            WHERE repo_name = ? AND environment = ? AND created_us >= ?
+            ORDER BY created_us, deployment_id
+            """,
+            (repo, environment, start_us),
+        )
+    ]
+
+    buckets, open_failure_us = fold_events(events, open_failure_us)
+    _write_buckets(con, repo, environment, buckets)
+    _save_stream(con, repo, environment, events[-1][0], open_failure_us)
+
+
+def _save_stream(
+    con: sqlite3.Connection,
+    repo: str,
+    environment: str,
+    watermark: int,
+    open_failure_us: Optional[int],
+) -> None:
+    con.execute(
+        """
+        INSERT INTO streams (repo_name, environment, watermark, open_failure_us)
+        VALUES (?, ?, ?, ?)
+        ON CONFLICT (repo_name, environment) DO UPDATE SET
+            watermark = max(watermark, excluded.watermark),
+            open_failure_us = excluded.open_failure_us
+        """,
+        (repo, environment, watermark, open_failure_us),
+    )
+
+
+def fold_records(con: sqlite3.Connection, records: Iterable[Dict[str, Any]]) -> int:
+    """
+    Fold terminal deployments not seen before. Deployments still pending are
+    skipped and picked up by a later call once their final status arrives.
+    """
+    streams: Dict[Tuple[str, str], List[Tuple[int, int, int, bool]]] = {}
+
+    for r in records:
+        if not r.get("deployment_created_at"):
+            continue
+        if r.get("status") not in SUCCESS_STATES | FAILURE_STATES:
+            continue
+
+        created_us = epoch_of(r, "deployment_created_at")
+        # An inactive deployment's status time is when it was superseded,
+        # not when it succeeded.
+        if r["status"] == "inactive":
+            status_us = created_us
+        else:
+            status_us = epoch_of(r, "status_created_at") or created_us
+        failed = r["status"] in FAILURE_STATES
+        environment = r.get("environment") or "unknown"
+
+        inserted = con.execute(
+            "INSERT OR IGNORE INTO folded VALUES (?, ?, ?, ?, ?, ?)",
+            (r["deployment_id"], r["repo_name"], environment, created_us, status_us, failed),
+        ).rowcount
+        if inserted:
+            streams.setdefault((r["repo_name"], environment), []).append(
+                (created_us, r["deployment_id"], status_us, failed)
+            )
+
+    for (repo, environment), new in streams.items():
+        new.sort()
+        current = con.execute(
+            "SELECT watermark, open_failure_us FROM streams WHERE repo_name = ? AND environment = ?",
+            (repo, environment),
+        ).fetchone()
+
+        if current is not None and new[0][0] < current[0]:
+            # Out of order: earlier folds saw the wrong open failure.
+            _refold(con, repo, environment, new[0][0])
+            continue
+
+        open_failure_us = current[1] if current else None
+        buckets, open_failure_us = fold_events(
+            [(created_us, status_us, failed) for created_us, _, status_us, failed in new],
+            open_failure_us,
+        )
+        _write_buckets(con, repo, environment, buckets)
+        _save_stream(con, repo, environment, new[-1][0], open_failure_us)
+
+    return sum(len(new) for new in streams.values())
+
+
+def update(records: Sequence[Dict[str, Any]], path: str = STATE_FILE) -> int:
+    if not records:
+        return 0
+
+    con = connect(path)
+    try:
+        # Receiver and pollers fold concurrently from separate processes.
+        con.execute("BEGIN IMMEDIATE")
+        folded = fold_records(con, records)
+        con.execute("COMMIT")
+        return folded
+    except BaseException:
+        if con.in_transaction:
+            con.execute("ROLLBACK")
+        raise
+    finally:
+        con.close()
+
+
+def rebuild(records: Sequence[Dict[str, Any]], path: str = STATE_FILE) -> int:
+    con = connect(path)
+    try:
+        con.execute("BEGIN IMMEDIATE")
+        for table in ("folded", "streams", "buckets"):
+            con.execute(f"DELETE FROM {table}")
+        folded = fold_records(con, records)
+        con.execute("COMMIT")
+        return folded
+    except BaseException:
+        if con.in_transaction:
+            con.execute("ROLLBACK")
+        raise
+    finally:
+        con.close()
+
+
+# -----------------------------
+# QUERIES
+# -----------------------------
+
+
+def rollups(
+    period: str = "weekly",
+    repo: Optional[str] = None,
+    environment: Optional[str] = None,
+    path: str = STATE_FILE,
+) -> List[Dict[str, Any]]:
+    if period not in PERIODS:
+        raise ValueError(f"period must be one of {PERIODS}")
+
+    sql = f"SELECT repo_name, environment, start, {', '.join(COUNTERS)} FROM buckets WHERE period = ?"
+    params: List[Any] = [period]
+    if repo:
+        sql += " AND repo_name = ?"
+        params.append(repo)
+    if environment:
+        sql += " AND environment = ?"
+        params.append(environment)
+    sql += " ORDER BY repo_name, environment, start_us"
+
+    con = connect(path)
+    try:
+        rows = con.execute(sql, params).fetchall()
+    finally:
+        con.close()
+
+    results = []
+    for bucket_repo, bucket_env, bucket_start, *counters in rows:
+        bucket = dict(zip(COUNTERS, counters))
+        finished = bucket["successes"] + bucket["failures"]
+        results.append(
+            {
+                "repo_name": bucket_repo,
+                "environment": bucket_env,
+                "period": bucket_start,
+                **bucket,
+                "change_failure_rate": (
+                    bucket["failures"] / finished if finished else None
+                ),
+                "mttr_seconds": (
+                    bucket["restore_seconds"] / bucket["restores"]
+                    if bucket["restores"]
+                    else None
+                ),
+            }
+        )
+
+    return results
+
+
+# -----------------------------
+# MAIN
+# -----------------------------
+
+if __name__ == "__main__":
+
+    if "--rebuild" in sys.argv:
+        count = rebuild(json_store.load_records(DEPLOYMENTS_FILE))
+        print(f"Rebuilt rollups from {count} deployments")
+
+    period = "daily" if "--daily" in sys.argv else "weekly"
+
+    print("-----------------------------------")
+    for row in rollups(period):
+        cfr = row["change_failure_rate"]
+        mttr = row["mttr_seconds"]
+        print(
+            f"{row['repo_name']:<24} {row['environment']:<16} {row['period']:<12} "
+            f"deploys={row['deployments']:<4} "
+            f"cfr={'-' if cfr is None else f'{cfr:.0%}':<5} "
+            f"mttr={'-' if mttr is None else f'{mttr / 3600:.1f}h'}"
+        )
@@ -0,0 +1,287 @@
+"""
+Ad-hoc SQL over the ingested event stores with embedded DuckDB
+
+Every store is a view in an in-memory DuckDB database:
+
+    commits            github_commits_branch_aware.json
+    deployments        github_deployments_multi_repo.json
+    pr_merged          github_pr_merged_events.json
+    pr_created         incremental_github_pr_created_events.json
+    commit_events      github_commit_events.ndjson (push webhook log)
+    deployment_events  github_deployment_events.ndjson (deployment webhook log)
+
+A view reads the Parquet export (analytics_export.py) instead of the JSON
+file when the export is current. Filters on repo and month then prune whole
+partitions, and other predicates are pushed into the Parquet scan. DuckDB
+runs queries vectorized on QUERY_THREADS threads. Nothing is downloaded:
+extension autoloading is off, and the JSON and Parquet readers are built in.
+
+Usage:
+    python event_queries.py "SELECT environment, count(*) FROM deployments GROUP BY 1"
+    python event_queries.py --dora deployments_per_week
+    python event_queries.py --list
+"""
+
+import os
+import sys
+import json
+from typing import Any, Dict, List, Optional, Sequence
+
+import duckdb
+
+import analytics_export
+
+# -----------------------------
+# CONFIG
+# -----------------------------
+
+QUERY_THREADS = int(os.getenv("QUERY_THREADS", str(os.cpu_count() or 4)))
+
+# auto: the Parquet export when current, else the JSON file; json: always
+# the JSON files.
+QUERY_SOURCE = os.getenv("QUERY_SOURCE", "auto")
+
+STORES: Dict[str, Dict[str, str]] = {
+    "commits": {"path": "github_commits_branch_aware.json", "format": "array"},
+    "deployments": {"path": "github_deployments_multi_repo.json", "format": "array"},
+    "pr_merged": {"path": "github_pr_merged_events.json", "format": "array"},
+    "pr_created": {
+        "path": "incremental_github_pr_created_events.json",
+        "format": "array",
+    },
+    "commit_events": {
+        "path": "github_commit_events.ndjson",
+        "format": "newline_delimited",
+    },
+    "deployment_events": {
+        "path": "github_deployment_events.ndjson",
+        "format": "newline_delimited",
+    },
+}
+
+# -----------------------------
+# VIEWS
+# -----------------------------
+
+
+def _quote(value: str) -> str:
+    return "'" + value.replace("'", "''") + "'"
+
+
+def _parquet_glob(name: str) -> Optional[str]:
+    """The export's files for name, if it is Parquet and matches its source."""
+    if QUERY_SOURCE != "auto" or name not in analytics_export.DATASETS:
+        return None
+
+    entry = analytics_export.load_state().get(name)
+    source = analytics_export.DATASETS[name]["source"]
+    if (
+        not entry
+        or entry.get("format") != "parquet"
+        or entry.get("source") != analytics_export._stat(source)
+        or not entry.get("partitions")
+    ):
+        return None
+
+    return os.path.join(analytics_export.EXPORT_DIR, name, "**", "*.parquet")
+
+
+def _source_sql(name: str) -> Optional[str]:
+    glob = _parquet_glob(name)
+    if glob is not None:
+        return f"read_parquet({_quote(glob)}, hive_partitioning = true)"
+
+    store = STORES[name]
+    if not os.path.exists(store["path"]) or os.path.getsize(store["path"]) == 0:
+        return None
+    return (
+        f"read_json_auto({_quote(store['path'])}, "
+        f"format = {_quote(store['format'])}, union_by_name = true)"
+    )
+
+
+def connect() -> duckdb.DuckDBPyConnection:
+    """An in-memory connection with a view per store that has data."""
+    con = duckdb.connect(
+        config={
+            "threads": QUERY_THREADS,
+            "autoinstall_known_extensions": False,
+            "autoload_known_extensions": False,
+        }
+    )
+    con.execute("SET TimeZone = 'UTC'")
+
+    for name in STORES:
+        source = _source_sql(name)
+        if source is not None:
+            con.execute(f"CREATE VIEW {name} AS SELECT * FROM {source}")
+
+    return con
+
+
+def query(
+    sql: str,
+    params: Optional[Sequence[Any]] = None,
+    con: Optional[duckdb.DuckDBPyConnection] = None,
+) -> List[Dict[str, Any]]:
+    """Run sql and return its rows as dicts."""
+    con = con or connect()
+    cursor = con.execute(sql, params or [])
+    columns = [d[0] for d in cursor.description]
+    return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+
+# -----------------------------
+# DORA QUERIES
+# -----------------------------
+
+# Matches dora_rollups: "inactive" is a superseded successful deployment.
+# Its status time is when it was superseded, so its creation time stands in
+# for when it succeeded.
+_TERMINAL_DEPLOYMENTS = """
+    SELECT
+        repo_name,
+        coalesce(environment, 'unknown') AS environment,
+        commit_sha,
+        deployment_created_at::TIMESTAMPTZ AS created_at,
+        CASE
+            WHEN status = 'inactive' THEN deployment_created_at
+            ELSE coalesce(status_created_at, deployment_created_at)
+        END::TIMESTAMPTZ AS status_at,
+        status IN ('failure', 'error') AS failed
+    FROM deployments
+    WHERE status IN ('success', 'inactive', 'failure', 'error')
+"""
+
+DORA_QUERIES: Dict[str, str] = {
+    "deployments_per_week": f"""
+        WITH d AS ({_TERMINAL_DEPLOYMENTS})
+        SELECT
+            repo_name,
+            environment,
+            date_trunc('week', created_at)::DATE AS week,
+            count(*) AS deployments,
+            count(*) FILTER (WHERE NOT failed) AS successes,
+            count(*) FILTER (WHERE failed) AS failures
+        FROM d
+        GROUP BY ALL
+        ORDER BY week, repo_name, environment
+    """,
+    "change_failure_rate": f"""
+        WITH d AS ({_TERMINAL_DEPLOYMENTS})
+        SELECT
+            repo_name,
+            environment,
+            count(*) AS deployments,
+            count(*) FILTER (WHERE failed) AS failures,
+            round(count(*) FILTER (WHERE failed) / count(*), 4) AS change_failure_rate
+        FROM d
+        GROUP BY ALL
+        ORDER BY repo_name, environment
+    """,
+    "time_to_restore": f"""
+        WITH d AS ({_TERMINAL_DEPLOYMENTS}),
+        -- An outage is the run of failures up to the next success.
+        outages AS (
+            SELECT
+                *,
+                count(*) FILTER (WHERE NOT failed) OVER (
+                    PARTITION BY repo_name, environment
+                    ORDER BY status_at
+                    ROWS BETWEEN UNBOUNDED PRECEDING AND 1 PRECEDING
+                ) AS outage
+            FROM d
+        ),
+        restores AS (
+            SELECT
+                repo_name,
+                environment,
+                min(status_at) FILTER (WHERE failed) AS failed_at,
+                min(status_at) FILTER (WHERE NOT failed) AS restored_at
+            FROM outages
+            GROUP BY repo_name, environment, outage
+        )
+        SELECT
+            repo_name,
+            environment,
+            count(*) AS restores,
+            round(median(epoch(restored_at) - epoch(failed_at)) / 3600, 2) AS median_hours
+        FROM restores
+        WHERE failed_at IS NOT NULL AND restored_at IS NOT NULL
+        GROUP BY ALL
+        ORDER BY repo_name, environment
+    """,
+    # Exact SHA matches only; lead_time_metrics.py also credits commits
+    # shipped as ancestors of a deployed SHA.
+    "lead_time_for_changes": f"""
+        WITH d AS ({_TERMINAL_DEPLOYMENTS}),
+        first_deploy AS (
+            SELECT repo_name, commit_sha, min(status_at) AS deployed_at
+            FROM d
+            WHERE NOT failed
+            GROUP BY ALL
+        ),
+        changes AS (
+            SELECT DISTINCT ON (c.repo_name, c.commit_sha)
+                c.repo_name,
+                f.deployed_at,
+                epoch(f.deployed_at) - epoch(c.commit_timestamp::TIMESTAMPTZ) AS seconds
+            FROM commits c
+            JOIN first_deploy f USING (repo_name, commit_sha)
+        )
+        SELECT
+            repo_name,
+            date_trunc('week', deployed_at)::DATE AS week,
+            count(*) AS changes,
+            round(median(seconds) / 3600, 2) AS median_hours
+        FROM changes
+        WHERE seconds >= 0
+        GROUP BY ALL
+        ORDER BY week, repo_name
+    """,
+    "pr_merge_time": """
+        SELECT
+            repo_name,
+            date_trunc('week', merged_at::TIMESTAMPTZ)::DATE AS week,
+            count(*) AS merged,
+            round(
+                median(epoch(merged_at::TIMESTAMPTZ) - epoch(created_at::TIMESTAMPTZ)) / 3600,
+                2
+            ) AS median_hours
+        FROM pr_merged
+        WHERE merged_at IS NOT NULL
+        GROUP BY ALL
+        ORDER BY week, repo_name
+    """,
+}
+
+
+def dora(name: str, con: Optional[duckdb.DuckDBPyConnection] = None) -> List[Dict[str, Any]]:
+    if name not in DORA_QUERIES:
+        raise ValueError(f"Unknown DORA query: {name}")
+    return query(DORA_QUERIES[name], con=con)
+
+
+# -----------------------------
+# MAIN
+# -----------------------------
+
+if __name__ == "__main__":
+
+    args = sys.argv[1:]
+
+    if not args or args[0] == "--list":
+        print("Views:", ", ".join(STORES))
+        print("DORA queries:", ", ".join(DORA_QUERIES))
+        sys.exit(0)
+
+    if args[0] == "--dora":
+        if len(args) < 2:
+            raise SystemExit("Usage: event_queries.py --dora <query>")
+        rows = dora(args[1])
+    else:
+        rows = query(" ".join(args))
+
+    for row in rows:
+        print(json.dumps(row, default=str))
+    print(f"({len(rows)} rows)")
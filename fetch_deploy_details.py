@@ -1,6 +1,9 @@
 import hmac
 import hashlib
 from flask import Flask, request, abort, jsonify
+from admission_control import AdmissionQueue
+from deployment_store import persist_webhook_event
+from payload_decoder import decode, DEPLOYMENT_SCHEMA, DEPLOYMENT_STATUS_SCHEMA
 
 app = Flask(__name__)
 
@@ -13,6 +16,20 @@ def verify_signature(payload, signature):
     return hmac.compare_digest(expected, signature)
 
 
+admission = AdmissionQueue(persist_webhook_event).start()
+
+
+def accept(event):
+    if not admission.offer(event):
+        return (
+            jsonify({"status": "overloaded"}),
+            503,
+            {"Retry-After": str(admission.retry_after)},
+        )
+
+    return jsonify(event), 200
+
+
 @app.route("/webhook", methods=["POST"])
 def github_webhook():
     signature = request.headers.get("X-Hub-Signature-256")
@@ -24,7 +41,17 @@ def github_webhook():
         abort(401)
 
     event_type = request.headers.get("X-GitHub-Event")
-    data = request.json
+
+    if event_type not in ("deployment", "deployment_status"):
+        return jsonify({"ignored_event": event_type}), 200
+
+    try:
+        data = decode(
+            payload,
+            DEPLOYMENT_SCHEMA if event_type == "deployment" else DEPLOYMENT_STATUS_SCHEMA,
+        )
+    except ValueError:
+        abort(400)
 
     if event_type == "deployment":
         deployment = data["deployment"]
@@ -40,25 +67,32 @@ def github_webhook():
             "repo": data["repository"]["full_name"]
         }
 
-        return jsonify(event), 200
+        return accept(event)
 
-    if event_type == "deployment_status":
-        status = data["deployment_status"]
+    status = data["deployment_status"]
+    deployment = data["deployment"]
 
-        event = {
-            "event_type": "deployment_status",
-            "deployment_id": data["deployment"]["id"],
-            "state": status["state"],
-            "environment": status["environment"],
-            "description": status["description"],
-            "log_url": status["log_url"],
-            "updated_at": status["updated_at"],
-            "repo": data["repository"]["full_name"]
-        }
+    event = {
+        "event_type": "deployment_status",
+        "deployment_id": deployment["id"],
+        "state": status["state"],
+        "environment": status["environment"] or deployment["environment"],
+        "ref": deployment["ref"],
+        "sha": deployment["sha"],
+        "deployment_created_at": deployment["created_at"],
+        "description": status["description"],
+        "log_url": status["log_url"],
+        "created_at": status["created_at"],
+        "updated_at": status["updated_at"],
+        "repo": data["repository"]["full_name"]
+    }
+
+    return accept(event)
 
-        return jsonify(event), 200
 
-    return jsonify({"ignored_event": event_type}), 200
+@app.route("/metrics", methods=["GET"])
+def metrics():
+    return jsonify(admission.stats()), 200
 
 
 if __name__ == "__main__":
@@ -13,6 +13,8 @@ from datetime import datetime, timezone
 from typing import Dict, List, Any, Optional
 from dotenv import load_dotenv
 
+from timestamps import later, to_epoch_us
+
 load_dotenv()
 
 # -----------------------------
@@ -105,6 +107,7 @@ def fetch_pull_requests(since_ts: Optional[str]) -> List[Dict[str, Any]]:
 
     page = 1
     records: List[Dict[str, Any]] = []
+    since_us = to_epoch_us(since_ts) if since_ts else None
 
     while True:
         pulls = github_get(
@@ -122,7 +125,7 @@ def fetch_pull_requests(since_ts: Optional[str]) -> List[Dict[str, Any]]:
             break
 
         for pr in pulls:
-            if since_ts and pr["updated_at"] <= since_ts:
+            if since_us is not None and to_epoch_us(pr["updated_at"]) <= since_us:
                 continue
             records.append(pr)
 
@@ -206,8 +209,7 @@ if __name__ == "__main__":
                 )
                 existing_events.add(merged_key)
 
-        if not max_updated_at or pr["updated_at"] > max_updated_at:
-            max_updated_at = pr["updated_at"]
+        max_updated_at = later(max_updated_at, pr["updated_at"])
 
     if new_records:
         if os.path.exists(OUTPUT_FILE):
@@ -0,0 +1,266 @@
+"""
+Shared GitHub REST / GraphQL client with a process-wide rate-limit budget
+
+Every ingester imported into one process (the ingestion daemon, or a
+receiver running triggered jobs) goes through the same requests.Session and
+the same view of the remaining rate limit. When a resource's budget drops to
+RATE_LIMIT_RESERVE the client waits for its reset instead of spending the
+last requests, and rate-limited responses are retried after the advertised
+delay.
+
+Responses are decoded with payload_decoder: pass a schema to get() to have
+only the fields it names parsed. get_cached() / graphql_cached() serve
+responses that cannot change from the persistent immutable_cache.
+"""
+
+import os
+import time
+import threading
+from typing import Any, Callable, Dict, Optional
+
+import requests
+from dotenv import load_dotenv
+
+from immutable_cache import always, get_cache, opened_cache, request_key
+from payload_decoder import Schema, decode
+
+load_dotenv()
+
+# -----------------------------
+# CONFIG
+# -----------------------------
+
+ACCESS_TOKEN = os.getenv("ACCESS_TOKEN")
+if not ACCESS_TOKEN:
+    raise RuntimeError("ACCESS_TOKEN is not set")
+
+GRAPHQL_URL = "https://api.github.com/graphql"
+TIMEOUT = 10
+MAX_RETRIES = 3
+
+RATE_LIMIT_RESERVE = int(os.getenv("GITHUB_RATE_LIMIT_RESERVE", "50"))
+
+HEADERS = {
+    "Authorization": f"token {ACCESS_TOKEN}",
+    "Accept": "application/vnd.github+json",
+    "X-GitHub-Api-Version": "2022-11-28",
+}
+
+# -----------------------------
+# CLIENT
+# -----------------------------
+
+
+class GitHubClient:
+    def __init__(self, reserve: int = RATE_LIMIT_RESERVE) -> None:
+        self.reserve = reserve
+
+        self.session = requests.Session()
+        self.session.headers.update(HEADERS)
+
+        # resource ("core", "graphql", ...) -> remaining / limit / reset epoch
+        self._budget: Dict[str, Dict[str, int]] = {}
+        self._lock = threading.Lock()
+
+        self.requests_made = 0
+        self.rate_limited = 0
+        self.waited_seconds = 0.0
+
+    def remaining(self, resource: str = "core") -> Optional[int]:
+        with self._lock:
+            budget = self._budget.get(resource)
+            return budget["remaining"] if budget else None
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            budget = {k: dict(v) for k, v in self._budget.items()}
+
+        # Reading stats must not create the cache file.
+        cache = opened_cache()
+
+        return {
+            "requests_made": self.requests_made,
+            "rate_limited": self.rate_limited,
+            "waited_seconds": round(self.waited_seconds, 1),
+            "budget": budget,
+            **(cache.stats() if cache is not None else {}),
+        }
+
+    # -----------------------------
+    # BUDGET
+    # -----------------------------
+
+    def _record(self, r: requests.Response) -> None:
+        remaining = r.headers.get("X-RateLimit-Remaining")
+        if remaining is None:
+            return
+
+        resource = r.headers.get("X-RateLimit-Resource", "core")
+        with self._lock:
+            self._budget[resource] = {
+                "remaining": int(remaining),
+                "limit": int(r.headers.get("X-RateLimit-Limit", 0)),
+                "reset": int(r.headers.get("X-RateLimit-Reset", 0)),
+            }
+
+    def _sleep(self, seconds: float, reason: str) -> None:
+        print(f"GitHub {reason}: waiting {seconds:.0f}s")
+        time.sleep(seconds)
+        self.waited_seconds += seconds
+
+    def _wait_for_budget(self, resource: str) -> None:
+        with self._lock:
+            budget = self._budget.get(resource)
+            if not budget or budget["remaining"] > self.reserve:
+                return
+            delay = budget["reset"] - time.time() + 1
+
+        if delay > 0:
+            self._sleep(delay, f"{resource} budget at reserve")
+
+        with self._lock:
+            budget["remaining"] = budget["limit"]
+
+    def _retry_delay(self, r: requests.Response) -> Optional[float]:
+        if r.status_code not in (403, 429):
+            return None
+
+        retry_after = r.headers.get("Retry-After")
+        if retry_after:
+            return float(retry_after)
+
+        if r.headers.get("X-RateLimit-Remaining") == "0":
+            return max(1.0, int(r.headers.get("X-RateLimit-Reset", 0)) - time.time() + 1)
+
+        if "rate limit" in r.text.lower():
+            return 60.0
+
+        return None
+
+    # -----------------------------
+    # HTTP
+    # -----------------------------
+
+    def _request(self, method: str, url: str, resource: str, **kwargs: Any) -> requests.Response:
+        for _ in range(MAX_RETRIES):
+            self._wait_for_budget(resource)
+
+            r = self.session.request(method, url, timeout=TIMEOUT, **kwargs)
+            self.requests_made += 1
+            self._record(r)
+
+            delay = self._retry_delay(r)
+            if delay is None:
+                return r
+
+            self.rate_limited += 1
+            self._sleep(delay, "rate limit")
+
+        raise RuntimeError(f"GitHub API rate limited after retries: {url}")
+
+    def request(
+        self,
+        url: str,
+        params: Optional[Dict[str, Any]] = None,
+        headers: Optional[Dict[str, str]] = None,
+    ) -> requests.Response:
+        """Raw GET, for callers that need status codes or headers (ETags, Link)."""
+        return self._request("GET", url, "core", params=params, headers=headers)
+
+    def get(
+        self,
+        url: str,
+        params: Optional[Dict[str, Any]] = None,
+        schema: Optional[Schema] = None,
+    ) -> Any:
+        r = self._request("GET", url, "core", params=params)
+
+        if r.status_code == 404:
+            return None
+
+        if r.status_code == 401:
+            raise RuntimeError("Unauthorized: check token permissions")
+
+        r.raise_for_status()
+        return decode(r.content, schema) if schema is not None else r.json()
+
+    def graphql(self, query: str, variables: Dict[str, Any]) -> Dict[str, Any]:
+        r = self._request(
+            "POST", GRAPHQL_URL, "graphql", json={"query": query, "variables": variables}
+        )
+        r.raise_for_status()
+        return r.json()
+
+    # -----------------------------
+    # IMMUTABLE RESOURCES
+    # -----------------------------
+
+    def get_cached(
+        self,
+        url: str,
+        params: Optional[Dict[str, Any]] = None,
+        schema: Optional[Schema] = None,
+        immutable: Callable[[Any], bool] = always,
+    ) -> Any:
+        """get(), served from the persistent cache once immutable(response) held."""
+        return get_cache().cached_json(
+            request_key("GET", url, params, schema=schema),
+            lambda: self.get(url, params, schema),
+            immutable,
+        )
+
+    def graphql_cached(
+        self,
+        query: str,
+        variables: Dict[str, Any],
+        immutable: Callable[[Any], bool] = always,
+    ) -> Dict[str, Any]:
+        return get_cache().cached_json(
+            request_key("POST", GRAPHQL_URL, body={"query": query, "variables": variables}),
+            lambda: self.graphql(query, variables),
+            immutable,
+        )
+
+
+# -----------------------------
+# SHARED INSTANCE
+# -----------------------------
+
+_client: Optional[GitHubClient] = None
+_client_lock = threading.Lock()
+
+
+def get_client() -> GitHubClient:
+    global _client
+
+    with _client_lock:
+        if _client is None:
+            _client = GitHubClient()
+        return _client
+
+
+def github_get(
+    url: str, params: Optional[Dict[str, Any]] = None, schema: Optional[Schema] = None
+) -> Any:
+    return get_client().get(url, params, schema)
+
+
+def github_graphql(query: str, variables: Dict[str, Any]) -> Dict[str, Any]:
+    return get_client().graphql(query, variables)
+
+
+def github_get_cached(
+    url: str,
+    params: Optional[Dict[str, Any]] = None,
+    schema: Optional[Schema] = None,
+    immutable: Callable[[Any], bool] = always,
+) -> Any:
+    return get_client().get_cached(url, params, schema, immutable)
+
+
+def github_graphql_cached(
+    query: str,
+    variables: Dict[str, Any],
+    immutable: Callable[[Any], bool] = always,
+) -> Dict[str, Any]:
+    return get_client().graphql_cached(query, variables, immutable)
@@ -0,0 +1,209 @@
+"""
+Persistent cache of GitHub responses that can never change
+
+Some resources are fixed once they exist: a compare between two SHAs, a
+merged PR's commit list, a deployment status that GitHub will not move on
+from. Re-runs, backfill retries and reprocessing used to request them
+again. Here they are stored in SQLite, keyed by a digest of the canonical
+request (method, URL, sorted params, body and the decode schema), and
+never expire. The cache is capped at IMMUTABLE_CACHE_MAX_MB by evicting
+the least recently used entries.
+
+Callers decide what is immutable: cached_json() takes a predicate over the
+fetched value, and anything it rejects (an open PR, a pending deployment)
+is returned without being stored.
+"""
+
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from typing import Any, Callable, Dict, Optional
+
+import json_store
+
+# -----------------------------
+# CONFIG
+# -----------------------------
+
+IMMUTABLE_CACHE_FILE = os.getenv("IMMUTABLE_CACHE_FILE", "github_immutable_cache.sqlite")
+IMMUTABLE_CACHE_MAX_MB = float(os.getenv("IMMUTABLE_CACHE_MAX_MB", "256"))
+
+# Eviction trims to this fraction of the cap, so it does not run on every put.
+EVICT_TO = 0.9
+
+# -----------------------------
+# KEYS
+# -----------------------------
+
+
+def request_key(
+    method: str,
+    url: str,
+    params: Optional[Dict[str, Any]] = None,
+    body: Any = None,
+    schema: Any = None,
+) -> str:
+    canonical = json.dumps(
+        {
+            "method": method.upper(),
+            "url": url,
+            "params": {k: str(v) for k, v in sorted((params or {}).items())},
+            "body": body,
+            # The cached value is the decoded projection, so the schema is
+            # part of the request.
+            "schema": repr(schema) if schema is not None else None,
+        },
+        sort_keys=True,
+        separators=(",", ":"),
+    )
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+def always(_: Any) -> bool:
+    return True
+
+
+# -----------------------------
+# CACHE
+# -----------------------------
+
+
+class ImmutableCache:
+    def __init__(
+        self, path: str = IMMUTABLE_CACHE_FILE, max_mb: float = IMMUTABLE_CACHE_MAX_MB
+    ) -> None:
+        self.path = path
+        self.max_bytes = int(max_mb * 1024 * 1024)
+
+        # One connection shared by the ingesters' worker threads.
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(
+            path, timeout=30, isolation_level=None, check_same_thread=False
+        )
+        self._conn.execute("PRAGMA journal_mode = WAL")
+        self._conn.execute("PRAGMA synchronous = NORMAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS entries (
+                key TEXT PRIMARY KEY,
+                body BLOB NOT NULL,
+                size INTEGER NOT NULL,
+                last_used REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS entries_last_used ON entries (last_used)"
+        )
+
+        # Approximate when other processes write too; re-read before evicting.
+        self._size = self._total_size()
+
+        self.hits = 0
+        self.misses = 0
+        self.evicted = 0
+
+    def _total_size(self) -> int:
+        return self._conn.execute("SELECT total(size) FROM entries").fetchone()[0]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "cache_hits": self.hits,
+            "cache_misses": self.misses,
+            "cache_evicted": self.evicted,
+            "cache_bytes": int(self._size),
+        }
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT body FROM entries WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+
+            self._conn.execute(
+                "UPDATE entries SET last_used = ? WHERE key = ?", (time.time(), key)
+            )
+            self.hits += 1
+            return row[0]
+
+    def put(self, key: str, body: bytes) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO entries (key, body, size, last_used) VALUES (?, ?, ?, ?)",
+                (key, body, len(body), time.time()),
+            )
+            self._size += len(body)
+
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def _evict(self) -> None:
+        self._size = self._total_size()
+        target = self.max_bytes * EVICT_TO
+
+        while self._size > target:
+            rows = self._conn.execute(
+                "SELECT key, size FROM entries ORDER BY last_used LIMIT 256"
+            ).fetchall()
+            if not rows:
+                break
+
+            self._conn.executemany(
+                "DELETE FROM entries WHERE key = ?", [(k,) for k, _ in rows]
+            )
+            self._size -= sum(size for _, size in rows)
+            self.evicted += len(rows)
+
+    def cached_json(
+        self,
+        key: str,
+        fetch: Callable[[], Any],
+        immutable: Callable[[Any], bool] = always,
+    ) -> Any:
+        """
+        The cached value for key, or fetch()'s result, stored when it is not
+        None and immutable(value) holds. A cached value immutable() no longer
+        accepts (stored under an older, looser rule) is fetched again.
+        """
+        body = self.get(key)
+        if body is not None:
+            value = json_store.loads(body)
+            if immutable(value):
+                return value
+
+        value = fetch()
+        if value is not None and immutable(value):
+            self.put(key, json_store.dumps(value).encode())
+        return value
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+# -----------------------------
+# SHARED INSTANCE
+# -----------------------------
+
+_cache: Optional[ImmutableCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_cache() -> ImmutableCache:
+    global _cache
+
+    with _cache_lock:
+        if _cache is None:
+            _cache = ImmutableCache()
+        return _cache
+
+
+def opened_cache() -> Optional[ImmutableCache]:
+    """The shared cache if something already opened it, without creating it."""
+    return _cache
@@ -1,24 +1,32 @@
 """
 Incremental, append-safe commit ingestion using existing historical JSON
+
+Run as a script for a full sweep of REPOSITORIES, call ingest_branch() for a
+targeted fetch (used by the push-triggered jobs in ingest_triggers), or
+ingest_repo() per scheduled job (ingestion_daemon). Checkpoints stay warm in
+memory between calls in one process. Each page is staged durably as it is
+fetched and merged into the output file every MERGE_EVERY_PAGES pages, and
+an interrupted fetch resumes from its backfill_journal entry.
 """
 
 import os
-import json
-import requests
-from datetime import datetime, timezone
-from typing import List, Dict, Any, Optional
-from dotenv import load_dotenv
-
-load_dotenv()
+import time
+from typing import List, Dict, Any, Iterator, Optional, Tuple
+
+import commit_graph
+import json_store
+from key_index import SHA_WIDTH, KeyIndex, sha_key
+from backfill_journal import journal
+from pipeline import prefetch
+from github_client import github_get
+from payload_decoder import BRANCH_LIST_SCHEMA, COMMIT_LIST_SCHEMA
+from repo_discovery import repo_key, split_full_name
+from timestamps import as_epoch_us, epoch_of, from_epoch_us, normalize, now_iso
 
 # -----------------------------
 # CONFIG
 # -----------------------------
 
-ACCESS_TOKEN = os.getenv("ACCESS_TOKEN")
-if not ACCESS_TOKEN:
-    raise RuntimeError("ACCESS_TOKEN is not set")
-
 REPO_OWNER = "hrishi-york"
 
 REPOSITORIES = ["remote_exmpl", "receiver_repo"]
@@ -27,26 +35,9 @@ OUTPUT_FILE = "github_commits_branch_aware.json"
 
 BASE_URL = "https://api.github.com/repos"
 PER_PAGE = 100
-TIMEOUT = 10
 
-HEADERS = {
-    "Authorization": f"token {ACCESS_TOKEN}",
-    "Accept": "application/vnd.github+json",
-    "X-GitHub-Api-Version": "2022-11-28",
-}
-
-session = requests.Session()
-session.headers.update(HEADERS)
-
-# -----------------------------
-# CORE HTTP
-# -----------------------------
-
-
-def github_get(url: str, params: Optional[Dict[str, Any]] = None) -> Any:
-    r = session.get(url, params=params, timeout=TIMEOUT)
-    r.raise_for_status()
-    return r.json()
+# Warm state is re-read from disk this often to pick up other writers.
+STATE_TTL_SECONDS = float(os.getenv("INGEST_STATE_TTL", "3600"))
 
 
 # -----------------------------
@@ -55,10 +46,7 @@ def github_get(url: str, params: Optional[Dict[str, Any]] = None) -> Any:
 
 
 def load_existing_records() -> List[Dict[str, Any]]:
-    if not os.path.exists(OUTPUT_FILE):
-        return []
-    with open(OUTPUT_FILE, "r", encoding="utf-8") as f:
-        return json.load(f)
+    return json_store.load_records(OUTPUT_FILE)
 
 
 # -----------------------------
@@ -66,21 +54,101 @@ def load_existing_records() -> List[Dict[str, Any]]:
 # -----------------------------
 
 
-def build_checkpoint(records: List[Dict[str, Any]]) -> Dict[str, str]:
-    checkpoint: Dict[str, str] = {}
+def branch_key(owner: str, repo_name: str, branch: str) -> str:
+    return f"{repo_key(owner, repo_name, REPO_OWNER)}:{branch}"
+
+
+def build_checkpoint(records: List[Dict[str, Any]]) -> Dict[str, int]:
+    """Latest commit time (epoch microseconds) per repo branch."""
+    checkpoint: Dict[str, int] = {}
 
     for r in records:
-        key = f"{r['repo_name']}:{r['branch']}"
-        ts = r["commit_timestamp"]
+        key = branch_key(r.get("repo_owner", REPO_OWNER), r["repo_name"], r["branch"])
+        ts = epoch_of(r, "commit_timestamp")
 
-        if key not in checkpoint or ts > checkpoint[key]:
+        if ts is not None and (key not in checkpoint or ts > checkpoint[key]):
             checkpoint[key] = ts
 
     return checkpoint
 
 
-def build_existing_sha_set(records: List[Dict[str, Any]]) -> set[str]:
-    return {r["commit_sha"] for r in records}
+def update_checkpoint(meta: Dict[str, Any], records: List[Dict[str, Any]]) -> None:
+    checkpoint = meta.setdefault("checkpoint", {})
+    for key, ts in build_checkpoint(records).items():
+        if key not in checkpoint or ts > as_epoch_us(checkpoint[key]):
+            checkpoint[key] = ts
+
+
+def record_repo(r: Dict[str, Any]) -> str:
+    return repo_key(r.get("repo_owner", REPO_OWNER), r["repo_name"], REPO_OWNER)
+
+
+def commit_key(r: Dict[str, Any]) -> Tuple[str, bytes]:
+    return record_repo(r), sha_key(r["commit_sha"])
+
+
+sha_index = KeyIndex(
+    "commits",
+    OUTPUT_FILE,
+    SHA_WIDTH,
+    repo_of=record_repo,
+    key_of=lambda r: sha_key(r["commit_sha"]),
+    update_meta=update_checkpoint,
+)
+
+
+class CommitState:
+    """
+    Branch checkpoints and SHA dedup from the persistent key index, so a
+    refresh reads only what other writers appended to the output file.
+    """
+
+    def __init__(self) -> None:
+        self.checkpoint: Dict[str, int] = {}
+        self.loaded_at: Optional[float] = None
+        # Keys of records staged in page_log and not merged yet.
+        self.staged: set = set()
+
+    def refresh(self) -> None:
+        if (
+            self.loaded_at is not None
+            and time.monotonic() - self.loaded_at < STATE_TTL_SECONDS
+        ):
+            return
+
+        sha_index.open()
+        self.checkpoint = {
+            k: as_epoch_us(v) for k, v in sha_index.meta.get("checkpoint", {}).items()
+        }
+        self.loaded_at = time.monotonic()
+
+    def is_new(self, r: Dict[str, Any]) -> bool:
+        key = commit_key(r)
+        return key not in self.staged and not sha_index.contains(*key)
+
+    def stage(self, records: List[Dict[str, Any]]) -> None:
+        self.staged.update(map(commit_key, records))
+
+    def add(self, records: List[Dict[str, Any]]) -> None:
+        for r in records:
+            key = branch_key(r["repo_owner"], r["repo_name"], r["branch"])
+            ts = r["commit_timestamp_us"]
+            if ts > self.checkpoint.get(key, -1):
+                self.checkpoint[key] = ts
+
+
+state = CommitState()
+
+
+def merge_pages(records: List[Dict[str, Any]]) -> int:
+    # Checked against the index under the lock, which also picks up what a
+    # push-triggered job wrote meanwhile; the file is only appended to.
+    appended = sha_index.append(records)
+    state.staged.difference_update(map(commit_key, records))
+    return appended
+
+
+page_log = json_store.PageLog(OUTPUT_FILE, merge_pages)
 
 
 # -----------------------------
@@ -88,8 +156,11 @@ def build_existing_sha_set(records: List[Dict[str, Any]]) -> set[str]:
 # -----------------------------
 
 
-def fetch_branches(repo_name: str) -> List[str]:
-    data = github_get(f"{BASE_URL}/{REPO_OWNER}/{repo_name}/branches")
+def fetch_branches(repo_name: str, owner: str = REPO_OWNER) -> List[str]:
+    data = (
+        github_get(f"{BASE_URL}/{owner}/{repo_name}/branches", schema=BRANCH_LIST_SCHEMA)
+        or []
+    )
     return [b["name"] for b in data]
 
 
@@ -98,84 +169,136 @@ def fetch_branches(repo_name: str) -> List[str]:
 # -----------------------------
 
 
-def fetch_incremental_commits(
-    repo_name: str, branch: str, since_ts: Optional[str]
-) -> List[Dict[str, Any]]:
+def iter_commit_pages(
+    repo_name: str,
+    branch: str,
+    since_us: Optional[int],
+    owner: str = REPO_OWNER,
+    start_page: int = 1,
+) -> Iterator[Tuple[int, List[Dict[str, Any]]]]:
 
-    page = 1
-    records: List[Dict[str, Any]] = []
+    page = start_page
 
     while True:
         params = {"sha": branch, "per_page": PER_PAGE, "page": page}
 
-        if since_ts:
-            params["since"] = since_ts
+        if since_us is not None:
+            params["since"] = from_epoch_us(since_us)
 
         commits = github_get(
-            f"{BASE_URL}/{REPO_OWNER}/{repo_name}/commits", params=params
+            f"{BASE_URL}/{owner}/{repo_name}/commits",
+            params=params,
+            schema=COMMIT_LIST_SCHEMA,
         )
 
         if not commits:
-            break
-
-        for c in commits:
-            records.append(
-                {
-                    "event_type": "commit",
-                    "commit_sha": c["sha"],
-                    "commit_timestamp": c["commit"]["author"]["date"],
-                    "repo_owner": REPO_OWNER,
-                    "repo_name": repo_name,
-                    "branch": branch,
-                    "author": c["commit"]["author"]["name"].strip("“”\"'"),
-                    "author_email": c["commit"]["author"]["email"],
-                    "ingested_at": datetime.now(timezone.utc).isoformat(),
-                }
-            )
+            return
+
+        yield page, [
+            normalize({
+                "event_type": "commit",
+                "commit_sha": c["sha"],
+                "commit_timestamp": c["commit"]["author"]["date"],
+                "repo_owner": owner,
+                "repo_name": repo_name,
+                "branch": branch,
+                "author": c["commit"]["author"]["name"].strip("“”\"'"),
+                "author_email": c["commit"]["author"]["email"],
+                "parent_shas": [p["sha"] for p in c["parents"]],
+                "ingested_at": now_iso(),
+            })
+            for c in commits
+        ]
 
         page += 1
 
-    return records
-
 
 # -----------------------------
-# MAIN
+# INGEST
 # -----------------------------
 
-if __name__ == "__main__":
 
-    existing_records = load_existing_records()
-    checkpoint = build_checkpoint(existing_records)
-    existing_shas = build_existing_sha_set(existing_records)
+def ingest_branches(targets: List[Tuple[str, str]]) -> int:
+    """targets are (repo, branch) with repo either a bare name or "owner/name"."""
+    state.refresh()
 
-    new_records: List[Dict[str, Any]] = []
+    appended = 0
 
-    for repo in REPOSITORIES:
-        print(f"\nProcessing repository: {repo}")
-        branches = fetch_branches(repo)
+    graph_updates = commit_graph.GraphUpdates()
 
-        for branch in branches:
-            key = f"{repo}:{branch}"
-            since_ts = checkpoint.get(key)
+    try:
+        for repo, branch in targets:
+            owner, repo_name = split_full_name(repo, REPO_OWNER)
+            key = f"commits:{branch_key(owner, repo_name, branch)}"
+            since, start_page = journal.resume(
+                key, state.checkpoint.get(branch_key(owner, repo_name, branch))
+            )
+            since_us = as_epoch_us(since)
 
-            print(f"  ↳ Incremental fetch for {branch} | since={since_ts}")
+            print(
+                f"  ↳ Incremental fetch for {repo}:{branch} | "
+                f"since={from_epoch_us(since_us) if since_us is not None else None}"
+            )
 
-            commits = fetch_incremental_commits(repo, branch, since_ts)
+            # The next page downloads while this one is written.
+            pages = prefetch(
+                iter_commit_pages(repo_name, branch, since_us, owner, start_page)
+            )
 
-            for c in commits:
-                if c["commit_sha"] in existing_shas:
+            for page, commits in pages:
+                new_records = [c for c in commits if state.is_new(c)]
+                if not new_records:
                     continue
-                new_records.append(c)
-                existing_shas.add(c["commit_sha"])
 
-    if new_records:
-        all_records = existing_records + new_records
-        with open(OUTPUT_FILE, "w", encoding="utf-8") as f:
-            json.dump(all_records, f, indent=2)
+                # The entry must exist before the first write moves the
+                # checkpoint past the pages still to fetch.
+                journal.advance(key, since_us, page)
+
+                graph_updates.add(new_records)
+                state.stage(new_records)
+                appended += page_log.append(new_records)
+                state.add(new_records)
+
+            # Merged before the journal entry goes, so a crash resumes instead.
+            appended += page_log.flush()
+            journal.finish(key)
+    finally:
+        # Once per run; staged pages are durable, so also after a failure.
+        graph_updates.save()
+
+    return appended
+
+
+def ingest_branch(repo_name: str, branch: str) -> int:
+    return ingest_branches([(repo_name, branch)])
+
+
+def ingest_repo(repo: str) -> int:
+    owner, repo_name = split_full_name(repo, REPO_OWNER)
+    return ingest_branches([(repo, b) for b in fetch_branches(repo_name, owner)])
+
+
+def ingest_all() -> int:
+    targets: List[Tuple[str, str]] = []
+
+    for repo in REPOSITORIES:
+        print(f"\nListing branches for repository: {repo}")
+        targets.extend((repo, branch) for branch in fetch_branches(repo))
+
+    return ingest_branches(targets)
+
+
+# -----------------------------
+# MAIN
+# -----------------------------
+
+if __name__ == "__main__":
+
+    appended = ingest_all()
 
+    if appended:
         print("\n-----------------------------------")
-        print(f"New records appended: {len(new_records)}")
-        print(f"Total records now: {len(all_records)}")
+        print(f"New records appended: {appended}")
     else:
         print("\n-----------------------------------")
         print("No new commits found")
@@ -1,24 +1,38 @@
 """
 Incremental, append-safe deployment ingestion using existing historical JSON
+
+Deployment and deployment_status webhooks (fetch_deploy_details.py) keep
+the same file current in near real time; this poller only reconciles what
+the webhooks missed. Run as a script for all REPOSITORIES, or call
+ingest_repo() per scheduled job (ingestion_daemon) with state kept warm.
+Each page is staged durably as it is fetched and merged into the store every
+MERGE_EVERY_PAGES pages, and an interrupted fetch resumes from its
+backfill_journal entry.
 """
 
 import os
-import json
-import requests
+import time
 from datetime import datetime, timezone
-from typing import List, Dict, Any, Optional
-from dotenv import load_dotenv
-
-load_dotenv()
+from typing import List, Dict, Any, Iterator, Optional, Set, Tuple
+import json_store
+from backfill_journal import journal
+from deployment_store import (
+    is_complete,
+    is_terminal,
+    load_records,
+    merge_into,
+    merge_records,
+    statuses_are_final,
+)
+from github_client import github_get, github_get_cached
+from payload_decoder import DEPLOYMENT_LIST_SCHEMA, DEPLOYMENT_STATUS_LIST_SCHEMA
+from repo_discovery import repo_key, split_full_name
+from timestamps import US_PER_SECOND, epoch_of
 
 # -----------------------------
 # CONFIG
 # -----------------------------
 
-ACCESS_TOKEN = os.getenv("ACCESS_TOKEN")
-if not ACCESS_TOKEN:
-    raise RuntimeError("ACCESS_TOKEN is not set")
-
 REPO_OWNER = "hrishi-york"
 
 REPOSITORIES = [
@@ -31,33 +45,13 @@ OUTPUT_FILE = "github_deployments_multi_repo.json"
 
 BASE_URL = "https://api.github.com/repos"
 PER_PAGE = 100
-TIMEOUT = 10
-
-HEADERS = {
-    "Authorization": f"token {ACCESS_TOKEN}",
-    "Accept": "application/vnd.github+json",
-    "X-GitHub-Api-Version": "2022-11-28",
-}
-
-session = requests.Session()
-session.headers.update(HEADERS)
-
-# -----------------------------
-# CORE HTTP
-# -----------------------------
-
 
-def github_get(url: str, params: Optional[Dict[str, Any]] = None) -> Any:
-    r = session.get(url, params=params, timeout=TIMEOUT)
+# Warm state is re-read from disk this often to pick up webhook writes.
+STATE_TTL_SECONDS = float(os.getenv("INGEST_STATE_TTL", "3600"))
 
-    if r.status_code == 404:
-        return None
-
-    if r.status_code == 401:
-        raise RuntimeError("Unauthorized: check token permissions")
-
-    r.raise_for_status()
-    return r.json()
+# Deployments still pending after this long are taken as abandoned and no
+# longer have their statuses re-requested.
+STATUS_REFRESH_DAYS = float(os.getenv("STATUS_REFRESH_DAYS", "7"))
 
 
 # -----------------------------
@@ -66,10 +60,7 @@ def github_get(url: str, params: Optional[Dict[str, Any]] = None) -> Any:
 
 
 def load_existing_records() -> List[Dict[str, Any]]:
-    if not os.path.exists(OUTPUT_FILE):
-        return []
-    with open(OUTPUT_FILE, "r", encoding="utf-8") as f:
-        return json.load(f)
+    return load_records(OUTPUT_FILE)
 
 
 # -----------------------------
@@ -77,62 +68,221 @@ def load_existing_records() -> List[Dict[str, Any]]:
 # -----------------------------
 
 
+def is_held(record: Dict[str, Any]) -> bool:
+    return (
+        record.get("source") == "webhook"
+        and not record.get("unlisted")
+        and not (record.get("reconciled") and is_complete(record))
+    )
+
+
 def build_checkpoint(records: List[Dict[str, Any]]) -> Dict[str, int]:
     checkpoint: Dict[str, int] = {}
+    holds: Dict[str, int] = {}
 
     for r in records:
-        repo = r["repo_name"]
+        repo = repo_key(r.get("repo_owner", REPO_OWNER), r["repo_name"], REPO_OWNER)
         deployment_id = r["deployment_id"]
 
+        # Webhook records do not advance the checkpoint until a poll has
+        # seen them and filled in the deployment fields; until then they
+        # hold it below themselves so the next poll lists them again. One
+        # the listing no longer returns (deleted) stops holding it.
+        if is_held(r):
+            if repo not in holds or deployment_id < holds[repo]:
+                holds[repo] = deployment_id
+            continue
+
         if repo not in checkpoint or deployment_id > checkpoint[repo]:
             checkpoint[repo] = deployment_id
 
+    for repo, deployment_id in holds.items():
+        if repo in checkpoint and checkpoint[repo] >= deployment_id:
+            checkpoint[repo] = deployment_id - 1
+
     return checkpoint
 
 
-def build_existing_deployment_id_set(records: List[Dict[str, Any]]) -> set[int]:
-    return {r["deployment_id"] for r in records}
+def build_existing_deployment_index(
+    records: List[Dict[str, Any]],
+) -> Dict[int, Dict[str, Any]]:
+    return {r["deployment_id"]: r for r in records}
+
+
+class DeploymentState:
+    def __init__(self) -> None:
+        self.records: List[Dict[str, Any]] = []
+        self.known: Dict[int, Dict[str, Any]] = {}
+        self.loaded_at: Optional[float] = None
+        self._checkpoint: Optional[Dict[str, int]] = None
+
+    def refresh(self) -> None:
+        if (
+            self.loaded_at is not None
+            and time.monotonic() - self.loaded_at < STATE_TTL_SECONDS
+        ):
+            return
+
+        self.records = load_existing_records()
+        self._reindex()
+        self.loaded_at = time.monotonic()
+
+    def apply(self, updates: List[Dict[str, Any]]) -> None:
+        # Same merge as the store, so the warm copy tracks what was written.
+        merge_into(self.records, updates, self.known)
+        self._checkpoint = None
+
+    @property
+    def checkpoint(self) -> Dict[str, int]:
+        # Only read when a fetch starts, so not rebuilt for every page.
+        if self._checkpoint is None:
+            self._checkpoint = build_checkpoint(self.records)
+        return self._checkpoint
+
+    def _reindex(self) -> None:
+        self.known = build_existing_deployment_index(self.records)
+        self._checkpoint = None
+
+
+state = DeploymentState()
+
+# Merged under the store lock so webhook updates written meanwhile survive.
+page_log = json_store.PageLog(OUTPUT_FILE, lambda updates: merge_records(updates, OUTPUT_FILE))
 
 
 # -----------------------------
-# FETCH INCREMENTAL DEPLOYMENTS
+# DEPLOYMENT STATUSES
 # -----------------------------
 
 
-def fetch_incremental_deployments_for_repo(
-    repo_name: str, last_deployment_id: Optional[int]
+def fetch_latest_status(
+    repo_name: str, deployment_id: int, owner: str = REPO_OWNER
+) -> Dict[str, Any]:
+    statuses = (
+        github_get_cached(
+            f"{BASE_URL}/{owner}/{repo_name}/deployments/{deployment_id}/statuses",
+            schema=DEPLOYMENT_STATUS_LIST_SCHEMA,
+            immutable=statuses_are_final,
+        )
+        or []
+    )
+
+    return statuses[0] if statuses else {}
+
+
+def refresh_pending_statuses(
+    records: List[Dict[str, Any]], repo_name: str, owner: str = REPO_OWNER
+) -> List[Dict[str, Any]]:
+    # Recent deployments whose final status never arrived by webhook.
+    updates: List[Dict[str, Any]] = []
+    cutoff = int((time.time() - STATUS_REFRESH_DAYS * 86400) * US_PER_SECOND)
+
+    for r in records:
+        if r["repo_name"] != repo_name or is_terminal(r):
+            continue
+        if r.get("repo_owner", REPO_OWNER) != owner:
+            continue
+
+        created_at = epoch_of(r, "deployment_created_at") or epoch_of(r, "ingested_at")
+        if created_at is not None and created_at < cutoff:
+            continue
+
+        latest_status = fetch_latest_status(repo_name, r["deployment_id"], owner)
+        if not latest_status:
+            continue
+
+        updates.append(
+            {
+                "deployment_id": r["deployment_id"],
+                "status": latest_status.get("state"),
+                "status_created_at": latest_status.get("created_at"),
+            }
+        )
+
+    return updates
+
+
+def mark_unlisted(
+    records: List[Dict[str, Any]],
+    repo_name: str,
+    owner: str,
+    last_id: Optional[int],
+    listed: Set[int],
+    listed_from_us: int,
 ) -> List[Dict[str, Any]]:
+    """
+    Held webhook records a complete listing above last_id should have
+    returned but did not: received before the listing started, so the
+    deployment existed then, and absent from it, so it has been deleted.
+    """
+    updates: List[Dict[str, Any]] = []
+
+    for r in records:
+        if r["repo_name"] != repo_name or r.get("repo_owner", REPO_OWNER) != owner:
+            continue
+        if not is_held(r) or r["deployment_id"] in listed:
+            continue
+        if last_id is not None and r["deployment_id"] <= last_id:
+            continue
+
+        received_at = epoch_of(r, "ingested_at")
+        if received_at is None or received_at >= listed_from_us:
+            continue
+
+        updates.append({"deployment_id": r["deployment_id"], "unlisted": True})
+
+    return updates
 
-    page = 1
-    records: List[Dict[str, Any]] = []
+
+# -----------------------------
+# FETCH INCREMENTAL DEPLOYMENTS
+# -----------------------------
+
+
+def iter_deployment_pages(
+    repo_name: str,
+    last_deployment_id: Optional[int],
+    known: Optional[Dict[int, Dict[str, Any]]] = None,
+    owner: str = REPO_OWNER,
+    start_page: int = 1,
+) -> Iterator[Tuple[int, List[Dict[str, Any]]]]:
+
+    page = start_page
 
     while True:
         deployments = github_get(
-            f"{BASE_URL}/{REPO_OWNER}/{repo_name}/deployments",
+            f"{BASE_URL}/{owner}/{repo_name}/deployments",
             params={"per_page": PER_PAGE, "page": page},
+            schema=DEPLOYMENT_LIST_SCHEMA,
         )
 
         if not deployments:
-            break
+            return
+
+        records: List[Dict[str, Any]] = []
 
         for d in deployments:
             if last_deployment_id and d["id"] <= last_deployment_id:
-                return records
+                yield page, records
+                return
 
-            statuses = (
-                github_get(
-                    f"{BASE_URL}/{REPO_OWNER}/{repo_name}/deployments/{d['id']}/statuses"
-                )
-                or []
-            )
+            existing = (known or {}).get(d["id"])
 
-            latest_status = statuses[0] if statuses else {}
+            # Already captured by webhook with a final status: no statuses call.
+            if is_terminal(existing):
+                if is_complete(existing):
+                    records.append({"deployment_id": d["id"], "reconciled": True})
+                    continue
+                # Seen only through its status webhook; fill in the rest.
+                latest_status = {}
+            else:
+                latest_status = fetch_latest_status(repo_name, d["id"], owner)
 
             records.append(
                 {
                     "event_type": "deployment",
                     "deployment_id": d["id"],
-                    "repo_owner": REPO_OWNER,
+                    "repo_owner": owner,
                     "repo_name": repo_name,
                     "environment": d["environment"],
                     "ref": d["ref"],
@@ -144,47 +294,94 @@ def fetch_incremental_deployments_for_repo(
                         "slug"
                     ),
                     "creator": d["creator"]["login"],
+                    "reconciled": True,
                     "ingested_at": datetime.now(timezone.utc).isoformat(),
                 }
             )
 
-        page += 1
+        yield page, records
 
-    return records
+        page += 1
 
 
 # -----------------------------
-# MAIN
+# INGEST
 # -----------------------------
 
-if __name__ == "__main__":
 
-    existing_records = load_existing_records()
-    checkpoint = build_checkpoint(existing_records)
-    existing_ids = build_existing_deployment_id_set(existing_records)
+def ingest_repo(repo: str) -> int:
+    """
+    Fetch new deployments and pending statuses for one repo (bare name or
+    "owner/name") and merge them into the store. Returns the number of
+    updates merged.
+    """
+    state.refresh()
+
+    owner, repo_name = split_full_name(repo, REPO_OWNER)
+    key = f"deployments:{repo_key(owner, repo_name, REPO_OWNER)}"
+    last_id, start_page = journal.resume(
+        key, state.checkpoint.get(repo_key(owner, repo_name, REPO_OWNER))
+    )
+    print(f"\nIncremental fetch for repo: {repo} | last_id={last_id}")
+
+    merged = appended = 0
+
+    # Before the new pages, which already come with their latest status.
+    updates = refresh_pending_statuses(state.records, repo_name, owner)
+    if updates:
+        appended += page_log.append(updates)
+        state.apply(updates)
+        merged += len(updates)
+
+    listed_from_us = int(time.time() * US_PER_SECOND)
+    pages = iter_deployment_pages(repo_name, last_id, state.known, owner, start_page)
+    listed: Set[int] = set()
+
+    for page, updates in pages:
+        if not updates:
+            continue
+        listed.update(u["deployment_id"] for u in updates)
+
+        # Written before the merge reconciles these ids and moves the
+        # checkpoint past the pages still to fetch.
+        journal.advance(key, last_id, page)
+
+        appended += page_log.append(updates)
+        state.apply(updates)
+        merged += len(updates)
+
+    # A resumed listing did not see the pages before start_page.
+    if start_page == 1:
+        updates = mark_unlisted(
+            state.records, repo_name, owner, last_id, listed, listed_from_us
+        )
+        if updates:
+            page_log.append(updates)
+            state.apply(updates)
+
+    # Merged before the journal entry goes, so a crash resumes instead.
+    appended += page_log.flush()
+    journal.finish(key)
 
-    new_records: List[Dict[str, Any]] = []
+    if merged:
+        print(f"  ↳ appended {appended}, reconciled {merged - appended}")
+    return merged
 
-    for repo in REPOSITORIES:
-        last_id = checkpoint.get(repo)
-        print(f"\nIncremental fetch for repo: {repo} | last_id={last_id}")
 
-        deployments = fetch_incremental_deployments_for_repo(repo, last_id)
+def ingest_all() -> int:
+    return sum(ingest_repo(repo) for repo in REPOSITORIES)
 
-        for d in deployments:
-            if d["deployment_id"] in existing_ids:
-                continue
-            new_records.append(d)
-            existing_ids.add(d["deployment_id"])
-
-    if new_records:
-        all_records = existing_records + new_records
-        with open(OUTPUT_FILE, "w", encoding="utf-8") as f:
-            json.dump(all_records, f, indent=2)
-
-        print("\n-----------------------------------")
-        print(f"New deployments appended: {len(new_records)}")
-        print(f"Total deployments now: {len(all_records)}")
+
+# -----------------------------
+# MAIN
+# -----------------------------
+
+if __name__ == "__main__":
+
+    merged = ingest_all()
+
+    print("\n-----------------------------------")
+    if merged:
+        print(f"Deployment updates merged: {merged}")
     else:
-        print("\n-----------------------------------")
         print("No new deployments found")
@@ -0,0 +1,153 @@
+"""
+Webhook-triggered, targeted incremental ingestion (hybrid push/pull)
+
+Receivers call TriggerQueue.enqueue() for each push; the worker thread runs
+the matching ingester for just that repo and branch once the debounce window
+has passed. Bursts of pushes to the same branch collapse into one job. A
+low-frequency full sweep remains as a safety net for missed deliveries.
+"""
+
+import os
+import time
+import importlib
+import threading
+from typing import Any, Callable, Dict, Optional, Tuple
+
+# -----------------------------
+# CONFIG
+# -----------------------------
+
+DEBOUNCE_SECONDS = float(os.getenv("TRIGGER_DEBOUNCE_SECONDS", "30"))
+MAX_DELAY_SECONDS = float(os.getenv("TRIGGER_MAX_DELAY_SECONDS", "120"))
+SWEEP_INTERVAL_SECONDS = float(os.getenv("TRIGGER_SWEEP_INTERVAL", str(6 * 3600)))
+
+# source -> (module, targeted entry point, full sweep entry point)
+INGESTERS: Dict[str, Tuple[str, str, str]] = {
+    "commits": ("incremental_commits_fetch", "ingest_branch", "ingest_all"),
+}
+
+JobKey = Tuple[str, str, str]
+
+# -----------------------------
+# TRIGGER QUEUE
+# -----------------------------
+
+
+class TriggerQueue:
+    def __init__(
+        self,
+        debounce: float = DEBOUNCE_SECONDS,
+        max_delay: float = MAX_DELAY_SECONDS,
+        sweep_interval: float = SWEEP_INTERVAL_SECONDS,
+        ingesters: Optional[Dict[str, Tuple[str, str, str]]] = None,
+    ) -> None:
+        self.debounce = debounce
+        self.max_delay = max_delay
+        self.sweep_interval = sweep_interval
+        self.ingesters = ingesters or INGESTERS
+
+        # key -> (first_enqueued_at, due_at)
+        self._pending: Dict[JobKey, Tuple[float, float]] = {}
+        self._cond = threading.Condition()
+        self._next_sweep = time.monotonic() + sweep_interval
+
+        self.enqueued = 0
+        self.deduplicated = 0
+        self.jobs_run = 0
+        self.jobs_failed = 0
+        self.sweeps_run = 0
+
+    def start(self) -> "TriggerQueue":
+        threading.Thread(target=self._run, name="ingest-triggers", daemon=True).start()
+        return self
+
+    def enqueue(self, source: str, repo_name: str, branch: str) -> bool:
+        """
+        Schedule a targeted fetch. Returns False when it was merged into a job
+        already pending for the same source/repo/branch.
+        """
+        if source not in self.ingesters:
+            raise ValueError(f"Unknown ingestion source: {source}")
+
+        key = (source, repo_name, branch)
+        now = time.monotonic()
+
+        with self._cond:
+            pending = self._pending.get(key)
+
+            if pending is None:
+                self._pending[key] = (now, now + self.debounce)
+                self.enqueued += 1
+                self._cond.notify()
+                return True
+
+            # Trailing debounce, capped so a busy branch still gets fetched.
+            first_seen, _ = pending
+            self._pending[key] = (
+                first_seen,
+                min(first_seen + self.max_delay, now + self.debounce),
+            )
+            self.deduplicated += 1
+            return False
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            pending = len(self._pending)
+
+        return {
+            "pending_jobs": pending,
+            "enqueued": self.enqueued,
+            "deduplicated": self.deduplicated,
+            "jobs_run": self.jobs_run,
+            "jobs_failed": self.jobs_failed,
+            "sweeps_run": self.sweeps_run,
+        }
+
+    # -----------------------------
+    # WORKER
+    # -----------------------------
+
+    def _entry_point(self, source: str, full_sweep: bool) -> Callable[..., Any]:
+        module_name, targeted, sweep = self.ingesters[source]
+        module = importlib.import_module(module_name)
+        return getattr(module, sweep if full_sweep else targeted)
+
+    def _take_due(self) -> Optional[JobKey]:
+        with self._cond:
+            while True:
+                now = time.monotonic()
+
+                due = [k for k, (_, at) in self._pending.items() if at <= now]
+                if due:
+                    key = min(due, key=lambda k: self._pending[k][1])
+                    del self._pending[key]
+                    return key
+
+                if self.sweep_interval > 0 and now >= self._next_sweep:
+                    self._next_sweep = now + self.sweep_interval
+                    return None
+
+                wake_at = min(
+                    [at for _, at in self._pending.values()]
+                    + ([self._next_sweep] if self.sweep_interval > 0 else [])
+                    + [now + 60]
+                )
+                self._cond.wait(timeout=max(0.0, wake_at - now))
+
+    def _run(self) -> None:
+        while True:
+            key = self._take_due()
+
+            try:
+                if key is None:
+                    for source in self.ingesters:
+                        self._entry_point(source, full_sweep=True)()
+                    self.sweeps_run += 1
+                else:
+                    source, repo_name, branch = key
+                    self._entry_point(source, full_sweep=False)(repo_name, branch)
+                    self.jobs_run += 1
+            except Exception as e:
+                # The next push or sweep covers whatever this job missed.
+                self.jobs_failed += 1
+                print(f"Ingestion job {key or 'sweep'} failed:", e)
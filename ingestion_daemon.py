@@ -0,0 +1,386 @@
+"""
+Long-running ingestion daemon hosting every polling ingester
+
+Replaces one cron invocation per script: the commit, deployment and PR
+ingesters are imported once and run here as scheduled per-repo jobs. They
+share one GitHub client (github_client) and its rate-limit budget, and keep
+their checkpoints warm in memory between runs.
+
+Intervals (seconds) are set per source, with per-repo overrides, in
+DAEMON_CONFIG_FILE:
+
+    {
+      "commits": {"interval": 300, "repos": {"receiver_repo": 60}},
+      "pr_merged": {"interval": 1800, "repositories": ["remote_exmpl"]},
+      "deployments": {"adaptive": false}
+    }
+
+Sources default to their module's REPOSITORIES and DEFAULT_INTERVALS; a
+source with "enabled": false gets no jobs. With "owners": [...] in the config
+(or GITHUB_OWNERS set), repositories are discovered instead (repo_discovery)
+and re-discovered every DISCOVERY_INTERVAL seconds.
+
+Run N workers with --shard i/N (or INGEST_SHARD=i/N): each only schedules the
+repos the consistent-hash ring assigns to it and keeps its own warm
+checkpoints and adaptive schedule state. Output files are shared through
+json_store's locks, so workers on several machines need a shared volume.
+Unless "adaptive" is false, the configured interval is only the starting
+point: each job's interval then follows its repo's change rate between
+"min_interval" and "max_interval" (adaptive_schedule).
+"""
+
+import os
+import sys
+import json
+import time
+import heapq
+import signal
+import importlib
+import threading
+from functools import partial
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import adaptive_schedule
+from adaptive_schedule import (
+    AdaptiveInterval,
+    MAX_INTERVAL_SECONDS,
+    MIN_INTERVAL_SECONDS,
+)
+from github_client import get_client
+from repo_discovery import discover_repos, parse_shard, repos_for_shard
+
+# -----------------------------
+# CONFIG
+# -----------------------------
+
+DAEMON_CONFIG_FILE = os.getenv("INGESTION_DAEMON_CONFIG", "ingestion_daemon.json")
+
+# source -> module exposing REPOSITORIES and ingest_repo(repo) -> int
+SOURCES: Dict[str, str] = {
+    "commits": "incremental_commits_fetch",
+    "deployments": "incremental_deployments_fetch",
+    "pr_merged": "PR_INGESTION_MULTI_REPO",
+}
+
+DEFAULT_INTERVALS: Dict[str, float] = {
+    "commits": 300,
+    "deployments": 300,
+    "pr_merged": 900,
+}
+
+DISCOVERY_INTERVAL_SECONDS = float(os.getenv("DISCOVERY_INTERVAL", "3600"))
+
+# -----------------------------
+# JOBS
+# -----------------------------
+
+
+class Job:
+    def __init__(
+        self,
+        source: str,
+        repo: str,
+        interval: float,
+        run: Callable[[], int],
+        policy: Optional[AdaptiveInterval] = None,
+    ) -> None:
+        self.source = source
+        self.repo = repo
+        self.interval = policy.interval if policy else interval
+        self.run = run
+        self.policy = policy
+
+        self.next_run = 0.0
+        self.cancelled = False
+        self.last_started: Optional[float] = None
+        self.last_window: Optional[float] = None
+        self.runs = 0
+        self.failures = 0
+        self.last_new: Optional[int] = None
+
+    @property
+    def name(self) -> str:
+        return f"{self.source}:{self.repo}"
+
+
+def load_config(path: str = DAEMON_CONFIG_FILE) -> Dict[str, Any]:
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def build_jobs(
+    config: Dict[str, Any],
+    saved_policies: Optional[Dict[str, Dict[str, Any]]] = None,
+    repositories: Optional[List[str]] = None,
+    shard: Tuple[int, int] = (0, 1),
+) -> List[Job]:
+    """
+    One job per source and repo owned by this shard. repositories (when
+    discovered) replaces each module's REPOSITORIES unless a source lists
+    its own.
+    """
+    jobs: List[Job] = []
+    saved_policies = saved_policies or {}
+
+    for source, module_name in SOURCES.items():
+        section = config.get(source, {})
+        if not section.get("enabled", True):
+            continue
+
+        module = importlib.import_module(module_name)
+        interval = float(section.get("interval", DEFAULT_INTERVALS[source]))
+        overrides = section.get("repos", {})
+
+        repos = section.get(
+            "repositories",
+            module.REPOSITORIES if repositories is None else repositories,
+        )
+
+        # Hash full names so a repo lands on the same shard for every source.
+        full_names = {
+            repo if "/" in repo else f"{module.REPO_OWNER}/{repo}": repo
+            for repo in repos
+        }
+        owned = repos_for_shard(list(full_names), *shard)
+
+        for full_name in owned:
+            repo = full_names[full_name]
+
+            # Overrides may be keyed by full name or, as before discovery,
+            # by bare repo name.
+            bare_name = full_name.split("/", 1)[1]
+            repo_interval = float(
+                overrides.get(full_name, overrides.get(bare_name, interval))
+            )
+
+            policy = None
+            if section.get("adaptive", True):
+                policy = AdaptiveInterval(
+                    repo_interval,
+                    float(section.get("min_interval", MIN_INTERVAL_SECONDS)),
+                    float(section.get("max_interval", MAX_INTERVAL_SECONDS)),
+                )
+                saved = saved_policies.get(f"{source}:{repo}")
+                if saved:
+                    policy.restore(saved)
+
+            jobs.append(
+                Job(
+                    source,
+                    repo,
+                    repo_interval,
+                    partial(module.ingest_repo, repo),
+                    policy,
+                )
+            )
+
+    return jobs
+
+
+# -----------------------------
+# SCHEDULER
+# -----------------------------
+
+
+class Scheduler:
+    def __init__(
+        self, jobs: List[Job], state_file: str = adaptive_schedule.STATE_FILE
+    ) -> None:
+        self.jobs = jobs
+        self.state_file = state_file
+        self._heap: List[tuple] = []
+        self._seq = 0
+        self._stop = threading.Event()
+
+        # Spread each source's first runs across its interval so a restart
+        # does not spend the budget on every repo at once.
+        now = time.monotonic()
+        by_source: Dict[str, List[Job]] = {}
+        for job in jobs:
+            by_source.setdefault(job.source, []).append(job)
+
+        for source_jobs in by_source.values():
+            for i, job in enumerate(source_jobs):
+                self._push(job, now + job.interval * i / len(source_jobs))
+
+    def _push(self, job: Job, at: float) -> None:
+        job.next_run = at
+        self._seq += 1
+        heapq.heappush(self._heap, (at, self._seq, job))
+
+    def add(self, job: Job, at: Optional[float] = None) -> None:
+        self.jobs.append(job)
+        self._push(job, time.monotonic() if at is None else at)
+
+    def cancel(self, job: Job) -> None:
+        job.cancelled = True
+        self.jobs.remove(job)
+
+    def reschedule(self, job: Job, now: float) -> None:
+        if job.policy is not None:
+            job.interval = job.policy.observe(
+                job.last_new, job.last_window or job.interval
+            )
+
+        self._push(job, now + job.interval)
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def run_job(self, job: Job) -> None:
+        started = time.monotonic()
+
+        # The changes a run finds accumulated since the previous run started.
+        if job.last_started is not None:
+            job.last_window = started - job.last_started
+        job.last_started = started
+
+        try:
+            job.last_new = job.run()
+        except Exception as e:
+            # The next run resumes from the same checkpoint.
+            job.failures += 1
+            job.last_new = None
+            print(f"[{job.name}] failed:", e)
+        finally:
+            job.runs += 1
+
+        print(
+            f"[{job.name}] new={job.last_new} "
+            f"took={time.monotonic() - started:.1f}s "
+            f"core_remaining={get_client().remaining('core')}"
+        )
+
+    def run_forever(self) -> None:
+        while self._heap and not self._stop.is_set():
+            at, _, job = self._heap[0]
+
+            delay = at - time.monotonic()
+            if delay > 0:
+                self._stop.wait(delay)
+                continue
+
+            heapq.heappop(self._heap)
+            if job.cancelled:
+                continue
+
+            self.run_job(job)
+            self.reschedule(job, time.monotonic())
+            self.save_policies()
+
+    def save_policies(self) -> None:
+        adaptive_schedule.save_state(
+            {job.name: job.policy for job in self.jobs if job.policy is not None},
+            self.state_file,
+        )
+
+    def stats(self) -> List[Dict[str, Any]]:
+        return [
+            {
+                "job": job.name,
+                "interval": job.interval,
+                "runs": job.runs,
+                "failures": job.failures,
+                "last_new": job.last_new,
+            }
+            for job in self.jobs
+        ]
+
+
+# -----------------------------
+# DISCOVERY
+# -----------------------------
+
+
+def shard_state_file(shard_index: int, shard_count: int) -> str:
+    if shard_count == 1:
+        return adaptive_schedule.STATE_FILE
+    base, ext = os.path.splitext(adaptive_schedule.STATE_FILE)
+    return f"{base}.shard-{shard_index}-of-{shard_count}{ext}"
+
+
+def discover(config: Dict[str, Any]) -> Optional[List[str]]:
+    """Full names of every discovered repo, or None when discovery is off."""
+    owners = config.get("owners")
+    if not owners and not os.getenv("GITHUB_OWNERS"):
+        return None
+
+    return [r["full_name"] for r in discover_repos(owners)]
+
+
+def discovery_job(
+    scheduler: Scheduler, config: Dict[str, Any], shard: Tuple[int, int]
+) -> Job:
+    def run() -> int:
+        repos = discover(config)
+        if not repos:
+            # An owner answering 404 for a while, or filters that match
+            # nothing, must not cancel every scheduled job.
+            print("[discovery] no repositories discovered; keeping current jobs")
+            return 0
+
+        saved = adaptive_schedule.load_state(scheduler.state_file)
+
+        wanted = {job.name: job for job in build_jobs(config, saved, repos, shard)}
+        current = {job.name: job for job in scheduler.jobs if job.source in SOURCES}
+
+        for name in current.keys() - wanted.keys():
+            scheduler.cancel(current[name])
+        for name in wanted.keys() - current.keys():
+            scheduler.add(wanted[name])
+
+        return len(current.keys() ^ wanted.keys())
+
+    return Job(
+        "discovery",
+        "*",
+        float(config.get("discovery_interval", DISCOVERY_INTERVAL_SECONDS)),
+        run,
+    )
+
+
+# -----------------------------
+# MAIN
+# -----------------------------
+
+if __name__ == "__main__":
+
+    shard_spec = os.getenv("INGEST_SHARD")
+    if "--shard" in sys.argv:
+        shard_spec = sys.argv[sys.argv.index("--shard") + 1]
+    shard = parse_shard(shard_spec)
+
+    config = load_config()
+    state_file = shard_state_file(*shard)
+
+    repositories = discover(config)
+    scheduler = Scheduler(
+        build_jobs(
+            config, adaptive_schedule.load_state(state_file), repositories, shard
+        ),
+        state_file,
+    )
+
+    if repositories is not None:
+        discovery = discovery_job(scheduler, config, shard)
+        scheduler.add(discovery, time.monotonic() + discovery.interval)
+
+    def shutdown(signum, frame):
+        print("Stopping after the current job…")
+        scheduler.stop()
+
+    signal.signal(signal.SIGTERM, shutdown)
+    signal.signal(signal.SIGINT, shutdown)
+
+    print(
+        f"Ingestion daemon shard {shard[0]}/{shard[1]} "
+        f"started with {len(scheduler.jobs)} jobs"
+    )
+    scheduler.run_forever()
+
+    print("-----------------------------------")
+    for row in scheduler.stats():
+        print(row)
+    print(get_client().stats())
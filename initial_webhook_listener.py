@@ -1,6 +1,7 @@
 import hmac
 import hashlib
 from flask import Flask, request, abort, jsonify
+from payload_decoder import decode, PUSH_SCHEMA
 
 app = Flask(__name__)
 
@@ -30,12 +31,15 @@ def webhook():
 
     event = request.headers.get("X-GitHub-Event")
     delivery_id = request.headers.get("X-GitHub-Delivery")
-    payload = request.get_json()
 
     print("Event:", event)
     print("Delivery ID:", delivery_id)
 
     if event == "push":
+        try:
+            payload = decode(request.get_data(), PUSH_SCHEMA)
+        except ValueError:
+            abort(400)
         repo = payload["repository"]["full_name"]
         commits = len(payload["commits"])
         print(f"Push to {repo} with {commits} commits")
@@ -0,0 +1,340 @@
+"""
+Shared helpers for the JSON-array record files written by the ingesters
+
+Files are written compact by default, one record per line, which keeps them
+line-diffable at a fraction of the size and encode time of indent=2.
+JSON_PRETTY=1 (or pretty=True) writes the indented layout. Encoding and
+decoding go through orjson when it is installed.
+"""
+
+import os
+import json
+import contextlib
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - non-POSIX
+    fcntl = None
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional speedup
+    orjson = None
+
+# -----------------------------
+# CONFIG
+# -----------------------------
+
+JSON_PRETTY = os.getenv("JSON_PRETTY", "0") == "1"
+
+# Pages staged in a PageLog are merged into the output file this often.
+MERGE_EVERY_PAGES = int(os.getenv("MERGE_EVERY_PAGES", "20"))
+
+# -----------------------------
+# ENCODING
+# -----------------------------
+
+
+def loads(raw: Union[bytes, str]) -> Any:
+    return orjson.loads(raw) if orjson is not None else json.loads(raw)
+
+
+def dumps(obj: Any, pretty: bool = False) -> str:
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2 if pretty else 0).decode()
+    if pretty:
+        return json.dumps(obj, indent=2, ensure_ascii=False)
+    return json.dumps(obj, separators=(",", ":"), ensure_ascii=False)
+
+# -----------------------------
+# LOCKING
+# -----------------------------
+
+
+@contextlib.contextmanager
+def locked(path: str) -> Iterator[None]:
+    # Webhook receivers and pollers run as separate processes against the
+    # same files; serialise read-modify-write cycles with an advisory lock.
+    with open(f"{path}.lock", "w") as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+# -----------------------------
+# READ / WRITE
+# -----------------------------
+
+
+def load_records(path: str) -> List[Dict[str, Any]]:
+    if not os.path.exists(path):
+        return []
+    with open(path, "rb") as f:
+        raw = f.read()
+
+    try:
+        return loads(raw)
+    except ValueError:
+        # Read mid-append (or after one died): the records before it are intact.
+        end = _append_start(path)
+        if end is not None:
+            return loads(raw[:end] + b"\n]")
+        # The append finished meanwhile.
+        with open(path, "rb") as f:
+            return loads(f.read())
+
+
+def array_end(path: str) -> int:
+    """
+    Offset just past the last record of the array in path (past "[" if it
+    is empty): the part of the file an append leaves as it is.
+    """
+    with open(path, "rb") as f:
+        size = f.seek(0, os.SEEK_END)
+        f.seek(max(0, size - 64))
+        tail = f.read()
+
+    body = tail.rstrip()
+    if not body.endswith(b"]"):
+        raise ValueError(f"Not a JSON array: {path}")
+    return size - len(tail) + len(body[:-1].rstrip())
+
+
+def load_tail(path: str, start: int) -> Tuple[List[Dict[str, Any]], int]:
+    """
+    Records added to the array in path after an earlier array_end() of it,
+    and its array_end() now. Writers only ever extend the array, so the
+    bytes before start are left as they were.
+    """
+    with open(path, "rb") as f:
+        f.seek(start)
+        raw = f.read()
+
+    body = raw.rstrip()
+    if not body.endswith(b"]"):
+        raise ValueError(f"Not a JSON array: {path}")
+    body = body[:-1].rstrip()
+    end = start + len(body)
+
+    body = body.lstrip()
+    if body.startswith(b","):
+        body = body[1:]
+    return loads(b"[" + body + b"]"), end
+
+
+def _encode_record(r: Dict[str, Any], pretty: bool) -> str:
+    # Indented records are nested one level inside the array.
+    return dumps(r, True).replace("\n", "\n  ") if pretty else dumps(r)
+
+
+def save_records(
+    records: List[Dict[str, Any]], path: str, pretty: Optional[bool] = None
+) -> None:
+    with RecordWriter(path, pretty) as writer:
+        writer.write(records)
+
+
+class RecordWriter:
+    """
+    Write a JSON array one batch at a time, in the same layout as
+    save_records, into a temp file that replaces path only on close().
+    """
+
+    def __init__(self, path: str, pretty: Optional[bool] = None) -> None:
+        self.path = path
+        self.tmp_path = f"{path}.tmp"
+        self.pretty = JSON_PRETTY if pretty is None else pretty
+        self.count = 0
+        self._f = open(self.tmp_path, "w", encoding="utf-8")
+        self._f.write("[")
+
+    def write(self, records: Iterable[Dict[str, Any]]) -> None:
+        indent = "\n  " if self.pretty else "\n"
+        parts = []
+        for r in records:
+            parts.append(("," if self.count else "") + indent + _encode_record(r, self.pretty))
+            self.count += 1
+        self._f.write("".join(parts))
+
+    def close(self) -> None:
+        self._f.write("\n]" if self.count else "]")
+        self._f.close()
+        os.replace(self.tmp_path, self.path)
+
+    def abort(self) -> None:
+        # The previous file stays in place.
+        self._f.close()
+        os.remove(self.tmp_path)
+
+    def __enter__(self) -> "RecordWriter":
+        return self
+
+    def __exit__(self, exc_type: Any, *exc: Any) -> None:
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+def _append_start(path: str) -> Optional[int]:
+    marker = f"{path}.append"
+    if not os.path.exists(marker):
+        return None
+    with open(marker, "r", encoding="utf-8") as f:
+        return int(f.read())
+
+
+def recover_append(path: str) -> None:
+    """Cut off what an append that died left of its records. Call under locked(path)."""
+    end = _append_start(path)
+    if end is None:
+        return
+    with open(path, "r+b") as f:
+        f.seek(end)
+        f.write(b"\n]")
+        f.truncate()
+        f.flush()
+        os.fsync(f.fileno())
+    os.remove(f"{path}.append")
+
+
+def append_records(
+    records: List[Dict[str, Any]], path: str, pretty: Optional[bool] = None
+) -> None:
+    """
+    Append records to the array in path, in the layout of save_records,
+    writing only the new records instead of rewriting the file. Call under
+    locked(path). Until the append is complete, <path>.append holds where
+    it started, for load_records and recover_append.
+    """
+    if not records:
+        return
+    if not os.path.exists(path):
+        save_records(records, path, pretty)
+        return
+
+    recover_append(path)
+    pretty = JSON_PRETTY if pretty is None else pretty
+    indent = "\n  " if pretty else "\n"
+    end = array_end(path)
+
+    with open(path, "r+b") as f:
+        f.seek(end - 1)
+        sep = "" if f.read(1) == b"[" else ","
+        body = "".join(
+            (sep if i == 0 else ",") + indent + _encode_record(r, pretty)
+            for i, r in enumerate(records)
+        )
+
+        with open(f"{path}.append", "w", encoding="utf-8") as marker:
+            marker.write(str(end))
+            marker.flush()
+            os.fsync(marker.fileno())
+
+        f.seek(end)
+        f.write((body + "\n]").encode("utf-8"))
+        f.truncate()
+        f.flush()
+        os.fsync(f.fileno())
+
+    os.remove(f"{path}.append")
+
+
+def append_unique(records: List[Dict[str, Any]], path: str, key: str) -> int:
+    """
+    Append records whose key is not already in the file, re-reading it under
+    the lock so writes from other processes are never lost.
+    """
+    with locked(path):
+        existing = load_records(path)
+        seen = {r[key] for r in existing}
+        added = []
+
+        for r in records:
+            if r[key] in seen:
+                continue
+            added.append(r)
+            seen.add(r[key])
+
+        if added:
+            save_records(existing + added, path)
+
+    return len(added)
+
+
+# -----------------------------
+# PAGE LOG
+# -----------------------------
+
+
+class PageLog:
+    """
+    Pages of records staged in an NDJSON side log (<path>.pages) and merged
+    into the output file in batches, so a long backfill does not re-read and
+    rewrite the whole file for every page.
+
+    append() makes a page durable (fsync) and merges once `every` pages are
+    staged; flush() merges whatever is staged, including pages left by a run
+    that died before merging. merge(records) does the actual write, under
+    the output file's lock (KeyIndex.append, deployment_store.merge_records)
+    and must be idempotent, since a resumed fetch stages its last page again.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        merge: Callable[[List[Dict[str, Any]]], int],
+        every: int = MERGE_EVERY_PAGES,
+    ) -> None:
+        self.path = path
+        self.log_path = f"{path}.pages"
+        self.merge = merge
+        self.every = every
+        self.pages = 0
+
+    def append(self, records: List[Dict[str, Any]]) -> int:
+        """Stage one page. Returns what merge() returned, or 0 if not merged yet."""
+        if not records:
+            return 0
+
+        with locked(self.log_path):
+            with open(self.log_path, "a", encoding="utf-8") as f:
+                # Leading newline: a torn line left by a crash stays its own line.
+                f.write("\n" + "".join(dumps(r) + "\n" for r in records))
+                f.flush()
+                os.fsync(f.fileno())
+
+        self.pages += 1
+        return self.flush() if self.pages >= self.every else 0
+
+    def staged(self) -> List[Dict[str, Any]]:
+        if not os.path.exists(self.log_path):
+            return []
+
+        records = []
+        with open(self.log_path, "rb") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    records.append(loads(line))
+                except ValueError:
+                    # Torn line of a run that died mid-write; its page is
+                    # fetched again on resume.
+                    continue
+        return records
+
+    def flush(self) -> int:
+        with locked(self.log_path):
+            records = self.staged()
+            merged = self.merge(records) if records else 0
+            if os.path.exists(self.log_path):
+                os.remove(self.log_path)
+
+        self.pages = 0
+        return merged
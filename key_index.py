@@ -0,0 +1,462 @@
+"""
+Persistent per-repo dedup index of commit SHAs and numeric ids
+
+Replaces rebuilding a set of every key from the whole JSON output file on
+each run. For each key space (one output file) and repo there is:
+
+  <repo>.idx  sorted fixed-width keys (20-byte SHAs, 8-byte big-endian ids),
+              memory-mapped and searched by bisection
+  <repo>.log  keys added since the last merge, appended raw; read into an
+              in-memory delta and merged into .idx once it reaches MAX_DELTA
+
+and one manifest.json per key space holding where the output file's array
+ended when it was last indexed, plus caller metadata (checkpoints).
+A Bloom filter over the whole key space (filter.bloom) is consulted first,
+so lookups of new keys, the common case, do not touch the mapped files.
+Opening an index reads neither the .idx files nor the part of the output
+file already indexed: records other writers appended since are read from
+that offset on and indexed. Only when the bytes before the offset changed
+(a full refresh rewrote the file) is the index rebuilt from the file.
+
+Merges go through KeyIndex.append, which checks keys against the index and
+appends only the new records, under the output file's lock, so a merge
+neither reads nor rewrites the file.
+"""
+
+import os
+import json
+import mmap
+import struct
+import hashlib
+import threading
+from bisect import bisect_left
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional
+
+import json_store
+from bloom_filter import ScalableBloomFilter
+
+# -----------------------------
+# CONFIG
+# -----------------------------
+
+INDEX_DIR = "key_indexes"
+
+MAGIC = b"KIX1"
+HEADER = struct.Struct("<4sHQ")  # magic, key width, count
+
+MAX_DELTA = int(os.getenv("KEY_INDEX_MAX_DELTA", "4096"))
+
+SHA_WIDTH = 20
+ID_WIDTH = 8
+
+# Bytes before the end of the indexed array that must be unchanged for the
+# file to count as appended to rather than rewritten.
+FINGERPRINT_BYTES = 64
+
+# -----------------------------
+# KEY ENCODING
+# -----------------------------
+
+
+def sha_key(sha: str) -> bytes:
+    try:
+        key = bytes.fromhex(sha)
+    except ValueError:
+        key = b""
+    # Abbreviated or non-hex values still need a fixed width.
+    return key if len(key) == SHA_WIDTH else hashlib.sha1(sha.encode()).digest()
+
+
+def id_key(value: int) -> bytes:
+    # Big-endian, so byte order is numeric order.
+    return int(value).to_bytes(ID_WIDTH, "big")
+
+
+# -----------------------------
+# SORTED KEY FILE
+# -----------------------------
+
+
+class _Entries:
+    """A mapped .idx viewed as a sequence of keys, for bisect."""
+
+    __slots__ = ("buf", "width", "count")
+
+    def __init__(self, buf: Any, width: int, count: int) -> None:
+        self.buf = buf
+        self.width = width
+        self.count = count
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __getitem__(self, i: int) -> bytes:
+        start = HEADER.size + i * self.width
+        return bytes(self.buf[start : start + self.width])
+
+
+class SortedKeyFile:
+    def __init__(self, path: str, width: int) -> None:
+        self.path = path
+        self.log_path = f"{path[: -len('.idx')]}.log"
+        self.width = width
+
+        self._file = None
+        self._map: Optional[mmap.mmap] = None
+        self._entries = _Entries(b"", width, 0)
+        self.delta: set = set()
+
+        self._open()
+
+    def _open(self) -> None:
+        self.close()
+
+        if os.path.exists(self.path) and os.path.getsize(self.path) > HEADER.size:
+            self._file = open(self.path, "rb")
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            magic, width, count = HEADER.unpack_from(self._map)
+            if magic != MAGIC or width != self.width:
+                raise ValueError(f"Not a {self.width}-byte key index: {self.path}")
+            self._entries = _Entries(self._map, width, count)
+        else:
+            self._entries = _Entries(b"", self.width, 0)
+
+        self.delta = set()
+        if os.path.exists(self.log_path):
+            with open(self.log_path, "rb") as f:
+                raw = f.read()
+            usable = len(raw) - len(raw) % self.width  # torn last write
+            self.delta = {
+                raw[i : i + self.width] for i in range(0, usable, self.width)
+            }
+
+    def close(self) -> None:
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def __len__(self) -> int:
+        return len(self._entries) + len(self.delta)
+
+    def __iter__(self) -> Iterator[bytes]:
+        for i in range(len(self._entries)):
+            yield self._entries[i]
+        yield from self.delta
+
+    def __contains__(self, key: bytes) -> bool:
+        if key in self.delta:
+            return True
+        i = bisect_left(self._entries, key)
+        return i < len(self._entries) and self._entries[i] == key
+
+    def add(self, keys: Iterable[bytes]) -> None:
+        new = [k for k in set(keys) if k not in self]
+        if not new:
+            return
+
+        with open(self.log_path, "ab") as f:
+            f.write(b"".join(new))
+        self.delta.update(new)
+
+        if len(self.delta) >= MAX_DELTA:
+            self.merge()
+
+    def merge(self) -> None:
+        """Fold the delta into a new .idx in one linear pass, then drop the log."""
+        if not self.delta:
+            return
+
+        entries = self._entries
+        width = self.width
+        tmp_path = f"{self.path}.tmp"
+
+        def span(lo: int, hi: int) -> bytes:
+            return entries.buf[HEADER.size + lo * width : HEADER.size + hi * width]
+
+        with open(tmp_path, "wb") as f:
+            f.write(HEADER.pack(MAGIC, width, len(entries) + len(self.delta)))
+            prev = 0
+            for key in sorted(self.delta):
+                i = bisect_left(entries, key, prev)
+                f.write(span(prev, i))
+                f.write(key)
+                prev = i
+            f.write(span(prev, len(entries)))
+
+        self.close()
+        os.replace(tmp_path, self.path)
+        if os.path.exists(self.log_path):
+            os.remove(self.log_path)
+        self._open()
+
+    @classmethod
+    def write(cls, path: str, width: int, keys: Iterable[bytes]) -> None:
+        ordered = sorted(set(keys))
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(HEADER.pack(MAGIC, width, len(ordered)))
+            f.write(b"".join(ordered))
+        os.replace(tmp_path, path)
+
+        log_path = f"{path[: -len('.idx')]}.log"
+        if os.path.exists(log_path):
+            os.remove(log_path)
+
+
+# -----------------------------
+# KEY SPACE
+# -----------------------------
+
+
+def _mark(path: str, end: Optional[int] = None) -> Optional[Dict[str, Any]]:
+    """Where the array in path ends, and a fingerprint of the bytes before that."""
+    if not os.path.exists(path):
+        return None
+    if end is None:
+        end = json_store.array_end(path)
+    with open(path, "rb") as f:
+        f.seek(max(0, end - FINGERPRINT_BYTES))
+        head = f.read(min(end, FINGERPRINT_BYTES))
+    return {"end": end, "fingerprint": hashlib.sha1(head).hexdigest()}
+
+
+def _extends(path: str, mark: Any) -> bool:
+    """True if path is still the array of mark, possibly with records appended."""
+    if not os.path.exists(path):
+        return mark is None
+    # None: the file did not exist yet; a list: a manifest from before marks.
+    if not isinstance(mark, dict) or os.path.getsize(path) <= mark["end"]:
+        return False
+    return _mark(path, mark["end"]) == mark
+
+
+class KeyIndex:
+    """
+    The per-repo indexes of one output file. repo_of maps a record to its
+    repo key, key_of to its encoded key; update_meta (optional) folds records
+    written to the file into the metadata kept in the manifest.
+    """
+
+    def __init__(
+        self,
+        space: str,
+        source_path: str,
+        width: int,
+        repo_of: Callable[[Dict[str, Any]], str],
+        key_of: Callable[[Dict[str, Any]], bytes],
+        update_meta: Optional[Callable[[Dict[str, Any], List[Dict[str, Any]]], None]] = None,
+        directory: str = INDEX_DIR,
+    ) -> None:
+        self.space = space
+        self.source_path = source_path
+        self.width = width
+        self.repo_of = repo_of
+        self.key_of = key_of
+        self.update_meta = update_meta
+
+        self.dir = os.path.join(directory, space)
+        self.manifest_path = os.path.join(self.dir, "manifest.json")
+        self.filter_path = os.path.join(self.dir, "filter.bloom")
+        self.meta: Dict[str, Any] = {}
+        self.source: Optional[Dict[str, Any]] = None
+        self.filter = ScalableBloomFilter()
+        self._files: Dict[str, SortedKeyFile] = {}
+        # Receivers look keys up from request threads while a worker writes.
+        self._lock = threading.RLock()
+
+        self.lookups = 0
+        self.filtered = 0
+
+    def _stem(self, repo: str) -> str:
+        return repo.replace("/", "__")
+
+    def _path(self, repo: str) -> str:
+        return os.path.join(self.dir, self._stem(repo) + ".idx")
+
+    def _filter_key(self, repo: str, key: bytes) -> bytes:
+        return self._stem(repo).encode() + b"\0" + key
+
+    def _file(self, repo: str) -> SortedKeyFile:
+        f = self._files.get(repo)
+        if f is None:
+            f = self._files[repo] = SortedKeyFile(self._path(repo), self.width)
+        return f
+
+    def _read_manifest(self) -> Dict[str, Any]:
+        if not os.path.exists(self.manifest_path):
+            return {}
+        with open(self.manifest_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def _write_manifest(self) -> None:
+        tmp_path = f"{self.manifest_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"source": self.source, "meta": self.meta}, f, indent=2)
+        os.replace(tmp_path, self.manifest_path)
+
+    def open(self) -> bool:
+        """
+        Load the manifest and index what was appended to the source since.
+        The index is rebuilt only if the source was rewritten. True if rebuilt.
+        """
+        os.makedirs(self.dir, exist_ok=True)
+
+        with self._lock, json_store.locked(self.source_path), json_store.locked(
+            self.manifest_path
+        ):
+            return self._load(self._read_manifest())
+
+    def _load(self, manifest: Dict[str, Any]) -> bool:
+        json_store.recover_append(self.source_path)
+
+        self.source = manifest.get("source")
+        if not _extends(self.source_path, self.source):
+            self._rebuild()
+            return True
+
+        self.meta = manifest.get("meta", {})
+        self.close()
+        if os.path.exists(self.filter_path):
+            self.filter = ScalableBloomFilter.load(self.filter_path)
+        else:
+            self._rebuild_filter()
+
+        if self._index_tail():
+            self._save()
+        return False
+
+    def _index_tail(self) -> bool:
+        """Index the records appended to the source after self.source. True if any."""
+        if self.source is None:
+            return False
+
+        records, end = json_store.load_tail(self.source_path, self.source["end"])
+        if records:
+            self.add(records)
+            if self.update_meta:
+                self.update_meta(self.meta, records)
+        self.source = _mark(self.source_path, end)
+        return bool(records)
+
+    def _rebuild(self) -> None:
+        print(f"Rebuilding {self.space} key index from {self.source_path}")
+        records = json_store.load_records(self.source_path)
+
+        by_repo: Dict[str, List[bytes]] = {}
+        for r in records:
+            try:
+                by_repo.setdefault(self.repo_of(r), []).append(self.key_of(r))
+            except KeyError:
+                # Legacy rows without a repo or key are not indexed.
+                continue
+
+        self.close()
+        for name in os.listdir(self.dir):
+            if name.endswith((".idx", ".log")):
+                os.remove(os.path.join(self.dir, name))
+        for repo, keys in by_repo.items():
+            SortedKeyFile.write(self._path(repo), self.width, keys)
+
+        self.filter = ScalableBloomFilter()
+        for repo, keys in by_repo.items():
+            self.filter.update(self._filter_key(repo, k) for k in keys)
+
+        self.meta = {}
+        if self.update_meta:
+            self.update_meta(self.meta, records)
+        self.source = _mark(self.source_path)
+        self._save()
+
+    def _rebuild_filter(self) -> None:
+        # From the index files (an index written before filters existed).
+        self.filter = ScalableBloomFilter()
+        for name in os.listdir(self.dir):
+            if name.endswith(".idx"):
+                stem = name[: -len(".idx")]
+                keys = SortedKeyFile(os.path.join(self.dir, name), self.width)
+                self.filter.update(stem.encode() + b"\0" + k for k in keys)
+                keys.close()
+        self.filter.save(self.filter_path)
+
+    def _save(self) -> None:
+        self.filter.save(self.filter_path)
+        self._write_manifest()
+
+    def contains(self, repo: str, key: bytes) -> bool:
+        with self._lock:
+            self.lookups += 1
+            if self._filter_key(repo, key) not in self.filter:
+                self.filtered += 1
+                return False
+            return key in self._file(repo)
+
+    def _indexed(self, repo: str, key: bytes) -> bool:
+        # contains() without counting toward the lookup stats.
+        return self._filter_key(repo, key) in self.filter and key in self._file(repo)
+
+    def add(self, records: List[Dict[str, Any]]) -> None:
+        """
+        Index records written to the source. Only the per-repo logs are
+        written; the filter and manifest are saved with the source's offset.
+        """
+        by_repo: Dict[str, List[bytes]] = {}
+        for r in records:
+            by_repo.setdefault(self.repo_of(r), []).append(self.key_of(r))
+
+        with self._lock:
+            for repo, keys in by_repo.items():
+                self._file(repo).add(keys)
+                self.filter.update(self._filter_key(repo, k) for k in keys)
+
+    def append(self, records: List[Dict[str, Any]]) -> int:
+        """
+        Append the records whose keys are not indexed yet to the source and
+        index them, without reading what the source already holds. Returns
+        how many were appended.
+        """
+        os.makedirs(self.dir, exist_ok=True)
+
+        with self._lock, json_store.locked(self.source_path), json_store.locked(
+            self.manifest_path
+        ):
+            manifest = self._read_manifest()
+            if manifest.get("source") != self.source:
+                # Another process appended and indexed; pick its logs up.
+                self._load(manifest)
+            elif not _extends(self.source_path, self.source):
+                self._rebuild()
+            else:
+                self._index_tail()
+
+            new = []
+            seen = set()
+            for r in records:
+                repo, key = self.repo_of(r), self.key_of(r)
+                if (repo, key) in seen or self._indexed(repo, key):
+                    continue
+                seen.add((repo, key))
+                new.append(r)
+
+            json_store.append_records(new, self.source_path)
+            self.add(new)
+            if new and self.update_meta:
+                self.update_meta(self.meta, new)
+            self.source = _mark(self.source_path)
+            self._save()
+
+        return len(new)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "lookups": self.lookups,
+            "filtered": self.filtered,
+            "filter_keys": len(self.filter),
+        }
+
+    def close(self) -> None:
+        for f in self._files.values():
+            f.close()
+        self._files = {}
@@ -0,0 +1,422 @@
+"""
+DORA lead time for changes: commits / merged PRs -> first successful deployment
+
+Deployments are joined to commits and PRs with hash joins on (owner, repo,
+SHA). Rows without an exact SHA match fall back to the first successful
+deployment of the same repo/branch at or after the change, located for a
+whole branch at once with numpy.searchsorted. Time deltas are computed on
+int64 epoch microsecond arrays built from the records' *_us columns
+(timestamps.py), so older records without them are the only ones parsed.
+Records whose timestamp is missing or does not parse are left out.
+
+When a repo has a commit graph (commit_graph.py), each deployment's newly
+shipped commits are the range between it and the previous deployment of
+the same environment, which attributes every ancestor to the first
+deployment that actually contained it.
+"""
+
+import json
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+import commit_graph
+import json_store
+from timestamps import US_PER_SECOND, epoch_of
+
+# -----------------------------
+# CONFIG
+# -----------------------------
+
+COMMITS_FILE = "github_commits_branch_aware.json"
+DEPLOYMENTS_FILE = "github_deployments_multi_repo.json"
+PRS_FILE = "github_pr_merged_events.json"
+
+OUTPUT_FILE = "lead_time_metrics.json"
+
+# Owner of records written before they carried one.
+REPO_OWNER = "hrishi-york"
+
+# GitHub flips a successful deployment to "inactive" once a newer one
+# succeeds in the same environment, so both count as shipped.
+SUCCESS_STATES = {"success", "inactive"}
+
+MATCH_NONE = 0
+MATCH_BRANCH = 1
+MATCH_ANCESTRY = 2
+MATCH_SHA = 3
+
+MATCH_LABELS = {MATCH_BRANCH: "branch", MATCH_ANCESTRY: "ancestry", MATCH_SHA: "sha"}
+
+# -----------------------------
+# DEPLOYMENT INDEXES
+# -----------------------------
+
+# (owner, name): repos with the same name under other owners stay apart.
+Repo = Tuple[str, str]
+RepoSha = Tuple[str, str, str]
+RepoRef = Tuple[str, str, str]
+
+
+def repo_of(record: Dict[str, Any]) -> Repo:
+    return record.get("repo_owner", REPO_OWNER), record["repo_name"]
+
+
+def _epoch(record: Dict[str, Any], field: str) -> Optional[int]:
+    try:
+        return epoch_of(record, field)
+    except (TypeError, ValueError):
+        return None
+
+
+def with_time(records: List[Dict[str, Any]], field: str) -> List[Dict[str, Any]]:
+    """The records whose field holds a parseable timestamp."""
+    return [r for r in records if _epoch(r, field) is not None]
+
+
+def successful_deployments(deployments: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    return with_time(
+        [d for d in deployments if d.get("status") in SUCCESS_STATES],
+        "deployment_created_at",
+    )
+
+
+def build_sha_index(
+    deployments: List[Dict[str, Any]],
+) -> Dict[RepoSha, Tuple[int, int]]:
+    """(repo, sha) -> (epoch_us, deployment_id) of its first successful deployment"""
+    index: Dict[RepoSha, Tuple[int, int]] = {}
+
+    for d in deployments:
+        key = (*repo_of(d), d["commit_sha"])
+        deployed_at = epoch_of(d, "deployment_created_at")
+
+        if key not in index or deployed_at < index[key][0]:
+            index[key] = (deployed_at, d["deployment_id"])
+
+    return index
+
+
+def build_ancestry_index(
+    deployments: List[Dict[str, Any]], graphs: Dict[Repo, commit_graph.CommitGraph]
+) -> Dict[RepoSha, Tuple[int, int]]:
+    """(repo, sha) -> (epoch_us, deployment_id) of the first successful deployment containing it"""
+    grouped: Dict[Tuple[Repo, str], List[Tuple[int, int, str]]] = defaultdict(list)
+
+    for d in deployments:
+        repo = repo_of(d)
+        if repo in graphs:
+            grouped[(repo, d["environment"])].append(
+                (
+                    epoch_of(d, "deployment_created_at"),
+                    d["deployment_id"],
+                    d["commit_sha"],
+                )
+            )
+
+    index: Dict[RepoSha, Tuple[int, int]] = {}
+
+    for (repo, _), rows in grouped.items():
+        graph = graphs[repo]
+        previous_sha = None
+
+        for deployed_at, deployment_id, sha in sorted(rows):
+            for shipped_sha in graph.range(previous_sha, sha):
+                key = (*repo, shipped_sha)
+                if key not in index or deployed_at < index[key][0]:
+                    index[key] = (deployed_at, deployment_id)
+            previous_sha = sha
+
+    return index
+
+
+def build_ref_timelines(
+    deployments: List[Dict[str, Any]],
+) -> Dict[RepoRef, Tuple[np.ndarray, np.ndarray]]:
+    """(repo, ref) -> (sorted deployment times, matching deployment ids)"""
+    grouped: Dict[RepoRef, List[Tuple[int, int]]] = defaultdict(list)
+
+    for d in deployments:
+        grouped[(*repo_of(d), d["ref"])].append(
+            (epoch_of(d, "deployment_created_at"), d["deployment_id"])
+        )
+
+    timelines = {}
+    for key, rows in grouped.items():
+        rows.sort()
+        timelines[key] = (
+            np.fromiter((t for t, _ in rows), dtype=np.int64, count=len(rows)),
+            np.fromiter((i for _, i in rows), dtype=np.int64, count=len(rows)),
+        )
+
+    return timelines
+
+
+# -----------------------------
+# CORE JOIN
+# -----------------------------
+
+
+def _first_deployment_after(
+    keys: List[RepoRef],
+    change_times: np.ndarray,
+    timelines: Dict[RepoRef, Tuple[np.ndarray, np.ndarray]],
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    For each change, the first deployment of its (repo, ref) at or after the
+    change time. Missing matches are -1.
+    """
+    deployed_at = np.full(len(keys), -1, dtype=np.int64)
+    deployment_ids = np.full(len(keys), -1, dtype=np.int64)
+
+    groups: Dict[RepoRef, List[int]] = defaultdict(list)
+    for i, key in enumerate(keys):
+        groups[key].append(i)
+
+    for key, rows in groups.items():
+        timeline = timelines.get(key)
+        if timeline is None:
+            continue
+
+        times, ids = timeline
+        rows_arr = np.asarray(rows, dtype=np.int64)
+        pos = np.searchsorted(times, change_times[rows_arr], side="left")
+        hit = pos < len(times)
+
+        deployed_at[rows_arr[hit]] = times[pos[hit]]
+        deployment_ids[rows_arr[hit]] = ids[pos[hit]]
+
+    match = np.where(deployed_at >= 0, MATCH_BRANCH, MATCH_NONE).astype(np.int8)
+    return deployed_at, deployment_ids, match
+
+
+def _apply_index(
+    shas: List[RepoSha],
+    index: Dict[RepoSha, Tuple[int, int]],
+    deployed_at: np.ndarray,
+    deployment_ids: np.ndarray,
+    match: np.ndarray,
+    code: int,
+) -> None:
+    # Hash-join hits override weaker matches, never stronger ones.
+    for i, key in enumerate(shas):
+        hit = index.get(key)
+        if hit is not None and code > match[i]:
+            deployed_at[i], deployment_ids[i] = hit
+            match[i] = code
+
+
+def _match(
+    keys: List[RepoRef],
+    shas: List[RepoSha],
+    change_times: np.ndarray,
+    shipped: List[Dict[str, Any]],
+    graphs: Optional[Dict[Repo, commit_graph.CommitGraph]],
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    deployed_at, deployment_ids, match = _first_deployment_after(
+        keys, change_times, build_ref_timelines(shipped)
+    )
+    _apply_index(
+        shas, build_sha_index(shipped), deployed_at, deployment_ids, match, MATCH_SHA
+    )
+    if graphs:
+        _apply_index(
+            shas,
+            build_ancestry_index(shipped, graphs),
+            deployed_at,
+            deployment_ids,
+            match,
+            MATCH_ANCESTRY,
+        )
+    return deployed_at, deployment_ids, match
+
+
+def _rows(
+    base: List[Dict[str, Any]],
+    change_times: np.ndarray,
+    deployed_at: np.ndarray,
+    deployment_ids: np.ndarray,
+    match: np.ndarray,
+    created_at_by_id: Dict[int, str],
+) -> List[Dict[str, Any]]:
+    lead_seconds = ((deployed_at - change_times) / US_PER_SECOND).tolist()
+    deployed = (deployed_at >= 0).tolist()
+    ids = deployment_ids.tolist()
+    codes = match.tolist()
+
+    rows = []
+    for i, row in enumerate(base):
+        if deployed[i]:
+            row["deployment_id"] = ids[i]
+            row["deployed_at"] = created_at_by_id[ids[i]]
+            row["lead_time_seconds"] = lead_seconds[i]
+            row["match"] = MATCH_LABELS[codes[i]]
+        else:
+            row["deployment_id"] = None
+            row["deployed_at"] = None
+            row["lead_time_seconds"] = None
+            row["match"] = None
+        rows.append(row)
+
+    return rows
+
+
+# -----------------------------
+# PUBLIC API
+# -----------------------------
+
+
+def commit_lead_times(
+    commits: List[Dict[str, Any]],
+    deployments: List[Dict[str, Any]],
+    graphs: Optional[Dict[Repo, commit_graph.CommitGraph]] = None,
+) -> List[Dict[str, Any]]:
+    """One row per (repo, commit_sha), lead time to its first successful deployment."""
+    shipped = successful_deployments(deployments)
+
+    # Branch-aware history repeats a commit per branch; keep one row each.
+    unique: Dict[RepoSha, Dict[str, Any]] = {}
+    for c in with_time(commits, "commit_timestamp"):
+        unique.setdefault((*repo_of(c), c["commit_sha"]), c)
+    commits = list(unique.values())
+
+    change_times = np.fromiter(
+        (epoch_of(c, "commit_timestamp") for c in commits),
+        dtype=np.int64,
+        count=len(commits),
+    )
+
+    deployed_at, deployment_ids, match = _match(
+        [(*repo_of(c), c["branch"]) for c in commits],
+        list(unique.keys()),
+        change_times,
+        shipped,
+        graphs,
+    )
+
+    base = [
+        {
+            "repo_owner": repo_of(c)[0],
+            "repo_name": c["repo_name"],
+            "commit_sha": c["commit_sha"],
+            "branch": c["branch"],
+            "commit_timestamp": c["commit_timestamp"],
+        }
+        for c in commits
+    ]
+
+    return _rows(
+        base,
+        change_times,
+        deployed_at,
+        deployment_ids,
+        match,
+        {d["deployment_id"]: d["deployment_created_at"] for d in shipped},
+    )
+
+
+def pr_lead_times(
+    prs: List[Dict[str, Any]],
+    deployments: List[Dict[str, Any]],
+    graphs: Optional[Dict[Repo, commit_graph.CommitGraph]] = None,
+) -> List[Dict[str, Any]]:
+    """One row per merged PR, lead time from merge to its first successful deployment."""
+    shipped = successful_deployments(deployments)
+
+    merged = with_time(prs, "merged_at")
+
+    change_times = np.fromiter(
+        (epoch_of(p, "merged_at") for p in merged),
+        dtype=np.int64,
+        count=len(merged),
+    )
+
+    deployed_at, deployment_ids, match = _match(
+        [(*repo_of(p), p.get("target_branch") or p.get("base_ref")) for p in merged],
+        [(*repo_of(p), p.get("merge_commit_sha")) for p in merged],
+        change_times,
+        shipped,
+        graphs,
+    )
+
+    base = [
+        {
+            "repo_owner": repo_of(p)[0],
+            "repo_name": p["repo_name"],
+            "pr_id": p["pr_id"],
+            "pr_number": p["pr_number"],
+            "merge_commit_sha": p.get("merge_commit_sha"),
+            "merged_at": p["merged_at"],
+        }
+        for p in merged
+    ]
+
+    return _rows(
+        base,
+        change_times,
+        deployed_at,
+        deployment_ids,
+        match,
+        {d["deployment_id"]: d["deployment_created_at"] for d in shipped},
+    )
+
+
+def summarize(rows: List[Dict[str, Any]]) -> Dict[str, Dict[str, Optional[float]]]:
+    by_repo: Dict[str, List[float]] = defaultdict(list)
+    totals: Dict[str, int] = defaultdict(int)
+
+    for r in rows:
+        owner, name = repo_of(r)
+        # Bare names for the default owner, as in the ingesters' checkpoints.
+        repo = name if owner == REPO_OWNER else f"{owner}/{name}"
+        totals[repo] += 1
+        if r["lead_time_seconds"] is not None:
+            by_repo[repo].append(r["lead_time_seconds"])
+
+    summary = {}
+    for repo, total in totals.items():
+        values = np.asarray(by_repo.get(repo, []), dtype=np.float64)
+        summary[repo] = {
+            "changes": total,
+            "deployed": int(values.size),
+            "median_seconds": float(np.median(values)) if values.size else None,
+            "p90_seconds": float(np.percentile(values, 90)) if values.size else None,
+            "mean_seconds": float(values.mean()) if values.size else None,
+        }
+
+    return summary
+
+
+# -----------------------------
+# MAIN
+# -----------------------------
+
+if __name__ == "__main__":
+
+    commits = json_store.load_records(COMMITS_FILE)
+    deployments = json_store.load_records(DEPLOYMENTS_FILE)
+    prs = json_store.load_records(PRS_FILE)
+
+    graphs = {
+        (owner, name): commit_graph.load_graph(owner, name)
+        for owner, name in {repo_of(d) for d in deployments}
+        if commit_graph.has_graph(owner, name)
+    }
+
+    commit_rows = commit_lead_times(commits, deployments, graphs)
+    pr_rows = pr_lead_times(prs, deployments, graphs)
+
+    result = {
+        "commits": summarize(commit_rows),
+        "pull_requests": summarize(pr_rows),
+        "commit_lead_times": commit_rows,
+        "pr_lead_times": pr_rows,
+    }
+
+    with open(OUTPUT_FILE, "w", encoding="utf-8") as f:
+        json.dump(result, f, indent=2)
+
+    print("-----------------------------------")
+    print(json.dumps({k: result[k] for k in ("commits", "pull_requests")}, indent=2))
+    print(f"Output file: {OUTPUT_FILE}")
@@ -1,6 +1,7 @@
 import hmac
 import hashlib
 from flask import Flask, request, abort, jsonify
+from payload_decoder import decode, PUSH_SCHEMA
 
 app = Flask(__name__)
 
@@ -30,11 +31,15 @@ def webhook():
     verify_signature(request)
 
     event = request.headers.get("X-GitHub-Event")
-    payload = request.get_json()
 
     if event != "push":
         return jsonify({"status": "ignored", "event": event}), 200
 
+    try:
+        payload = decode(request.get_data(), PUSH_SCHEMA)
+    except ValueError:
+        abort(400)
+
     repo_name = payload["repository"]["full_name"]
 
     ref = payload["ref"]
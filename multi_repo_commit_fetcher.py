@@ -1,24 +1,38 @@
 """
 Branch-aware commit ingestion for multiple GitHub repositories
+
+Run plainly for a full refresh of REPOSITORIES, streamed to OUTPUT_FILE
+while later pages are still downloading, or with --backfill
+[repo ...] to onboard repos with long histories: each branch's lifetime is
+split into since/until windows holding about BACKFILL_WINDOW_COMMITS
+commits each (estimated from the commit count, then probed and split where
+history is denser), the windows are fetched in parallel, and each window's
+commits are staged durably (json_store.PageLog, merged into OUTPUT_FILE in
+batches) and recorded as complete in BACKFILL_STATE_FILE, so a restarted
+backfill only fetches what is left.
 """
 
 import os
+import sys
 import json
-import requests
-from datetime import datetime, timezone
-from typing import List, Dict, Any, Optional
-from dotenv import load_dotenv
-
-load_dotenv()
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timedelta, timezone
+from typing import List, Dict, Any, Iterable, Iterator, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+import commit_graph
+import json_store
+from github_client import get_client, github_get
+from payload_decoder import BRANCH_LIST_SCHEMA, COMMIT_LIST_SCHEMA, decode
+from pipeline import batched, prefetch
+from incremental_commits_fetch import page_log, state as commit_state
+from records import CommitRecord
+from timestamps import normalize, now_iso
 
 # -----------------------------
 # CONFIG
 # -----------------------------
 
-ACCESS_TOKEN = os.getenv("ACCESS_TOKEN")
-if not ACCESS_TOKEN:
-    raise RuntimeError("ACCESS_TOKEN is not set")
-
 REPO_OWNER = "hrishi-york"
 
 REPOSITORIES = [
@@ -28,37 +42,20 @@ REPOSITORIES = [
 ]
 
 OUTPUT_FILE = "github_commits_branch_aware.json"
+BACKFILL_STATE_FILE = "commit_backfill_state.json"
 
 BASE_URL = "https://api.github.com/repos"
 PER_PAGE = 100
-TIMEOUT = 10
-
-HEADERS = {
-    "Authorization": f"token {ACCESS_TOKEN}",
-    "Accept": "application/vnd.github+json",
-    "X-GitHub-Api-Version": "2022-11-28",
-}
-
-session = requests.Session()
-session.headers.update(HEADERS)
-
-# -----------------------------
-# CORE HTTP HELPER
-# -----------------------------
-
-
-def github_get(url: str, params: Optional[Dict[str, Any]] = None) -> Any:
-    r = session.get(url, params=params, timeout=TIMEOUT)
-
-    if r.status_code == 404:
-        return None
 
-    if r.status_code == 401:
-        raise RuntimeError("Unauthorized: check token permissions")
+BACKFILL_WORKERS = int(os.getenv("BACKFILL_WORKERS", "8"))
+BACKFILL_WINDOW_COMMITS = int(os.getenv("BACKFILL_WINDOW_COMMITS", "1000"))
 
-    r.raise_for_status()
-    return r.json()
+# Probed windows holding more than this many commits are halved, down to
+# MIN_WINDOW.
+MAX_WINDOW_COMMITS = 2 * BACKFILL_WINDOW_COMMITS
+MIN_WINDOW = timedelta(hours=1)
 
+WRITE_BATCH_SIZE = 500
 
 # -----------------------------
 # FETCH BRANCHES
@@ -66,7 +63,9 @@ def github_get(url: str, params: Optional[Dict[str, Any]] = None) -> Any:
 
 
 def fetch_branches(repo_name: str) -> List[str]:
-    data = github_get(f"{BASE_URL}/{REPO_OWNER}/{repo_name}/branches")
+    data = github_get(
+        f"{BASE_URL}/{REPO_OWNER}/{repo_name}/branches", schema=BRANCH_LIST_SCHEMA
+    )
 
     if data is None:
         print(f"⚠️  Skipping repo '{repo_name}' (not found or no access)")
@@ -81,40 +80,285 @@ def fetch_branches(repo_name: str) -> List[str]:
 # -----------------------------
 
 
-def fetch_commits_for_repo_and_branch(
-    repo_name: str, branch: str
-) -> List[Dict[str, Any]]:
+def to_record(c: Dict[str, Any], repo_name: str, branch: str) -> Dict[str, Any]:
+    return normalize({
+        "event_type": "commit",
+        "commit_sha": c["sha"],
+        "commit_timestamp": c["commit"]["author"]["date"],
+        "repo_owner": REPO_OWNER,
+        "repo_name": repo_name,
+        "branch": branch,
+        "author": c["commit"]["author"]["name"].strip("“”\"'"),
+        "author_email": c["commit"]["author"]["email"],
+        "parent_shas": [p["sha"] for p in c["parents"]],
+        "ingested_at": now_iso(),
+    })
+
+
+def iter_commits_for_repo_and_branch(
+    repo_name: str,
+    branch: str,
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+) -> Iterator[Dict[str, Any]]:
 
     page = 1
-    records: List[Dict[str, Any]] = []
 
     while True:
+        params = {"sha": branch, "per_page": PER_PAGE, "page": page}
+        if since:
+            params["since"] = since
+        if until:
+            params["until"] = until
+
         commits = github_get(
             f"{BASE_URL}/{REPO_OWNER}/{repo_name}/commits",
-            params={"sha": branch, "per_page": PER_PAGE, "page": page},
+            params=params,
+            schema=COMMIT_LIST_SCHEMA,
         )
 
         if not commits:
             break
 
         for c in commits:
-            records.append(
-                {
-                    "event_type": "commit",
-                    "commit_sha": c["sha"],
-                    "commit_timestamp": c["commit"]["author"]["date"],
-                    "repo_owner": REPO_OWNER,
-                    "repo_name": repo_name,
-                    "branch": branch,
-                    "author": c["commit"]["author"]["name"].strip("“”\"'"),
-                    "author_email": c["commit"]["author"]["email"],
-                    "ingested_at": datetime.now(timezone.utc).isoformat(),
-                }
-            )
+            yield to_record(c, repo_name, branch)
 
         page += 1
 
-    return records
+
+def fetch_commits_for_repo_and_branch(
+    repo_name: str,
+    branch: str,
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+) -> List[Dict[str, Any]]:
+    return list(iter_commits_for_repo_and_branch(repo_name, branch, since, until))
+
+
+def fetch_window(
+    repo_name: str, branch: str, since: Optional[str], until: Optional[str]
+) -> List[CommitRecord]:
+    # Compact records: finished windows may wait in memory behind others.
+    return [
+        CommitRecord.from_dict(r)
+        for r in iter_commits_for_repo_and_branch(repo_name, branch, since, until)
+    ]
+
+
+def iter_all_commits(repos: List[str]) -> Iterator[Dict[str, Any]]:
+    for repo in repos:
+        print(f"\nProcessing repository: {repo}")
+
+        for branch in fetch_branches(repo):
+            print(f"  ↳ Fetching commits for branch: {branch}")
+            yield from iter_commits_for_repo_and_branch(repo, branch)
+
+
+# -----------------------------
+# BACKFILL WINDOWS
+# -----------------------------
+
+Window = Tuple[Optional[str], Optional[str]]
+
+
+def _parse(ts: str) -> datetime:
+    return datetime.fromisoformat(ts.replace("Z", "+00:00"))
+
+
+def _format(dt: datetime) -> str:
+    return dt.strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def window_key(window: Window) -> str:
+    since, until = window
+    return f"{since or ''}..{until or ''}"
+
+
+def probe_commits(
+    repo_name: str,
+    branch: str,
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+    page: int = 1,
+) -> Tuple[int, Optional[Dict[str, Any]]]:
+    """
+    One per_page=1 request: the number of commits in the window (the Link
+    header's last page) and the commit on the given page.
+    """
+    params = {"sha": branch, "per_page": 1, "page": page}
+    if since:
+        params["since"] = since
+    if until:
+        params["until"] = until
+
+    r = get_client().request(
+        f"{BASE_URL}/{REPO_OWNER}/{repo_name}/commits", params=params
+    )
+
+    # 409: empty repository
+    if r.status_code in (404, 409):
+        return 0, None
+
+    r.raise_for_status()
+    commits = decode(r.content, COMMIT_LIST_SCHEMA)
+
+    last = r.links.get("last")
+    if last is None:
+        count = page if commits else page - 1
+    else:
+        count = int(parse_qs(urlparse(last["url"]).query)["page"][0])
+
+    return count, commits[0] if commits else None
+
+
+def _committed_at(commit: Dict[str, Any]) -> datetime:
+    # since/until filter on the committer date
+    return _parse(commit["commit"]["committer"]["date"])
+
+
+def plan_windows(
+    repo_name: str, branch: str, pool: ThreadPoolExecutor
+) -> List[Window]:
+    count, newest = probe_commits(repo_name, branch)
+    if count <= BACKFILL_WINDOW_COMMITS or newest is None:
+        return [(None, None)]
+
+    _, oldest = probe_commits(repo_name, branch, page=count)
+    start = _committed_at(oldest) if oldest else None
+    end = _committed_at(newest)
+    if start is None or end <= start:
+        return [(None, None)]
+
+    # Even split by the average density first. The outer windows stay
+    # open-ended so nothing outside the probed range is missed.
+    n = -(-count // BACKFILL_WINDOW_COMMITS)
+    span = (end - start) / n
+    bounds = [start + span * i for i in range(1, n)]
+    edges: List[Optional[datetime]] = [None, *bounds, None]
+
+    # Then probe each window and halve the ones where history is denser.
+    while True:
+        windows = list(zip(edges, edges[1:]))
+        counts = pool.map(
+            lambda w: probe_commits(
+                repo_name,
+                branch,
+                _format(w[0]) if w[0] else None,
+                _format(w[1]) if w[1] else None,
+            )[0],
+            windows,
+        )
+
+        split = False
+        refined: List[Optional[datetime]] = [None]
+
+        for (lo, hi), window_count in zip(windows, counts):
+            lo_at, hi_at = lo or start, hi or end
+            if window_count > MAX_WINDOW_COMMITS and hi_at - lo_at > 2 * MIN_WINDOW:
+                refined.append(lo_at + (hi_at - lo_at) / 2)
+                split = True
+            refined.append(hi)
+
+        edges = refined
+        if not split:
+            break
+
+    return [
+        (_format(lo) if lo else None, _format(hi) if hi else None)
+        for lo, hi in zip(edges, edges[1:])
+    ]
+
+
+def load_backfill_state(path: str = BACKFILL_STATE_FILE) -> Dict[str, Any]:
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_backfill_state(state: Dict[str, Any], path: str = BACKFILL_STATE_FILE) -> None:
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(state, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def backfill_branch(
+    repo_name: str,
+    branch: str,
+    state: Dict[str, Any],
+    pool: ThreadPoolExecutor,
+    graph_updates: commit_graph.GraphUpdates,
+) -> int:
+    key = f"{REPO_OWNER}/{repo_name}:{branch}"
+
+    entry = state.get(key)
+    if entry is None:
+        entry = {"windows": plan_windows(repo_name, branch, pool), "done": []}
+        state[key] = entry
+        save_backfill_state(state)
+
+    done = set(entry["done"])
+    pending = [tuple(w) for w in entry["windows"] if window_key(tuple(w)) not in done]
+
+    print(
+        f"  ↳ {branch}: {len(entry['windows'])} windows, {len(pending)} to fetch"
+    )
+
+    futures = {
+        pool.submit(fetch_window, repo_name, branch, *w): w
+        for w in pending
+    }
+
+    written = 0
+
+    # Windows are merged and recorded one at a time, as they complete.
+    for future in as_completed(futures):
+        window = futures[future]
+
+        try:
+            records = future.result()
+        except Exception as e:
+            # Left pending for the next backfill run.
+            print(f"    window {window_key(window)} failed:", e)
+            continue
+
+        new_records = [r.to_dict() for r in records]
+        new_records = [r for r in new_records if commit_state.is_new(r)]
+        if new_records:
+            graph_updates.add(new_records)
+            commit_state.stage(new_records)
+            written += page_log.append(new_records)
+            commit_state.add(new_records)
+
+        entry["done"].append(window_key(window))
+        save_backfill_state(state)
+
+    return written + page_log.flush()
+
+
+def backfill(repos: List[str]) -> int:
+    state = load_backfill_state()
+    # Dedup against the commits key index, shared with incremental_commits_fetch.
+    commit_state.refresh()
+    graph_updates = commit_graph.GraphUpdates()
+    written = 0
+
+    try:
+        with ThreadPoolExecutor(
+            max_workers=BACKFILL_WORKERS, thread_name_prefix="commit-backfill"
+        ) as pool:
+            for repo in repos:
+                print(f"\nBackfilling repository: {repo}")
+                for branch in fetch_branches(repo):
+                    written += backfill_branch(
+                        repo, branch, state, pool, graph_updates
+                    )
+    finally:
+        # Once per run; staged windows are durable, so also after a failure.
+        graph_updates.save()
+
+    return written
 
 
 # -----------------------------
@@ -122,9 +366,21 @@ def fetch_commits_for_repo_and_branch(
 # -----------------------------
 
 
-def write_to_json(records: List[Dict[str, Any]]) -> None:
-    with open(OUTPUT_FILE, "w", encoding="utf-8") as f:
-        json.dump(records, f, indent=2)
+def write_to_json(records: Iterable[Dict[str, Any]]) -> int:
+    """
+    Stream records into OUTPUT_FILE in batches while later pages are still
+    downloading; the file is replaced once the whole refresh succeeded, and
+    the commit graphs built along the way are saved then.
+    """
+    graph_updates = commit_graph.GraphUpdates()
+
+    with json_store.RecordWriter(OUTPUT_FILE) as writer:
+        for batch in batched(records, WRITE_BATCH_SIZE):
+            writer.write(batch)
+            graph_updates.add(batch)
+
+    graph_updates.save()
+    return writer.count
 
 
 # -----------------------------
@@ -132,22 +388,21 @@ def write_to_json(records: List[Dict[str, Any]]) -> None:
 # -----------------------------
 
 if __name__ == "__main__":
-    all_commits: List[Dict[str, Any]] = []
 
-    for repo in REPOSITORIES:
-        print(f"\nProcessing repository: {repo}")
+    if "--backfill" in sys.argv:
+        repos = [a for a in sys.argv[1:] if not a.startswith("--")] or REPOSITORIES
+        written = backfill(repos)
 
-        branches = fetch_branches(repo)
-        if not branches:
-            continue
-
-        for branch in branches:
-            print(f"  ↳ Fetching commits for branch: {branch}")
-            branch_commits = fetch_commits_for_repo_and_branch(repo, branch)
-            all_commits.extend(branch_commits)
+        print("\n-----------------------------------")
+        print(f"New records written: {written}")
+        print(f"Output file: {OUTPUT_FILE}")
+        print(get_client().stats())
+        sys.exit(0)
 
-    write_to_json(all_commits)
+    # One row per (commit, branch), as before: a commit reachable from
+    # several branches is listed under each of them.
+    written = write_to_json(prefetch(iter_all_commits(REPOSITORIES)))
 
     print("\n-----------------------------------")
-    print(f"Total records written: {len(all_commits)}")
+    print(f"Total records written: {written}")
     print(f"Output file: {OUTPUT_FILE}")
@@ -1,24 +1,25 @@
 """
 Fetch deployments from multiple GitHub repositories
+
+Deployments are streamed to OUTPUT_FILE while later pages (and their
+statuses) are still downloading, so memory does not grow with history.
+Status lists that can no longer change come from the immutable cache, so a
+full refresh only requests statuses of recent deployments.
 """
 
-import os
-import json
-import requests
-from datetime import datetime, timezone
-from typing import List, Dict, Any, Optional
-from dotenv import load_dotenv
+from typing import List, Dict, Any, Iterable, Iterator
 
-load_dotenv()
+import json_store
+from deployment_store import statuses_are_final
+from github_client import github_get, github_get_cached
+from payload_decoder import DEPLOYMENT_LIST_SCHEMA, DEPLOYMENT_STATUS_LIST_SCHEMA
+from pipeline import batched, prefetch
+from timestamps import normalize, now_iso
 
 # -----------------------------
 # CONFIG
 # -----------------------------
 
-ACCESS_TOKEN = os.getenv("ACCESS_TOKEN")
-if not ACCESS_TOKEN:
-    raise RuntimeError("ACCESS_TOKEN is not set")
-
 REPO_OWNER = "hrishi-york"
 
 # 👇 MULTIPLE REPOS HERE
@@ -31,48 +32,22 @@ OUTPUT_FILE = "github_deployments_multi_repo.json"
 
 BASE_URL = "https://api.github.com/repos"
 PER_PAGE = 100
-TIMEOUT = 10
-
-HEADERS = {
-    "Authorization": f"token {ACCESS_TOKEN}",
-    "Accept": "application/vnd.github+json",
-    "X-GitHub-Api-Version": "2022-11-28",
-}
-
-session = requests.Session()
-session.headers.update(HEADERS)
-
-# -----------------------------
-# CORE HTTP HELPER
-# -----------------------------
-
-
-def github_get(url: str, params: Optional[Dict[str, Any]] = None) -> Any:
-    r = session.get(url, params=params, timeout=TIMEOUT)
-
-    if r.status_code == 404:
-        return None
-
-    if r.status_code == 401:
-        raise RuntimeError("Unauthorized: check token permissions")
-
-    r.raise_for_status()
-    return r.json()
 
+WRITE_BATCH_SIZE = 500
 
 # -----------------------------
 # FETCH DEPLOYMENTS (PER REPO)
 # -----------------------------
 
 
-def fetch_deployments_for_repo(repo_name: str) -> List[Dict[str, Any]]:
+def iter_deployments_for_repo(repo_name: str) -> Iterator[Dict[str, Any]]:
     page = 1
-    records: List[Dict[str, Any]] = []
 
     while True:
         deployments = github_get(
             f"{BASE_URL}/{REPO_OWNER}/{repo_name}/deployments",
             params={"per_page": PER_PAGE, "page": page},
+            schema=DEPLOYMENT_LIST_SCHEMA,
         )
 
         if not deployments:
@@ -80,37 +55,45 @@ def fetch_deployments_for_repo(repo_name: str) -> List[Dict[str, Any]]:
 
         for d in deployments:
             statuses = (
-                github_get(
-                    f"{BASE_URL}/{REPO_OWNER}/{repo_name}/deployments/{d['id']}/statuses"
+                github_get_cached(
+                    f"{BASE_URL}/{REPO_OWNER}/{repo_name}/deployments/{d['id']}/statuses",
+                    schema=DEPLOYMENT_STATUS_LIST_SCHEMA,
+                    immutable=statuses_are_final,
                 )
                 or []
             )
 
             latest_status = statuses[0] if statuses else {}
 
-            records.append(
-                {
-                    "event_type": "deployment",
-                    "deployment_id": d["id"],
-                    "repo_owner": REPO_OWNER,
-                    "repo_name": repo_name,
-                    "environment": d["environment"],
-                    "ref": d["ref"],
-                    "commit_sha": d["sha"],
-                    "deployment_created_at": d["created_at"],
-                    "status": latest_status.get("state"),
-                    "status_created_at": latest_status.get("created_at"),
-                    "performed_via": (d.get("performed_via_github_app") or {}).get(
-                        "slug"
-                    ),
-                    "creator": d["creator"]["login"],
-                    "ingested_at": datetime.now(timezone.utc).isoformat(),
-                }
-            )
+            yield normalize({
+                "event_type": "deployment",
+                "deployment_id": d["id"],
+                "repo_owner": REPO_OWNER,
+                "repo_name": repo_name,
+                "environment": d["environment"],
+                "ref": d["ref"],
+                "commit_sha": d["sha"],
+                "deployment_created_at": d["created_at"],
+                "status": latest_status.get("state"),
+                "status_created_at": latest_status.get("created_at"),
+                "performed_via": (d.get("performed_via_github_app") or {}).get(
+                    "slug"
+                ),
+                "creator": d["creator"]["login"],
+                "ingested_at": now_iso(),
+            })
 
         page += 1
 
-    return records
+
+def fetch_deployments_for_repo(repo_name: str) -> List[Dict[str, Any]]:
+    return list(iter_deployments_for_repo(repo_name))
+
+
+def iter_all_deployments(repos: List[str]) -> Iterator[Dict[str, Any]]:
+    for repo in repos:
+        print(f"Fetching deployments for repo: {repo}")
+        yield from iter_deployments_for_repo(repo)
 
 
 # -----------------------------
@@ -118,9 +101,13 @@ def fetch_deployments_for_repo(repo_name: str) -> List[Dict[str, Any]]:
 # -----------------------------
 
 
-def write_to_json(records: List[Dict[str, Any]]) -> None:
-    with open(OUTPUT_FILE, "w", encoding="utf-8") as f:
-        json.dump(records, f, indent=2)
+def write_to_json(records: Iterable[Dict[str, Any]]) -> int:
+    # Replaces OUTPUT_FILE only once every repo was fetched.
+    with json_store.RecordWriter(OUTPUT_FILE) as writer:
+        for batch in batched(records, WRITE_BATCH_SIZE):
+            writer.write(batch)
+
+    return writer.count
 
 
 # -----------------------------
@@ -128,15 +115,9 @@ def write_to_json(records: List[Dict[str, Any]]) -> None:
 # -----------------------------
 
 if __name__ == "__main__":
-    all_deployments: List[Dict[str, Any]] = []
-
-    for repo in REPOSITORIES:
-        print(f"Fetching deployments for repo: {repo}")
-        repo_deployments = fetch_deployments_for_repo(repo)
-        all_deployments.extend(repo_deployments)
 
-    write_to_json(all_deployments)
+    written = write_to_json(prefetch(iter_all_deployments(REPOSITORIES)))
 
     print("\n-----------------------------------")
-    print(f"Total deployments written: {len(all_deployments)}")
+    print(f"Total deployments written: {written}")
     print(f"Output file: {OUTPUT_FILE}")
@@ -0,0 +1,226 @@
+"""
+Schema-driven, field-selective decoding of GitHub JSON payloads
+
+A schema is a nested literal describing only the fields a consumer reads:
+
+    {"ref": str, "repository": {"full_name": str}, "commits": [{"id": str}]}
+
+Dicts are objects, one-element lists are arrays of that shape and anything
+else is a leaf type. When msgspec is installed the schema is compiled into
+Struct types so unknown fields are skipped by the parser without ever being
+materialised; otherwise the payload is parsed with orjson / json and then
+projected down to the schema. Either way the caller gets plain dicts.
+
+The same schemas describe the REST list responses the ingesters page
+through (github_client.github_get(url, params, schema=...)). Most of a
+/commits or /pulls item is never read, so skipping it in the parser is
+where most of the decoding time goes.
+"""
+
+import json
+from typing import Any, Dict, List, Optional, Union
+
+try:
+    import msgspec
+except ImportError:  # pragma: no cover - optional speedup
+    msgspec = None
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional speedup
+    orjson = None
+
+Schema = Union[Dict[str, Any], List[Dict[str, Any]]]
+
+# -----------------------------
+# WEBHOOK SCHEMAS
+# -----------------------------
+
+PUSH_SCHEMA = {
+    "ref": str,
+    "before": str,
+    "after": str,
+    "repository": {"full_name": str, "default_branch": str},
+    "commits": [
+        {
+            "id": str,
+            "timestamp": str,
+            "author": {"name": str, "email": str},
+        }
+    ],
+}
+
+DEPLOYMENT_SCHEMA = {
+    "deployment": {
+        "id": int,
+        "environment": str,
+        "ref": str,
+        "sha": str,
+        "created_at": str,
+        "creator": {"login": str},
+    },
+    "repository": {"full_name": str},
+}
+
+DEPLOYMENT_STATUS_SCHEMA = {
+    "deployment_status": {
+        "state": str,
+        "environment": str,
+        "description": str,
+        "log_url": str,
+        "created_at": str,
+        "updated_at": str,
+    },
+    # A deployment first seen through its status still needs these.
+    "deployment": {
+        "id": int,
+        "environment": str,
+        "ref": str,
+        "sha": str,
+        "created_at": str,
+    },
+    "repository": {"full_name": str},
+}
+
+EVENT_SUMMARY_SCHEMA = {
+    "action": str,
+    "repository": {"full_name": str},
+}
+
+# -----------------------------
+# REST RESPONSE SCHEMAS
+# -----------------------------
+
+BRANCH_LIST_SCHEMA = [{"name": str}]
+
+COMMIT_LIST_SCHEMA = [
+    {
+        "sha": str,
+        "commit": {
+            "author": {"name": str, "email": str, "date": str},
+            "committer": {"date": str},
+        },
+        "parents": [{"sha": str}],
+    }
+]
+
+PULL_LIST_SCHEMA = [
+    {
+        "id": int,
+        "number": int,
+        "created_at": str,
+        "updated_at": str,
+        "merged_at": str,
+    }
+]
+
+DEPLOYMENT_LIST_SCHEMA = [
+    {
+        "id": int,
+        "environment": str,
+        "ref": str,
+        "sha": str,
+        "created_at": str,
+        "performed_via_github_app": {"slug": str},
+        "creator": {"login": str},
+    }
+]
+
+DEPLOYMENT_STATUS_LIST_SCHEMA = [{"state": str, "created_at": str}]
+
+# -----------------------------
+# SCHEMA COMPILATION (msgspec)
+# -----------------------------
+
+_decoders: Dict[int, Any] = {}
+
+
+def _struct_for(schema: Dict[str, Any], name: str) -> Any:
+    fields = []
+
+    for key, spec in schema.items():
+        if isinstance(spec, dict):
+            fields.append(
+                (key, Optional[_struct_for(spec, f"{name}_{key}")], None)
+            )
+        elif isinstance(spec, list):
+            item = spec[0]
+            item_type = (
+                _struct_for(item, f"{name}_{key}") if isinstance(item, dict) else item
+            )
+            fields.append(
+                (key, list[item_type], msgspec.field(default_factory=list))
+            )
+        else:
+            fields.append((key, Optional[spec], None))
+
+    return msgspec.defstruct(name, fields)
+
+
+def _decoder_for(schema: Schema) -> Any:
+    decoder = _decoders.get(id(schema))
+    if decoder is None:
+        if isinstance(schema, list):
+            decoder = msgspec.json.Decoder(list[_struct_for(schema[0], "Item")])
+        else:
+            decoder = msgspec.json.Decoder(_struct_for(schema, "Payload"))
+        _decoders[id(schema)] = decoder
+    return decoder
+
+
+# -----------------------------
+# PROJECTION FALLBACK
+# -----------------------------
+
+
+def _mismatch(value: Any, expected: str) -> ValueError:
+    return ValueError(f"expected {expected}, got {type(value).__name__}")
+
+
+def _project(value: Any, spec: Any) -> Any:
+    # Like the msgspec path, null stands for a missing field and any other
+    # value of the wrong type is rejected.
+    if isinstance(spec, dict):
+        if value is None:
+            return None
+        if not isinstance(value, dict):
+            raise _mismatch(value, "object")
+        return {key: _project(value.get(key), sub) for key, sub in spec.items()}
+
+    if isinstance(spec, list):
+        if value is None:
+            return []
+        if not isinstance(value, list):
+            raise _mismatch(value, "array")
+        return [_project(v, spec[0]) for v in value]
+
+    if value is None:
+        return None
+    if isinstance(value, bool) and spec is not bool:
+        raise _mismatch(value, spec.__name__)
+    if spec is float and isinstance(value, int):
+        return float(value)
+    if not isinstance(value, spec):
+        raise _mismatch(value, spec.__name__)
+    return value
+
+
+# -----------------------------
+# PUBLIC API
+# -----------------------------
+
+
+def decode(raw: bytes, schema: Schema) -> Any:
+    """
+    Decode only the fields named in schema, an object (dict) or an array of
+    objects (one-element list). Raises ValueError on malformed JSON or on a
+    field whose type contradicts the schema.
+    """
+    if msgspec is not None:
+        return msgspec.to_builtins(_decoder_for(schema).decode(raw))
+
+    data = orjson.loads(raw) if orjson is not None else json.loads(raw)
+    if not isinstance(data, type(schema)):
+        kind = "array" if isinstance(schema, list) else "object"
+        raise ValueError(f"payload is not a JSON {kind}")
+    return _project(data, schema)
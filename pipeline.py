@@ -0,0 +1,108 @@
+"""
+Streaming stages for source → normalize → dedup → sink ingestion
+
+Fetchers yield records (or pages of records) as they are downloaded instead
+of returning whole lists, and the stages here connect them to storage:
+
+    records = prefetch(iter_records(...))           # download ahead, bounded
+    for batch in batched(dedup(records, "commit_sha", seen), 500):
+        sink(batch)                                 # stored while later pages download
+
+prefetch() runs the source in a background thread behind a bounded queue:
+the download stays at most PIPELINE_BUFFER items ahead of the sink and
+blocks when the sink falls behind, so memory stays flat however long the
+backfill is.
+"""
+
+import os
+import queue
+import threading
+from typing import Any, Dict, Iterable, Iterator, List, Optional, TypeVar
+
+T = TypeVar("T")
+
+# -----------------------------
+# CONFIG
+# -----------------------------
+
+PIPELINE_BUFFER = int(os.getenv("PIPELINE_BUFFER", "4"))
+
+_DONE = object()
+
+# -----------------------------
+# STAGES
+# -----------------------------
+
+
+def prefetch(source: Iterable[T], maxsize: int = PIPELINE_BUFFER) -> Iterator[T]:
+    """
+    Iterate source in a background thread, at most maxsize items ahead of
+    the consumer. Errors in the source are raised to the consumer; a
+    consumer that stops early stops the producer too.
+    """
+    buffer: "queue.Queue[tuple]" = queue.Queue(maxsize)
+    stop = threading.Event()
+
+    def put(item: Any, error: Optional[BaseException] = None) -> bool:
+        while not stop.is_set():
+            try:
+                buffer.put((item, error), timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce() -> None:
+        try:
+            for item in source:
+                if not put(item):
+                    return
+        except BaseException as e:
+            put(_DONE, e)
+            return
+        put(_DONE)
+
+    thread = threading.Thread(target=produce, name="pipeline-prefetch", daemon=True)
+    thread.start()
+
+    try:
+        while True:
+            item, error = buffer.get()
+            if item is _DONE:
+                if error is not None:
+                    raise error
+                return
+            yield item
+    finally:
+        stop.set()
+
+
+def flatten(pages: Iterable[Iterable[T]]) -> Iterator[T]:
+    for page in pages:
+        yield from page
+
+
+def dedup(
+    records: Iterable[Dict[str, Any]], key: str, seen: Optional[set] = None
+) -> Iterator[Dict[str, Any]]:
+    """Drop records whose key is in seen (updated in place) or already passed."""
+    seen = set() if seen is None else seen
+
+    for r in records:
+        if r[key] in seen:
+            continue
+        seen.add(r[key])
+        yield r
+
+
+def batched(items: Iterable[T], size: int) -> Iterator[List[T]]:
+    batch: List[T] = []
+
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+
+    if batch:
+        yield batch
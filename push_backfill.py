@@ -0,0 +1,221 @@
+"""
+Backfill commits dropped from truncated push webhooks
+
+GitHub push payloads carry at most 20 commits. When a push hits that limit
+the receiver hands it to PushBackfill, which asks the compare API for the
+before...after range once and passes only the commits missing from the
+payload to the receiver's sink, off the request path. SHA...SHA ranges never
+change, so they are also kept in the persistent immutable_cache for
+redelivered webhooks and receiver restarts.
+"""
+
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import requests
+from dotenv import load_dotenv
+
+from immutable_cache import get_cache, request_key
+
+load_dotenv()
+
+# -----------------------------
+# CONFIG
+# -----------------------------
+
+ACCESS_TOKEN = os.getenv("ACCESS_TOKEN")
+
+BASE_URL = "https://api.github.com/repos"
+PER_PAGE = 100
+TIMEOUT = 10
+
+PUSH_COMMIT_LIMIT = 20
+ZERO_SHA = "0" * 40
+
+BACKFILL_WORKERS = int(os.getenv("PUSH_BACKFILL_WORKERS", "2"))
+BACKFILL_MAX_PENDING = int(os.getenv("PUSH_BACKFILL_MAX_PENDING", "50"))
+COMPARE_CACHE_SIZE = int(os.getenv("PUSH_BACKFILL_CACHE_SIZE", "1024"))
+
+HEADERS = {
+    "Authorization": f"token {ACCESS_TOKEN}",
+    "Accept": "application/vnd.github+json",
+    "X-GitHub-Api-Version": "2022-11-28",
+}
+
+session = requests.Session()
+session.headers.update(HEADERS)
+
+# -----------------------------
+# CORE HTTP
+# -----------------------------
+
+
+def github_get(url: str, params: Optional[Dict[str, Any]] = None) -> Any:
+    r = session.get(url, params=params, timeout=TIMEOUT)
+
+    if r.status_code == 404:
+        return None
+
+    if r.status_code == 401:
+        raise RuntimeError("Unauthorized: check token permissions")
+
+    r.raise_for_status()
+    return r.json()
+
+
+def fetch_compare_commits(full_name: str, base: str, head: str) -> List[Dict[str, Any]]:
+    """
+    Commits reachable from head but not base, oldest first, in the same
+    shape as push payload commits.
+    """
+    page = 1
+    commits: List[Dict[str, Any]] = []
+
+    while True:
+        data = github_get(
+            f"{BASE_URL}/{full_name}/compare/{base}...{head}",
+            params={"per_page": PER_PAGE, "page": page},
+        )
+
+        if not data or not data.get("commits"):
+            break
+
+        for c in data["commits"]:
+            commits.append(
+                {
+                    "id": c["sha"],
+                    "timestamp": c["commit"]["author"]["date"],
+                    "author": {
+                        "name": c["commit"]["author"]["name"],
+                        "email": c["commit"]["author"]["email"],
+                    },
+                }
+            )
+
+        if len(commits) >= data.get("total_commits", 0):
+            break
+
+        page += 1
+
+    return commits
+
+
+# -----------------------------
+# BACKFILL WORKER
+# -----------------------------
+
+
+def is_truncated(payload: Dict[str, Any]) -> bool:
+    return (
+        len(payload.get("commits") or []) >= PUSH_COMMIT_LIMIT
+        and payload.get("after") not in (None, ZERO_SHA)
+    )
+
+
+class PushBackfill:
+    def __init__(
+        self,
+        sink: Callable[[Dict[str, Any], List[Dict[str, Any]]], None],
+        workers: int = BACKFILL_WORKERS,
+        max_pending: int = BACKFILL_MAX_PENDING,
+        cache_size: int = COMPARE_CACHE_SIZE,
+    ) -> None:
+        self.sink = sink
+        self.enabled = bool(ACCESS_TOKEN)
+        self.cache_size = cache_size
+
+        self._pool = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="push-backfill"
+        )
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._lock = threading.Lock()
+        # (repo, base sha, head sha) -> commits in range
+        self._cache: "OrderedDict[Tuple[str, str, str], List[Dict[str, Any]]]" = (
+            OrderedDict()
+        )
+
+        self.submitted = 0
+        self.dropped = 0
+        self.backfilled_commits = 0
+        self.cache_hits = 0
+        self.failures = 0
+
+        if not self.enabled:
+            print("ACCESS_TOKEN is not set: push backfill disabled")
+
+    def maybe_submit(self, payload: Dict[str, Any]) -> bool:
+        if not self.enabled or not is_truncated(payload):
+            return False
+
+        # Bounded: when saturated, leave the gap to the scheduled sweep.
+        if not self._slots.acquire(blocking=False):
+            self.dropped += 1
+            return False
+
+        self.submitted += 1
+        self._pool.submit(self._run, payload)
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "backfill_submitted": self.submitted,
+            "backfill_dropped": self.dropped,
+            "backfill_commits": self.backfilled_commits,
+            "backfill_cache_hits": self.cache_hits,
+            "backfill_failures": self.failures,
+        }
+
+    def _range(self, full_name: str, base: str, head: str) -> List[Dict[str, Any]]:
+        # Only SHA..SHA ranges are immutable; a branch-name base is not cached.
+        if len(base) != 40:
+            return fetch_compare_commits(full_name, base, head)
+
+        key = (full_name, base, head)
+
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached is not None:
+                self._cache.move_to_end(key)
+                self.cache_hits += 1
+                return cached
+
+        commits = get_cache().cached_json(
+            request_key("GET", f"{BASE_URL}/{full_name}/compare/{base}...{head}"),
+            lambda: fetch_compare_commits(full_name, base, head),
+        )
+
+        with self._lock:
+            self._cache[key] = commits
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+        return commits
+
+    def _run(self, payload: Dict[str, Any]) -> None:
+        try:
+            repository = payload["repository"]
+            full_name = repository["full_name"]
+
+            # New branch: everything not already on the default branch.
+            base = payload["before"]
+            if base in (None, ZERO_SHA):
+                base = repository["default_branch"]
+
+            in_payload = {c["id"] for c in payload["commits"]}
+            missing = [
+                c
+                for c in self._range(full_name, base, payload["after"])
+                if c["id"] not in in_payload
+            ]
+
+            if missing:
+                self.sink(payload, missing)
+                self.backfilled_commits += len(missing)
+        except Exception as e:
+            self.failures += 1
+            print("Push backfill failed:", e)
+        finally:
+            self._slots.release()
@@ -0,0 +1,301 @@
+"""
+Compact in-memory record types for commit, deployment and merged-PR events
+
+The ingesters exchange records as dicts in the JSON shape of the output
+files. Where many records are held at once (dedup sets, backfill buffers)
+they use these instead:
+
+  - slotted classes, so a record carries no per-instance dict
+  - repo, branch, author and other repeated names interned: every record
+    of a repo points at the same string object
+  - SHAs held as 20-byte binaries (hex when not a full SHA)
+
+to_dict() gives back the exact JSON shape, so files are unchanged. The
+epoch columns added by timestamps.normalize() are listed last, in the order
+it adds them.
+
+ShaSet stores SHAs packed 20 bytes each in one sorted buffer instead of one
+str object per SHA.
+"""
+
+import sys
+from bisect import bisect_left
+from typing import Any, Dict, Iterable, Iterator, Optional, Tuple, Union
+
+# -----------------------------
+# FIELD ENCODING
+# -----------------------------
+
+SHA_BYTES = 20
+
+# Field kinds
+RAW = 0  # stored as is
+NAME = 1  # interned string
+SHA = 2  # hex SHA as 20 bytes
+SHAS = 3  # list of hex SHAs as a tuple of 20-byte values
+
+_MISSING = object()
+
+
+def sha_to_bytes(sha: Union[str, bytes]) -> Union[str, bytes]:
+    if isinstance(sha, bytes):
+        return sha
+    if len(sha) == 2 * SHA_BYTES:
+        try:
+            return bytes.fromhex(sha)
+        except ValueError:
+            pass
+    # Not a full SHA (abbreviated, or test data): kept as text.
+    return sys.intern(sha)
+
+
+def sha_to_hex(sha: Union[str, bytes]) -> str:
+    return sha.hex() if isinstance(sha, bytes) else sha
+
+
+def _encode(kind: int, value: Any) -> Any:
+    if value is None:
+        return None
+    if kind == NAME:
+        return sys.intern(value)
+    if kind == SHA:
+        return sha_to_bytes(value)
+    if kind == SHAS:
+        return tuple(sha_to_bytes(s) for s in value)
+    return value
+
+
+def _decode(kind: int, value: Any) -> Any:
+    if value is None:
+        return None
+    if kind == SHA:
+        return sha_to_hex(value)
+    if kind == SHAS:
+        return [sha_to_hex(s) for s in value]
+    return value
+
+
+# -----------------------------
+# RECORDS
+# -----------------------------
+
+
+class Record:
+    """
+    Base for slotted records. Subclasses list their JSON keys in FIELDS, in
+    output order; keys a record does not have are left out of to_dict(),
+    and keys outside FIELDS are kept in extra.
+    """
+
+    __slots__ = ("extra",)
+
+    FIELDS: Tuple[Tuple[str, int], ...] = ()
+    KEY = ""
+
+    def __init__(self, **values: Any) -> None:
+        for name, kind in self.FIELDS:
+            value = values.pop(name, _MISSING)
+            object.__setattr__(
+                self, name, value if value is _MISSING else _encode(kind, value)
+            )
+        self.extra: Optional[Dict[str, Any]] = values or None
+
+    @classmethod
+    def from_dict(cls, d: Dict[str, Any]) -> "Record":
+        return cls(**d)
+
+    def to_dict(self) -> Dict[str, Any]:
+        out: Dict[str, Any] = {}
+        for name, kind in self.FIELDS:
+            value = getattr(self, name)
+            if value is not _MISSING:
+                out[name] = _decode(kind, value)
+        if self.extra:
+            out.update(self.extra)
+        return out
+
+    def get(self, name: str, default: Any = None) -> Any:
+        value = getattr(self, name, _MISSING)
+        if value is _MISSING:
+            return (self.extra or {}).get(name, default)
+        return value
+
+    @property
+    def key(self) -> Any:
+        return getattr(self, self.KEY)
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({self.to_dict()!r})"
+
+
+class CommitRecord(Record):
+    FIELDS = (
+        ("event_type", NAME),
+        ("commit_sha", SHA),
+        ("commit_timestamp", RAW),
+        ("repo_owner", NAME),
+        ("repo_name", NAME),
+        ("branch", NAME),
+        ("author", NAME),
+        ("author_email", NAME),
+        ("parent_shas", SHAS),
+        ("ingested_at", RAW),
+        ("commit_timestamp_us", RAW),
+        ("ingested_at_us", RAW),
+    )
+    __slots__ = tuple(name for name, _ in FIELDS)
+    KEY = "commit_sha"
+
+
+class DeploymentRecord(Record):
+    FIELDS = (
+        ("event_type", NAME),
+        ("deployment_id", RAW),
+        ("repo_owner", NAME),
+        ("repo_name", NAME),
+        ("environment", NAME),
+        ("ref", NAME),
+        ("commit_sha", SHA),
+        ("deployment_created_at", RAW),
+        ("status", NAME),
+        ("status_created_at", RAW),
+        ("performed_via", NAME),
+        ("creator", NAME),
+        ("source", NAME),
+        ("reconciled", RAW),
+        ("unlisted", RAW),
+        ("ingested_at", RAW),
+        ("deployment_created_at_us", RAW),
+        ("status_created_at_us", RAW),
+        ("ingested_at_us", RAW),
+    )
+    __slots__ = tuple(name for name, _ in FIELDS)
+    KEY = "deployment_id"
+
+
+class PullRequestRecord(Record):
+    FIELDS = (
+        ("pr_id", RAW),
+        ("pr_number", RAW),
+        ("source_branch", NAME),
+        ("source_sha", SHA),
+        ("target_branch", NAME),
+        ("base_sha", SHA),
+        ("merge_type", NAME),
+        ("merge_commit_sha", SHA),
+        ("repo_owner", NAME),
+        ("repo_name", NAME),
+        ("created_at", RAW),
+        ("updated_at", RAW),
+        ("merged_at", RAW),
+        ("ingested_at", RAW),
+        ("created_at_us", RAW),
+        ("updated_at_us", RAW),
+        ("merged_at_us", RAW),
+        ("ingested_at_us", RAW),
+    )
+    __slots__ = tuple(name for name, _ in FIELDS)
+    KEY = "pr_id"
+
+
+# -----------------------------
+# SHA SET
+# -----------------------------
+
+
+class _Entries:
+    """Sorted packed SHAs viewed as a sequence of 20-byte values, for bisect."""
+
+    __slots__ = ("buf",)
+
+    def __init__(self, buf: bytearray) -> None:
+        self.buf = buf
+
+    def __len__(self) -> int:
+        return len(self.buf) // SHA_BYTES
+
+    def __getitem__(self, i: int) -> bytes:
+        return bytes(self.buf[i * SHA_BYTES : (i + 1) * SHA_BYTES])
+
+
+class ShaSet:
+    """
+    Set of SHAs (hex str or 20-byte values) packed into one sorted
+    bytearray, with a small unsorted delta merged in once it reaches
+    max_delta. Membership is a bisection; each SHA costs 20 bytes instead of
+    a str object and a set slot. Values that are not full SHAs go to a
+    plain set on the side.
+    """
+
+    __slots__ = ("_packed", "_delta", "_other", "max_delta")
+
+    def __init__(self, shas: Iterable[Union[str, bytes]] = (), max_delta: int = 4096) -> None:
+        self._packed = bytearray()
+        self._delta: set = set()
+        self._other: set = set()
+        self.max_delta = max_delta
+
+        binary = set()
+        for sha in shas:
+            value = sha_to_bytes(sha)
+            if isinstance(value, bytes):
+                binary.add(value)
+            else:
+                self._other.add(value)
+
+        self._packed = bytearray(b"".join(sorted(binary)))
+
+    def _find(self, value: bytes) -> bool:
+        entries = _Entries(self._packed)
+        i = bisect_left(entries, value)
+        return i < len(entries) and entries[i] == value
+
+    def __contains__(self, sha: Union[str, bytes]) -> bool:
+        value = sha_to_bytes(sha)
+        if not isinstance(value, bytes):
+            return value in self._other
+        return value in self._delta or self._find(value)
+
+    def add(self, sha: Union[str, bytes]) -> None:
+        value = sha_to_bytes(sha)
+        if not isinstance(value, bytes):
+            self._other.add(value)
+            return
+        if value in self._delta or self._find(value):
+            return
+
+        self._delta.add(value)
+        if len(self._delta) >= self.max_delta:
+            self.compact()
+
+    def update(self, shas: Iterable[Union[str, bytes]]) -> None:
+        for sha in shas:
+            self.add(sha)
+
+    def compact(self) -> None:
+        """Merge the delta into the sorted buffer in one linear pass."""
+        if not self._delta:
+            return
+
+        entries = _Entries(self._packed)
+        merged = bytearray()
+        prev = 0
+
+        for value in sorted(self._delta):
+            i = bisect_left(entries, value, prev)
+            merged += self._packed[prev * SHA_BYTES : i * SHA_BYTES]
+            merged += value
+            prev = i
+
+        merged += self._packed[prev * SHA_BYTES :]
+        self._packed = merged
+        self._delta = set()
+
+    def __len__(self) -> int:
+        return len(self._packed) // SHA_BYTES + len(self._delta) + len(self._other)
+
+    def __iter__(self) -> Iterator[str]:
+        self.compact()
+        for i in range(0, len(self._packed), SHA_BYTES):
+            yield self._packed[i : i + SHA_BYTES].hex()
+        yield from self._other
@@ -0,0 +1,234 @@
+"""
+Repository discovery for one or more owners / orgs, and shard assignment
+
+discover_repos() lists every repository of GITHUB_OWNERS page by page with
+conditional requests: each page's ETag is cached in DISCOVERY_CACHE_FILE, so
+an unchanged page comes back as a 304 (not counted against the rate limit)
+and is served from the cache.
+
+Repos are assigned to N workers with a consistent-hash ring (HashRing), so
+adding or removing a worker only moves about 1/N of the repos, and a repo's
+checkpoints stay with the worker that owns it.
+"""
+
+import os
+import sys
+import json
+import bisect
+import hashlib
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+from github_client import get_client
+
+# -----------------------------
+# CONFIG
+# -----------------------------
+
+DEFAULT_OWNER = "hrishi-york"
+OWNERS = [
+    o.strip() for o in os.getenv("GITHUB_OWNERS", DEFAULT_OWNER).split(",") if o.strip()
+]
+
+DISCOVERY_CACHE_FILE = "repo_discovery_cache.json"
+
+API_URL = "https://api.github.com"
+PER_PAGE = 100
+
+INCLUDE_ARCHIVED = os.getenv("DISCOVER_ARCHIVED", "false").lower() == "true"
+INCLUDE_FORKS = os.getenv("DISCOVER_FORKS", "false").lower() == "true"
+
+RING_VNODES = 64
+
+# -----------------------------
+# REPO NAMES
+# -----------------------------
+
+
+def split_full_name(repo: str, default_owner: str = DEFAULT_OWNER) -> Tuple[str, str]:
+    """ "owner/name" -> (owner, name); a bare name belongs to default_owner."""
+    owner, _, name = repo.rpartition("/")
+    return owner or default_owner, name
+
+
+def repo_key(owner: str, name: str, default_owner: str = DEFAULT_OWNER) -> str:
+    # Bare names for the default owner keep existing checkpoints valid.
+    return name if owner == default_owner else f"{owner}/{name}"
+
+
+# -----------------------------
+# DISCOVERY
+# -----------------------------
+
+
+def load_cache(path: str = DISCOVERY_CACHE_FILE) -> Dict[str, Any]:
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_cache(cache: Dict[str, Any], path: str = DISCOVERY_CACHE_FILE) -> None:
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(cache, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def _summarize(repo: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "full_name": repo["full_name"],
+        "default_branch": repo.get("default_branch"),
+        "archived": repo.get("archived", False),
+        "fork": repo.get("fork", False),
+        "pushed_at": repo.get("pushed_at"),
+    }
+
+
+def _list_pages(url: str, cached_pages: List[Dict[str, Any]]) -> Optional[List[Dict[str, Any]]]:
+    """
+    Fetch every page of a repo listing, revalidating cached pages by ETag.
+    Returns None when the listing does not exist (404).
+    """
+    client = get_client()
+    pages: List[Dict[str, Any]] = []
+    page = 1
+
+    while True:
+        cached = cached_pages[page - 1] if page <= len(cached_pages) else None
+        headers = {"If-None-Match": cached["etag"]} if cached and cached.get("etag") else None
+
+        r = client.request(url, params={"per_page": PER_PAGE, "page": page}, headers=headers)
+
+        if r.status_code == 404:
+            return None
+
+        if r.status_code == 304 and cached is not None:
+            pages.append(cached)
+            has_next = cached["has_next"]
+        else:
+            r.raise_for_status()
+            has_next = "next" in r.links
+            pages.append(
+                {
+                    "etag": r.headers.get("ETag"),
+                    "has_next": has_next,
+                    "repos": [_summarize(repo) for repo in r.json()],
+                }
+            )
+
+        if not has_next:
+            return pages
+
+        page += 1
+
+
+def discover_owner(owner: str, cache: Dict[str, Any]) -> List[Dict[str, Any]]:
+    entry = cache.get(owner, {})
+
+    # Orgs and users have different listing endpoints; remember which worked.
+    endpoints = [f"{API_URL}/orgs/{owner}/repos", f"{API_URL}/users/{owner}/repos"]
+    if entry.get("endpoint") in endpoints:
+        endpoints.remove(entry["endpoint"])
+        endpoints.insert(0, entry["endpoint"])
+
+    for url in endpoints:
+        pages = _list_pages(url, entry.get("pages", []) if url == entry.get("endpoint") else [])
+        if pages is not None:
+            cache[owner] = {
+                "endpoint": url,
+                "pages": pages,
+                "refreshed_at": datetime.now(timezone.utc).isoformat(),
+            }
+            return [repo for p in pages for repo in p["repos"]]
+
+    print(f"No repositories found for owner: {owner}")
+    return []
+
+
+def discover_repos(owners: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+    cache = load_cache()
+    repos: List[Dict[str, Any]] = []
+
+    for owner in owners or OWNERS:
+        for repo in discover_owner(owner, cache):
+            if repo["archived"] and not INCLUDE_ARCHIVED:
+                continue
+            if repo["fork"] and not INCLUDE_FORKS:
+                continue
+            repos.append(repo)
+
+    save_cache(cache)
+    return sorted(repos, key=lambda r: r["full_name"])
+
+
+# -----------------------------
+# SHARDING
+# -----------------------------
+
+
+def _hash(key: str) -> int:
+    return int.from_bytes(hashlib.md5(key.encode()).digest()[:8], "big")
+
+
+class HashRing:
+    def __init__(self, shard_count: int, vnodes: int = RING_VNODES) -> None:
+        if shard_count < 1:
+            raise ValueError("shard_count must be at least 1")
+
+        self.shard_count = shard_count
+        points = sorted(
+            (_hash(f"shard-{shard}#{v}"), shard)
+            for shard in range(shard_count)
+            for v in range(vnodes)
+        )
+        self._hashes = [h for h, _ in points]
+        self._shards = [s for _, s in points]
+
+    def shard_for(self, key: str) -> int:
+        i = bisect.bisect(self._hashes, _hash(key)) % len(self._hashes)
+        return self._shards[i]
+
+
+def parse_shard(spec: Optional[str]) -> Tuple[int, int]:
+    """ "2/8" -> (2, 8): shard index (0-based) and shard count."""
+    if not spec:
+        return 0, 1
+
+    index, _, count = spec.partition("/")
+    shard_index, shard_count = int(index), int(count)
+
+    if not 0 <= shard_index < shard_count:
+        raise ValueError(f"Invalid shard: {spec}")
+
+    return shard_index, shard_count
+
+
+def repos_for_shard(
+    full_names: List[str], shard_index: int, shard_count: int
+) -> List[str]:
+    if shard_count == 1:
+        return list(full_names)
+
+    ring = HashRing(shard_count)
+    return [name for name in full_names if ring.shard_for(name) == shard_index]
+
+
+# -----------------------------
+# MAIN
+# -----------------------------
+
+if __name__ == "__main__":
+
+    shard_count = int(sys.argv[1]) if len(sys.argv) > 1 else 1
+
+    names = [r["full_name"] for r in discover_repos()]
+    ring = HashRing(shard_count)
+
+    print("-----------------------------------")
+    print(f"Discovered {len(names)} repositories for {', '.join(OWNERS)}")
+    for shard in range(shard_count):
+        owned = [n for n in names if ring.shard_for(n) == shard]
+        print(f"shard {shard}/{shard_count}: {len(owned)} repos")
+        for name in owned:
+            print(f"  {name}")
@@ -41,4 +41,667 @@ CREATE POLICY commits_allow_insert_authenticated
   WITH CHECK (true);
 
 -- Deny SELECT/UPDATE/DELETE for authenticated by not creating policies for them.
--- The service_role key bypasses RLS, so your backend using service role can do any action.
\ No newline at end of file
+-- The service_role key bypasses RLS, so your backend using service role can do any action.
+
+-- 4) Webhook rows may carry the author's email
+ALTER TABLE commits ADD COLUMN IF NOT EXISTS author_email text;
+
+-- =====================================================================
+-- Ingestion tables
+-- =====================================================================
+-- commits_api and deployments_api are written by the Supabase ingesters with
+-- upsert: commits with ignore_duplicates, deployments merging their latest
+-- status into the stored row. Their unique constraints are those upserts'
+-- on_conflict targets. Their checkpoint queries (latest commit per
+-- repo/branch, latest deployment per repo) are ordered limit-1 probes of a
+-- composite btree that covers them. deployment_statuses, pr_events and
+-- pr_merged_events have no Supabase writer yet: their keys and indexes are
+-- laid out for one (idempotent inserts, latest event per repo/type).
+--
+-- Status and PR event tables only grow, so they are range-partitioned by
+-- month on their event time; old months can be detached or dropped whole.
+-- Partitioned tables need the partition key in every unique constraint, so
+-- they use natural keys instead of identity ids.
+--
+-- The rollup schema first declared deployments_api and pr_merged_events
+-- without these keys and unpartitioned. Databases installed from it are
+-- migrated below (6a, 9a and 10a); every step is a no-op on a fresh install.
+
+-- 5) Commits from the REST API (supabase_api_ingestion_commits.py)
+CREATE TABLE IF NOT EXISTS commits_api (
+  id bigint GENERATED ALWAYS AS IDENTITY PRIMARY KEY,
+  event_type text NOT NULL,
+  commit_sha text NOT NULL,
+  commit_timestamp timestamptz NOT NULL,
+  repo_owner text NOT NULL,
+  repo_name text NOT NULL,
+  branch text NOT NULL,
+  author text NOT NULL,
+  author_email text,
+  ingested_at timestamptz NOT NULL DEFAULT now(),
+  CONSTRAINT commits_api_repo_commit_sha_key UNIQUE (repo_name, commit_sha)
+);
+
+-- 6) Deployments (supabase_api_ingestion_deployments.py)
+CREATE TABLE IF NOT EXISTS deployments_api (
+  id bigint GENERATED ALWAYS AS IDENTITY PRIMARY KEY,
+  event_type text NOT NULL,
+  deployment_id bigint NOT NULL,
+  repo_owner text NOT NULL,
+  repo_name text NOT NULL,
+  environment text NOT NULL,
+  ref text,
+  commit_sha text NOT NULL,
+  deployment_created_at timestamptz NOT NULL,
+  status text,
+  status_created_at timestamptz,
+  performed_via text,
+  creator text,
+  ingested_at timestamptz NOT NULL DEFAULT now(),
+  inserted_at timestamptz NOT NULL DEFAULT now(),
+  CONSTRAINT deployments_api_deployment_id_key UNIQUE (deployment_id)
+);
+
+-- 6a) Upsert key on a deployments_api created without it; of duplicate
+-- rows for a deployment, the last inserted one is kept.
+DO $$
+BEGIN
+  IF NOT EXISTS (
+    SELECT 1 FROM pg_constraint
+    WHERE conname = 'deployments_api_deployment_id_key'
+  ) THEN
+    DELETE FROM deployments_api d
+    USING deployments_api newer
+    WHERE newer.deployment_id = d.deployment_id AND newer.id > d.id;
+
+    ALTER TABLE deployments_api
+      ADD CONSTRAINT deployments_api_deployment_id_key UNIQUE (deployment_id);
+  END IF;
+END;
+$$;
+
+-- 7) Deployment status history, one row per status GitHub reports
+CREATE TABLE IF NOT EXISTS deployment_statuses (
+  status_id bigint NOT NULL,
+  deployment_id bigint NOT NULL,
+  repo_name text NOT NULL,
+  environment text NOT NULL,
+  state text NOT NULL,
+  created_at timestamptz NOT NULL,
+  ingested_at timestamptz NOT NULL DEFAULT now(),
+  PRIMARY KEY (status_id, created_at)
+) PARTITION BY RANGE (created_at);
+
+-- 8) PR lifecycle events (PR_CREATED, ...)
+CREATE TABLE IF NOT EXISTS pr_events (
+  pr_id bigint NOT NULL,
+  pr_number integer NOT NULL,
+  event_type text NOT NULL,
+  event_timestamp timestamptz NOT NULL,
+  repo_name text NOT NULL,
+  base_branch text NOT NULL,
+  head_sha text,
+  author text,
+  ingested_at timestamptz NOT NULL DEFAULT now(),
+  PRIMARY KEY (repo_name, pr_id, event_type, event_timestamp)
+) PARTITION BY RANGE (event_timestamp);
+
+-- 9) Merged PRs
+-- 9a) A plain pr_merged_events is set aside and its rows copied into the
+-- partitioned table once its months exist (10a).
+DO $$
+BEGIN
+  IF EXISTS (
+    SELECT 1 FROM pg_class
+    WHERE oid = to_regclass('pr_merged_events') AND relkind = 'r'
+  ) THEN
+    ALTER TABLE pr_merged_events RENAME TO pr_merged_events_unpartitioned;
+    -- Frees the primary key's index name for the new table.
+    ALTER TABLE pr_merged_events_unpartitioned
+      RENAME CONSTRAINT pr_merged_events_pkey TO pr_merged_events_unpartitioned_pkey;
+  END IF;
+END;
+$$;
+
+CREATE TABLE IF NOT EXISTS pr_merged_events (
+  pr_id bigint NOT NULL,
+  pr_number integer NOT NULL,
+  source_branch text NOT NULL,
+  target_branch text NOT NULL,
+  merge_type text,
+  merge_commit_sha text,
+  repo_owner text NOT NULL,
+  repo_name text NOT NULL,
+  created_at timestamptz NOT NULL,
+  updated_at timestamptz,
+  merged_at timestamptz NOT NULL,
+  ingested_at timestamptz NOT NULL DEFAULT now(),
+  inserted_at timestamptz NOT NULL DEFAULT now(),
+  PRIMARY KEY (repo_name, pr_id, merged_at)
+) PARTITION BY RANGE (merged_at);
+
+-- 10) Monthly partitions
+-- Rows outside every monthly partition land in the default partition, so
+-- inserts never fail. A month that does not exist yet is created empty,
+-- filled with the rows of its range that already sit in the default
+-- partition, and then attached, so a missed month is picked up late rather
+-- than blocking its partition for good. Months older than months_back stay
+-- in the default partition.
+CREATE OR REPLACE FUNCTION ensure_monthly_partitions(
+  parent text,
+  months_back integer DEFAULT 1,
+  months_ahead integer DEFAULT 3
+)
+RETURNS void
+LANGUAGE plpgsql
+AS $$
+DECLARE
+  default_part text := parent || '_default';
+  part_key text;
+  part text;
+  month_start date;
+  month_end date;
+BEGIN
+  EXECUTE format(
+    'CREATE TABLE IF NOT EXISTS %I PARTITION OF %I DEFAULT',
+    default_part, parent
+  );
+
+  -- 'RANGE (merged_at)' -> merged_at
+  part_key := substring(pg_get_partkeydef(parent::regclass) FROM '\((.*)\)');
+
+  FOR i IN -months_back..months_ahead LOOP
+    month_start := (date_trunc('month', now()) + make_interval(months => i))::date;
+    month_end := (month_start + interval '1 month')::date;
+    part := parent || '_' || to_char(month_start, 'YYYY_MM');
+
+    CONTINUE WHEN to_regclass(part) IS NOT NULL;
+
+    EXECUTE format('CREATE TABLE %I (LIKE %I INCLUDING DEFAULTS)', part, parent);
+    EXECUTE format(
+      'WITH moved AS (DELETE FROM %I WHERE %I >= %L AND %I < %L RETURNING *) '
+      || 'INSERT INTO %I SELECT * FROM moved',
+      default_part, part_key, month_start, part_key, month_end, part
+    );
+    EXECUTE format(
+      'ALTER TABLE %I ATTACH PARTITION %I FOR VALUES FROM (%L) TO (%L)',
+      parent, part, month_start, month_end
+    );
+  END LOOP;
+END;
+$$;
+
+CREATE OR REPLACE FUNCTION ensure_all_monthly_partitions()
+RETURNS void
+LANGUAGE sql
+AS $$
+  SELECT ensure_monthly_partitions(t)
+  FROM unnest(ARRAY['deployment_statuses', 'pr_events', 'pr_merged_events']) AS t;
+$$;
+
+REVOKE ALL ON FUNCTION ensure_monthly_partitions(text, integer, integer) FROM PUBLIC;
+REVOKE ALL ON FUNCTION ensure_all_monthly_partitions() FROM PUBLIC;
+
+SELECT ensure_all_monthly_partitions();
+
+-- Months have to be created ahead of the data for as long as it arrives:
+-- refresh_rollups.py calls ensure_all_monthly_partitions() on every run, and
+-- with pg_cron the database also does it daily by itself.
+DO $$
+BEGIN
+  IF EXISTS (SELECT 1 FROM pg_extension WHERE extname = 'pg_cron') THEN
+    PERFORM cron.schedule(
+      'ensure-partitions', '0 0 * * *', 'SELECT ensure_all_monthly_partitions()'
+    );
+  END IF;
+END;
+$$;
+
+-- 10a) Rows of a set-aside plain pr_merged_events (9a), with partitions
+-- made for every month they cover. inserted_at is kept where the old table
+-- had it, so the rollup watermark does not count its rows again.
+DO $$
+DECLARE
+  span interval;
+BEGIN
+  IF to_regclass('pr_merged_events_unpartitioned') IS NULL THEN
+    RETURN;
+  END IF;
+
+  SELECT age(date_trunc('month', now()), date_trunc('month', min(merged_at)))
+  INTO span
+  FROM pr_merged_events_unpartitioned;
+
+  IF span IS NOT NULL THEN
+    PERFORM ensure_monthly_partitions(
+      'pr_merged_events',
+      (extract(year FROM span) * 12 + extract(month FROM span))::integer
+    );
+  END IF;
+
+  INSERT INTO pr_merged_events (
+    pr_id, pr_number, source_branch, target_branch, merge_type, merge_commit_sha,
+    repo_owner, repo_name, created_at, updated_at, merged_at, ingested_at, inserted_at
+  )
+  SELECT o.pr_id, o.pr_number, o.source_branch, o.target_branch, o.merge_type,
+         o.merge_commit_sha, o.repo_owner, o.repo_name, o.created_at, o.updated_at,
+         o.merged_at, o.ingested_at,
+         coalesce((to_jsonb(o) ->> 'inserted_at')::timestamptz, o.ingested_at)
+  FROM pr_merged_events_unpartitioned o
+  ON CONFLICT DO NOTHING;
+
+  DROP TABLE pr_merged_events_unpartitioned;
+END;
+$$;
+
+-- 11) Checkpoint and access-path indexes
+-- Latest commit per repo/branch (also serves repo/branch time ranges)
+CREATE INDEX IF NOT EXISTS commits_repo_branch_timestamp_idx
+  ON commits (repo_name, branch, commit_timestamp);
+
+CREATE INDEX IF NOT EXISTS commits_api_repo_branch_timestamp_idx
+  ON commits_api (repo_name, branch, commit_timestamp);
+
+-- Latest deployment per repo
+CREATE INDEX IF NOT EXISTS deployments_api_repo_deployment_id_idx
+  ON deployments_api (repo_name, deployment_id);
+
+-- Deployments whose status the ingester still re-requests
+CREATE INDEX IF NOT EXISTS deployments_api_pending_idx
+  ON deployments_api (repo_name, deployment_created_at)
+  WHERE status IS NULL OR status NOT IN ('success', 'failure', 'error', 'inactive');
+
+CREATE INDEX IF NOT EXISTS deployments_api_repo_env_created_idx
+  ON deployments_api (repo_name, environment, deployment_created_at);
+
+-- Latest status of a deployment
+CREATE INDEX IF NOT EXISTS deployment_statuses_deployment_created_idx
+  ON deployment_statuses (deployment_id, created_at);
+
+-- Latest PR event per repo and type / latest merge per repo
+CREATE INDEX IF NOT EXISTS pr_events_repo_type_timestamp_idx
+  ON pr_events (repo_name, event_type, event_timestamp);
+
+CREATE INDEX IF NOT EXISTS pr_merged_events_repo_merged_idx
+  ON pr_merged_events (repo_name, merged_at);
+
+-- BRIN suits append-ordered timestamps: a few pages cover the whole table.
+CREATE INDEX IF NOT EXISTS commits_commit_timestamp_brin_idx
+  ON commits USING brin (commit_timestamp);
+
+CREATE INDEX IF NOT EXISTS commits_api_commit_timestamp_brin_idx
+  ON commits_api USING brin (commit_timestamp);
+
+-- 12) Service role only, like commits
+ALTER TABLE commits_api ENABLE ROW LEVEL SECURITY;
+ALTER TABLE deployments_api ENABLE ROW LEVEL SECURITY;
+ALTER TABLE deployment_statuses ENABLE ROW LEVEL SECURITY;
+ALTER TABLE pr_events ENABLE ROW LEVEL SECURITY;
+ALTER TABLE pr_merged_events ENABLE ROW LEVEL SECURITY;
+
+-- =====================================================================
+-- Rollups
+-- =====================================================================
+-- Pre-aggregated daily tables for dashboards. refresh_rollups() folds in only
+-- rows inserted since the last refresh (per-source high-water mark on
+-- inserted_at), so refresh cost and dashboard latency do not grow with the
+-- size of the raw tables. Commits and PR merges are append-only, so new rows
+-- are added to their buckets. Deployments change status after they are
+-- inserted, so the day buckets of changed deployments are recounted.
+
+-- 13) Insert time of source rows
+-- The watermark is on inserted_at, which the database stamps when a row is
+-- inserted; writers never send it. ingested_at is set by the writers at
+-- fetch or request time, and rows held in the admission queue, backfilled
+-- or retried are inserted long after it, below a watermark already past.
+-- Existing rows take their ingested_at, so what was folded stays folded.
+ALTER TABLE commits ADD COLUMN IF NOT EXISTS inserted_at timestamptz;
+ALTER TABLE deployments_api ADD COLUMN IF NOT EXISTS inserted_at timestamptz;
+ALTER TABLE pr_merged_events ADD COLUMN IF NOT EXISTS inserted_at timestamptz;
+
+UPDATE commits SET inserted_at = ingested_at WHERE inserted_at IS NULL;
+UPDATE deployments_api SET inserted_at = ingested_at WHERE inserted_at IS NULL;
+UPDATE pr_merged_events SET inserted_at = ingested_at WHERE inserted_at IS NULL;
+
+ALTER TABLE commits
+  ALTER COLUMN inserted_at SET DEFAULT now(),
+  ALTER COLUMN inserted_at SET NOT NULL;
+ALTER TABLE deployments_api
+  ALTER COLUMN inserted_at SET DEFAULT now(),
+  ALTER COLUMN inserted_at SET NOT NULL;
+ALTER TABLE pr_merged_events
+  ALTER COLUMN inserted_at SET DEFAULT now(),
+  ALTER COLUMN inserted_at SET NOT NULL;
+
+-- The refresh scans by inserted_at; ingested_at is no longer a watermark.
+DROP INDEX IF EXISTS commits_ingested_at_brin_idx;
+DROP INDEX IF EXISTS deployments_api_ingested_at_brin_idx;
+DROP INDEX IF EXISTS pr_merged_events_ingested_at_brin_idx;
+
+CREATE INDEX IF NOT EXISTS commits_inserted_at_brin_idx
+  ON commits USING brin (inserted_at);
+
+CREATE INDEX IF NOT EXISTS pr_merged_events_inserted_at_brin_idx
+  ON pr_merged_events USING brin (inserted_at);
+
+-- Deployments are watermarked on changed_at instead, stamped by the
+-- database on every insert and update (a status merged in by the ingester).
+ALTER TABLE deployments_api ADD COLUMN IF NOT EXISTS changed_at timestamptz;
+
+UPDATE deployments_api SET changed_at = inserted_at WHERE changed_at IS NULL;
+
+ALTER TABLE deployments_api
+  ALTER COLUMN changed_at SET DEFAULT now(),
+  ALTER COLUMN changed_at SET NOT NULL;
+
+CREATE OR REPLACE FUNCTION stamp_changed_at()
+RETURNS trigger
+LANGUAGE plpgsql
+AS $$
+BEGIN
+  NEW.changed_at := now();
+  RETURN NEW;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS deployments_api_stamp_changed_at ON deployments_api;
+CREATE TRIGGER deployments_api_stamp_changed_at
+  BEFORE INSERT OR UPDATE ON deployments_api
+  FOR EACH ROW EXECUTE FUNCTION stamp_changed_at();
+
+DROP INDEX IF EXISTS deployments_api_inserted_at_brin_idx;
+
+-- Rows move to the end of the table when updated, so a btree rather than BRIN.
+CREATE INDEX IF NOT EXISTS deployments_api_changed_at_idx
+  ON deployments_api (changed_at);
+
+-- 14) Rollup tables (days are UTC)
+CREATE TABLE IF NOT EXISTS commit_daily_rollup (
+  repo_name text NOT NULL,
+  day date NOT NULL,
+  author text NOT NULL,
+  commit_count integer NOT NULL DEFAULT 0,
+  PRIMARY KEY (repo_name, day, author)
+);
+
+CREATE TABLE IF NOT EXISTS deployment_daily_rollup (
+  repo_name text NOT NULL,
+  environment text NOT NULL,
+  day date NOT NULL,
+  deployment_count integer NOT NULL DEFAULT 0,
+  success_count integer NOT NULL DEFAULT 0,
+  failure_count integer NOT NULL DEFAULT 0,
+  PRIMARY KEY (repo_name, environment, day)
+);
+
+CREATE TABLE IF NOT EXISTS pr_merge_daily_rollup (
+  repo_name text NOT NULL,
+  target_branch text NOT NULL,
+  day date NOT NULL,
+  merge_count integer NOT NULL DEFAULT 0,
+  PRIMARY KEY (repo_name, target_branch, day)
+);
+
+CREATE TABLE IF NOT EXISTS rollup_watermarks (
+  source text PRIMARY KEY,
+  high_water timestamptz NOT NULL DEFAULT '-infinity',
+  refreshed_at timestamptz
+);
+
+INSERT INTO rollup_watermarks (source)
+VALUES ('commits'), ('deployments_api'), ('pr_merged_events')
+ON CONFLICT (source) DO NOTHING;
+
+-- 15) Incremental refresh
+-- Rows are folded up to now() - settle. inserted_at is the start of the
+-- inserting transaction, so a row can become visible after a refresh has
+-- passed its time; the settle interval leaves room for those transactions
+-- to commit before the watermark moves past them.
+CREATE OR REPLACE FUNCTION refresh_rollups(settle interval DEFAULT interval '2 minutes')
+RETURNS TABLE (rollup_source text, rows_folded bigint, refreshed_to timestamptz)
+LANGUAGE plpgsql
+AS $$
+DECLARE
+  upto timestamptz := now() - settle;
+  since timestamptz;
+  folded bigint;
+BEGIN
+  -- One refresh at a time; a concurrent caller waits, then finds no new rows.
+  PERFORM pg_advisory_xact_lock(hashtext('refresh_rollups'));
+
+  -- commits per repo / day / author
+  SELECT w.high_water INTO since
+  FROM rollup_watermarks w WHERE w.source = 'commits' FOR UPDATE;
+
+  WITH fresh AS (
+    SELECT c.repo_name,
+           (c.commit_timestamp AT TIME ZONE 'UTC')::date AS day,
+           c.author,
+           count(*) AS n
+    FROM commits c
+    WHERE c.inserted_at > since AND c.inserted_at <= upto
+    GROUP BY 1, 2, 3
+  ), upserted AS (
+    INSERT INTO commit_daily_rollup AS r (repo_name, day, author, commit_count)
+    SELECT repo_name, day, author, n FROM fresh
+    ON CONFLICT (repo_name, day, author)
+    DO UPDATE SET commit_count = r.commit_count + EXCLUDED.commit_count
+  )
+  SELECT coalesce(sum(n), 0) INTO folded FROM fresh;
+
+  UPDATE rollup_watermarks w
+  SET high_water = upto, refreshed_at = now()
+  WHERE w.source = 'commits';
+
+  rollup_source := 'commits'; rows_folded := folded; refreshed_to := upto;
+  RETURN NEXT;
+
+  -- deployments per repo / environment / day, recounted for the days of
+  -- deployments inserted or updated since the last refresh
+  SELECT w.high_water INTO since
+  FROM rollup_watermarks w WHERE w.source = 'deployments_api' FOR UPDATE;
+
+  WITH changed AS (
+    SELECT d.repo_name,
+           d.environment,
+           (d.deployment_created_at AT TIME ZONE 'UTC')::date AS day,
+           count(*) AS n
+    FROM deployments_api d
+    WHERE d.changed_at > since AND d.changed_at <= upto
+    GROUP BY 1, 2, 3
+  ), recounted AS (
+    SELECT c.repo_name,
+           c.environment,
+           c.day,
+           count(*) AS n,
+           count(*) FILTER (WHERE d.status IN ('success', 'inactive')) AS ok,
+           count(*) FILTER (WHERE d.status IN ('failure', 'error')) AS failed
+    FROM changed c
+    JOIN deployments_api d
+      ON d.repo_name = c.repo_name
+     AND d.environment = c.environment
+     AND d.deployment_created_at >= c.day::timestamp AT TIME ZONE 'UTC'
+     AND d.deployment_created_at < (c.day + 1)::timestamp AT TIME ZONE 'UTC'
+    GROUP BY 1, 2, 3
+  ), upserted AS (
+    INSERT INTO deployment_daily_rollup AS r
+      (repo_name, environment, day, deployment_count, success_count, failure_count)
+    SELECT repo_name, environment, day, n, ok, failed FROM recounted
+    ON CONFLICT (repo_name, environment, day)
+    DO UPDATE SET deployment_count = EXCLUDED.deployment_count,
+                  success_count = EXCLUDED.success_count,
+                  failure_count = EXCLUDED.failure_count
+  )
+  SELECT coalesce(sum(n), 0) INTO folded FROM changed;
+
+  UPDATE rollup_watermarks w
+  SET high_water = upto, refreshed_at = now()
+  WHERE w.source = 'deployments_api';
+
+  rollup_source := 'deployments_api'; rows_folded := folded; refreshed_to := upto;
+  RETURN NEXT;
+
+  -- PR merges per repo / target branch / day
+  SELECT w.high_water INTO since
+  FROM rollup_watermarks w WHERE w.source = 'pr_merged_events' FOR UPDATE;
+
+  WITH fresh AS (
+    SELECT p.repo_name,
+           p.target_branch,
+           (p.merged_at AT TIME ZONE 'UTC')::date AS day,
+           count(*) AS n
+    FROM pr_merged_events p
+    WHERE p.inserted_at > since AND p.inserted_at <= upto
+    GROUP BY 1, 2, 3
+  ), upserted AS (
+    INSERT INTO pr_merge_daily_rollup AS r (repo_name, target_branch, day, merge_count)
+    SELECT repo_name, target_branch, day, n FROM fresh
+    ON CONFLICT (repo_name, target_branch, day)
+    DO UPDATE SET merge_count = r.merge_count + EXCLUDED.merge_count
+  )
+  SELECT coalesce(sum(n), 0) INTO folded FROM fresh;
+
+  UPDATE rollup_watermarks w
+  SET high_water = upto, refreshed_at = now()
+  WHERE w.source = 'pr_merged_events';
+
+  rollup_source := 'pr_merged_events'; rows_folded := folded; refreshed_to := upto;
+  RETURN NEXT;
+END;
+$$;
+
+-- Only the service role refreshes; dashboards read the rollups.
+REVOKE ALL ON FUNCTION refresh_rollups(interval) FROM PUBLIC;
+
+ALTER TABLE commit_daily_rollup ENABLE ROW LEVEL SECURITY;
+ALTER TABLE deployment_daily_rollup ENABLE ROW LEVEL SECURITY;
+ALTER TABLE pr_merge_daily_rollup ENABLE ROW LEVEL SECURITY;
+
+GRANT SELECT ON commit_daily_rollup, deployment_daily_rollup, pr_merge_daily_rollup
+  TO authenticated;
+
+CREATE POLICY commit_daily_rollup_read_authenticated
+  ON commit_daily_rollup FOR SELECT TO authenticated USING (true);
+
+CREATE POLICY deployment_daily_rollup_read_authenticated
+  ON deployment_daily_rollup FOR SELECT TO authenticated USING (true);
+
+CREATE POLICY pr_merge_daily_rollup_read_authenticated
+  ON pr_merge_daily_rollup FOR SELECT TO authenticated USING (true);
+
+-- 16) Schedule (optional, needs the pg_cron extension); otherwise run
+-- refresh_rollups.py from the ingestion job.
+-- SELECT cron.schedule('refresh-rollups', '*/5 * * * *', 'SELECT * FROM refresh_rollups()');
+
+-- =====================================================================
+-- Work leases
+-- =====================================================================
+-- Coordinates ingestion nodes (work_leases.py): one row per (source, repo)
+-- work item. A node claims an item with an expiring lease, heartbeats it, and
+-- releases it with the item's new checkpoint. Expired leases are claimable
+-- again; heartbeat and release need the lease token, so a node that lost its
+-- lease cannot overwrite the new holder's checkpoint.
+
+-- 17) Work items
+CREATE TABLE IF NOT EXISTS work_items (
+  source text NOT NULL,
+  repo_name text NOT NULL,
+  checkpoint jsonb,
+  lease_owner text,
+  lease_token uuid,
+  lease_expires_at timestamptz,
+  last_completed_at timestamptz,
+  attempts integer NOT NULL DEFAULT 0,
+  PRIMARY KEY (source, repo_name)
+);
+
+CREATE INDEX IF NOT EXISTS work_items_claim_idx
+  ON work_items (source, last_completed_at NULLS FIRST);
+
+ALTER TABLE work_items ENABLE ROW LEVEL SECURITY;
+
+-- 18) Claim / heartbeat / release
+CREATE OR REPLACE FUNCTION claim_work_item(
+  p_source text,
+  p_repos text[],
+  p_owner text,
+  p_ttl_seconds integer,
+  p_min_age_seconds integer DEFAULT 0
+)
+RETURNS TABLE (repo_name text, checkpoint jsonb, lease_token uuid)
+LANGUAGE plpgsql
+AS $$
+#variable_conflict use_column
+BEGIN
+  INSERT INTO work_items (source, repo_name)
+  SELECT p_source, r FROM unnest(p_repos) AS r
+  ON CONFLICT (source, repo_name) DO NOTHING;
+
+  -- SKIP LOCKED: concurrent claimers take different items without waiting.
+  RETURN QUERY
+  UPDATE work_items w
+  SET lease_owner = p_owner,
+      lease_token = gen_random_uuid(),
+      lease_expires_at = now() + make_interval(secs => p_ttl_seconds),
+      attempts = w.attempts + 1
+  WHERE (w.source, w.repo_name) = (
+    SELECT c.source, c.repo_name
+    FROM work_items c
+    WHERE c.source = p_source
+      AND c.repo_name = ANY (p_repos)
+      AND (c.lease_expires_at IS NULL OR c.lease_expires_at < now())
+      AND (c.last_completed_at IS NULL
+           OR c.last_completed_at < now() - make_interval(secs => p_min_age_seconds))
+    ORDER BY c.last_completed_at NULLS FIRST
+    LIMIT 1
+    FOR UPDATE SKIP LOCKED
+  )
+  RETURNING w.repo_name, w.checkpoint, w.lease_token;
+END;
+$$;
+
+CREATE OR REPLACE FUNCTION heartbeat_work_item(
+  p_source text,
+  p_repo text,
+  p_token uuid,
+  p_ttl_seconds integer
+)
+RETURNS boolean
+LANGUAGE sql
+AS $$
+  WITH renewed AS (
+    UPDATE work_items
+    SET lease_expires_at = now() + make_interval(secs => p_ttl_seconds)
+    WHERE source = p_source AND repo_name = p_repo AND lease_token = p_token
+    RETURNING 1
+  )
+  SELECT EXISTS (SELECT 1 FROM renewed);
+$$;
+
+-- A null checkpoint gives the item up without marking it completed.
+CREATE OR REPLACE FUNCTION release_work_item(
+  p_source text,
+  p_repo text,
+  p_token uuid,
+  p_checkpoint jsonb DEFAULT NULL
+)
+RETURNS boolean
+LANGUAGE sql
+AS $$
+  WITH released AS (
+    UPDATE work_items
+    SET lease_owner = NULL,
+        lease_token = NULL,
+        lease_expires_at = NULL,
+        checkpoint = coalesce(p_checkpoint, checkpoint),
+        last_completed_at = CASE WHEN p_checkpoint IS NULL
+                                 THEN last_completed_at ELSE now() END
+    WHERE source = p_source AND repo_name = p_repo AND lease_token = p_token
+    RETURNING 1
+  )
+  SELECT EXISTS (SELECT 1 FROM released);
+$$;
+
+REVOKE ALL ON FUNCTION claim_work_item(text, text[], text, integer, integer) FROM PUBLIC;
+REVOKE ALL ON FUNCTION heartbeat_work_item(text, text, uuid, integer) FROM PUBLIC;
+REVOKE ALL ON FUNCTION release_work_item(text, text, uuid, jsonb) FROM PUBLIC;
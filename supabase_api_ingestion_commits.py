@@ -1,15 +1,25 @@
 """
 Incremental, append-safe commit ingestion using GitHub API → Supabase
+
+Repos are claimed one at a time through work_leases, so several copies of
+this script (on one or more nodes) split the repos between them instead of
+all scanning every repo. Each repo's per-branch checkpoint is stored with
+its lease.
 """
 
 import os
 import json
 import requests
 from datetime import datetime, timezone
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Iterator, Optional
 from dotenv import load_dotenv
 from supabase import create_client
 
+import work_leases
+from pipeline import batched, dedup, prefetch
+from records import ShaSet
+from timestamps import later
+
 load_dotenv()
 
 # -----------------------------
@@ -31,10 +41,16 @@ SUPABASE_SERVICE_ROLE_KEY = str(SUPABASE_SERVICE_ROLE_KEY)
 REPO_OWNER = "hrishi-york"
 REPOSITORIES = ["remote_exmpl", "receiver_repo", "experimental_1"]
 
+LEASE_SOURCE = "commits_api"
+# Repos another node finished this recently are not fetched again.
+LEASE_MIN_AGE_SECONDS = int(os.getenv("LEASE_MIN_AGE_SECONDS", "60"))
+
 BASE_URL = "https://api.github.com/repos"
 PER_PAGE = 100
 TIMEOUT = 10
 
+UPSERT_BATCH_SIZE = 500
+
 # -----------------------------
 # CLIENTS
 # -----------------------------
@@ -66,30 +82,27 @@ def github_get(url: str, params: Optional[Dict[str, Any]] = None) -> Any:
 # -----------------------------
 
 
-def load_existing_records():
+def fetch_checkpoint(repo_name: str, branch: str) -> Optional[str]:
+    # Index-only probe of commits_api_repo_branch_timestamp_idx
     res = (
         supabase.table("commits_api")
-        .select("commit_sha, repo_name, branch, commit_timestamp")
+        .select("commit_timestamp")
+        .eq("repo_name", repo_name)
+        .eq("branch", branch)
+        .order("commit_timestamp", desc=True)
+        .limit(1)
         .execute()
     )
 
-    return res.data or []
-
-
-def build_checkpoint(records):
-    checkpoint = {}
-    for r in records:
-        key = f"{r['repo_name']}:{r['branch']}"
-        ts = r["commit_timestamp"]
+    return res.data[0]["commit_timestamp"] if res.data else None
 
-        if key not in checkpoint or ts > checkpoint[key]:
-            checkpoint[key] = ts
 
-    return checkpoint
-
-
-def build_existing_sha_set(records):
-    return {r["commit_sha"] for r in records}
+def upsert_commits(records: List[Dict[str, Any]]) -> None:
+    # Commits already stored (e.g. reached from another branch) are skipped
+    # by the (repo_name, commit_sha) constraint.
+    supabase.table("commits_api").upsert(
+        records, on_conflict="repo_name,commit_sha", ignore_duplicates=True
+    ).execute()
 
 
 # -----------------------------
@@ -102,9 +115,8 @@ def fetch_branches(repo_name: str):
     return [b["name"] for b in data]
 
 
-def fetch_incremental_commits(repo_name, branch, since_ts):
+def iter_incremental_commits(repo_name, branch, since_ts) -> Iterator[Dict[str, Any]]:
     page = 1
-    records = []
 
     while True:
         params = {"sha": branch, "per_page": PER_PAGE, "page": page}
@@ -120,62 +132,91 @@ def fetch_incremental_commits(repo_name, branch, since_ts):
             break
 
         for c in commits:
-            records.append(
-                {
-                    "event_type": "commit",
-                    "commit_sha": c["sha"],
-                    "commit_timestamp": c["commit"]["author"]["date"],
-                    "repo_owner": REPO_OWNER,
-                    "repo_name": repo_name,
-                    "branch": branch,
-                    "author": c["commit"]["author"]["name"].strip("“”\"'"),
-                    "author_email": c["commit"]["author"]["email"],
-                    "ingested_at": datetime.now(timezone.utc).isoformat(),
-                }
-            )
+            yield {
+                "event_type": "commit",
+                "commit_sha": c["sha"],
+                "commit_timestamp": c["commit"]["author"]["date"],
+                "repo_owner": REPO_OWNER,
+                "repo_name": repo_name,
+                "branch": branch,
+                "author": c["commit"]["author"]["name"].strip("“”\"'"),
+                "author_email": c["commit"]["author"]["email"],
+                "ingested_at": datetime.now(timezone.utc).isoformat(),
+            }
 
         page += 1
 
-    return records
-
 
 # -----------------------------
-# MAIN
+# INGEST
 # -----------------------------
 
-if __name__ == "__main__":
 
-    existing_records = load_existing_records()
-    checkpoint = build_checkpoint(existing_records)
-    existing_shas = build_existing_sha_set(existing_records)
+def ingest_repo(repo_name: str, checkpoint: Dict[str, str]):
+    """
+    Fetch and upsert new commits on every branch of repo_name, in batches
+    while later pages are still downloading. Returns the updated
+    {branch: latest commit timestamp} checkpoint and the fetch count.
+    """
+    checkpoint = dict(checkpoint)
+    seen_shas = ShaSet()
+    fetched = 0
+
+    for branch in fetch_branches(repo_name):
+        # Items claimed for the first time fall back to the table.
+        since_ts = checkpoint.get(branch) or fetch_checkpoint(repo_name, branch)
 
-    new_records = []
+        print(f"  → {branch} | since={since_ts}")
 
-    for repo in REPOSITORIES:
-        print(f"\nProcessing repo: {repo}")
+        latest = since_ts
+        commits = prefetch(iter_incremental_commits(repo_name, branch, since_ts))
 
-        branches = fetch_branches(repo)
+        for batch in batched(commits, UPSERT_BATCH_SIZE):
+            # Duplicates of another branch still move this branch's checkpoint.
+            for c in batch:
+                latest = later(latest, c["commit_timestamp"])
 
-        for branch in branches:
-            key = f"{repo}:{branch}"
-            since_ts = checkpoint.get(key)
+            new_records = list(dedup(batch, "commit_sha", seen_shas))
+            if new_records:
+                upsert_commits(new_records)
+                fetched += len(new_records)
 
-            print(f"  → {branch} | since={since_ts}")
+        if latest:
+            checkpoint[branch] = latest
+
+    return checkpoint, fetched
+
+
+# -----------------------------
+# MAIN
+# -----------------------------
+
+if __name__ == "__main__":
+
+    leases = work_leases.open_store(supabase)
+
+    pending = list(REPOSITORIES)
+    fetched = 0
+
+    while pending:
+        lease = leases.claim(LEASE_SOURCE, pending, min_age=LEASE_MIN_AGE_SECONDS)
+        if lease is None:
+            # Everything left is leased by another node or was just done.
+            break
 
-            commits = fetch_incremental_commits(repo, branch, since_ts)
+        pending.remove(lease.repo_name)
+        print(f"\nProcessing repo: {lease.repo_name}")
 
-            for c in commits:
-                if c["commit_sha"] in existing_shas:
-                    continue
+        with lease:
+            checkpoint, count = ingest_repo(lease.repo_name, lease.checkpoint)
 
-                new_records.append(c)
-                existing_shas.add(c["commit_sha"])
+            if not lease.release(checkpoint):
+                print(f"  ↳ lease lost, checkpoint not saved for {lease.repo_name}")
 
-    if new_records:
-        supabase.table("commits_api").insert(new_records).execute()
+        fetched += count
 
-        print("\n--------------------------------")
-        print(f"Inserted {len(new_records)} new records")
+    print("\n--------------------------------")
+    if fetched:
+        print(f"Upserted {fetched} fetched records")
     else:
-        print("\n--------------------------------")
         print("No new commits found")
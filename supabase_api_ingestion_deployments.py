@@ -1,14 +1,21 @@
 """
 Incremental, append-safe deployment ingestion using GitHub API → Supabase
+
+New deployments are upserted with their latest status; recent deployments
+stored before reaching a final status have their statuses re-requested and
+merged into the stored row.
 """
 
 import os
 import requests
-from datetime import datetime, timezone
+from datetime import datetime, timedelta, timezone
 from typing import List, Dict, Any, Optional
 from dotenv import load_dotenv
 from supabase import create_client
 
+import dora_rollups
+from deployment_store import TERMINAL_STATES
+
 load_dotenv()
 
 # -----------------------------
@@ -38,6 +45,10 @@ BASE_URL = "https://api.github.com/repos"
 PER_PAGE = 100
 TIMEOUT = 10
 
+# Deployments still pending after this long are taken as abandoned and no
+# longer have their statuses re-requested.
+STATUS_REFRESH_DAYS = float(os.getenv("STATUS_REFRESH_DAYS", "7"))
+
 # -----------------------------
 # CLIENTS
 # -----------------------------
@@ -76,27 +87,84 @@ def github_get(url: str, params: Optional[Dict[str, Any]] = None) -> Any:
 # -----------------------------
 
 
-def load_existing_records():
-    res = supabase.table("deployments_api").select("deployment_id, repo_name").execute()
+def fetch_checkpoint(repo_name: str) -> Optional[int]:
+    # Index-only probe of deployments_api_repo_deployment_id_idx
+    res = (
+        supabase.table("deployments_api")
+        .select("deployment_id")
+        .eq("repo_name", repo_name)
+        .order("deployment_id", desc=True)
+        .limit(1)
+        .execute()
+    )
+
+    return res.data[0]["deployment_id"] if res.data else None
+
+
+def upsert_deployments(records: List[Dict[str, Any]]) -> None:
+    # Merged, not ignored: a deployment written again carries a newer status.
+    supabase.table("deployments_api").upsert(
+        records, on_conflict="deployment_id", ignore_duplicates=False
+    ).execute()
+
+
+def fetch_pending_deployments(repo_name: str) -> List[Dict[str, Any]]:
+    # Served by the partial index deployments_api_pending_idx
+    cutoff = datetime.now(timezone.utc) - timedelta(days=STATUS_REFRESH_DAYS)
+    terminal = ",".join(sorted(TERMINAL_STATES))
+
+    res = (
+        supabase.table("deployments_api")
+        .select("*")
+        .eq("repo_name", repo_name)
+        .or_(f"status.is.null,status.not.in.({terminal})")
+        .gte("deployment_created_at", cutoff.isoformat())
+        .execute()
+    )
 
     return res.data or []
 
 
-def build_checkpoint(records):
-    checkpoint = {}
+def update_status(record: Dict[str, Any]) -> None:
+    supabase.table("deployments_api").update(
+        {
+            "status": record["status"],
+            "status_created_at": record["status_created_at"],
+        }
+    ).eq("deployment_id", record["deployment_id"]).execute()
+
+
+# -----------------------------
+# DEPLOYMENT STATUSES
+# -----------------------------
+
+
+def fetch_latest_status(repo_name: str, deployment_id: int) -> Dict[str, Any]:
+    statuses = (
+        github_get(
+            f"{BASE_URL}/{REPO_OWNER}/{repo_name}/deployments/{deployment_id}/statuses"
+        )
+        or []
+    )
+
+    return statuses[0] if statuses else {}
 
-    for r in records:
-        repo = r["repo_name"]
-        dep_id = r["deployment_id"]
 
-        if repo not in checkpoint or dep_id > checkpoint[repo]:
-            checkpoint[repo] = dep_id
+def refresh_pending_statuses(repo_name: str) -> List[Dict[str, Any]]:
+    """Stored deployments whose status moved on, with the new status merged in."""
+    updated = []
 
-    return checkpoint
+    for r in fetch_pending_deployments(repo_name):
+        latest_status = fetch_latest_status(repo_name, r["deployment_id"])
+        if not latest_status or latest_status.get("state") == r["status"]:
+            continue
 
+        r["status"] = latest_status.get("state")
+        r["status_created_at"] = latest_status.get("created_at")
+        update_status(r)
+        updated.append(r)
 
-def build_existing_id_set(records):
-    return {r["deployment_id"] for r in records}
+    return updated
 
 
 # -----------------------------
@@ -121,14 +189,7 @@ def fetch_incremental_deployments_for_repo(repo_name, last_deployment_id):
             if last_deployment_id and d["id"] <= last_deployment_id:
                 return records
 
-            statuses = (
-                github_get(
-                    f"{BASE_URL}/{REPO_OWNER}/{repo_name}/deployments/{d['id']}/statuses"
-                )
-                or []
-            )
-
-            latest_status = statuses[0] if statuses else {}
+            latest_status = fetch_latest_status(repo_name, d["id"])
 
             records.append(
                 {
@@ -161,30 +222,25 @@ def fetch_incremental_deployments_for_repo(repo_name, last_deployment_id):
 
 if __name__ == "__main__":
 
-    existing_records = load_existing_records()
-    checkpoint = build_checkpoint(existing_records)
-    existing_ids = build_existing_id_set(existing_records)
-
     new_records = []
+    updated_records = []
 
     for repo in REPOSITORIES:
-        last_id = checkpoint.get(repo)
+        last_id = fetch_checkpoint(repo)
         print(f"\nProcessing repo: {repo} | last_id={last_id}")
 
-        deployments = fetch_incremental_deployments_for_repo(repo, last_id)
-
-        for d in deployments:
-            if d["deployment_id"] in existing_ids:
-                continue
-
-            new_records.append(d)
-            existing_ids.add(d["deployment_id"])
+        updated_records.extend(refresh_pending_statuses(repo))
+        new_records.extend(fetch_incremental_deployments_for_repo(repo, last_id))
 
     if new_records:
-        supabase.table("deployments_api").insert(new_records).execute()
+        upsert_deployments(new_records)
+
+    # Pending deployments are folded once their final status is in.
+    dora_rollups.update(new_records + updated_records)
 
-        print("\n--------------------------------")
+    print("\n--------------------------------")
+    if new_records or updated_records:
         print(f"Inserted {len(new_records)} new deployments")
+        print(f"Updated the status of {len(updated_records)} deployments")
     else:
-        print("\n--------------------------------")
         print("No new deployments found")
@@ -5,6 +5,8 @@ from datetime import datetime, timezone
 from flask import Flask, request, abort, jsonify
 from supabase import create_client
 from dotenv import load_dotenv
+from admission_control import AdmissionQueue
+from payload_decoder import decode, PUSH_SCHEMA
 
 load_dotenv()
 
@@ -41,16 +43,30 @@ def verify_signature(req):
         abort(401)
 
 
+def insert_rows(rows):
+    # Redelivered commits are skipped row by row instead of failing the batch.
+    supabase.table("commits").upsert(
+        rows, on_conflict="repo_name,commit_sha", ignore_duplicates=True
+    ).execute()
+
+
+admission = AdmissionQueue(insert_rows).start()
+
+
 @app.route("/webhook", methods=["POST"])
 def webhook():
     verify_signature(request)
 
     event_type = request.headers.get("X-GitHub-Event")
-    payload = request.get_json()
 
     if event_type != "push":
         return jsonify({"status": "ignored", "event": event_type}), 200
 
+    try:
+        payload = decode(request.get_data(), PUSH_SCHEMA)
+    except ValueError:
+        abort(400)
+
     repo_name = payload["repository"]["full_name"]
     branch = payload["ref"].replace("refs/heads/", "")
 
@@ -71,18 +87,23 @@ def webhook():
     if not rows:
         return jsonify({"status": "no_commits"}), 200
 
-    try:
-        supabase.table("commits").insert(rows).execute()
-    except Exception as e:
-        error_msg = str(e).lower()
-        if "duplicate key" not in error_msg and "unique constraint" not in error_msg:
-            print("Supabase insert failed:", e)
+    if not admission.offer(rows):
+        return (
+            jsonify({"status": "overloaded"}),
+            503,
+            {"Retry-After": str(admission.retry_after)},
+        )
 
     return jsonify({
         "status": "received",
-        "insert_attempted": len(rows)
+        "insert_queued": len(rows)
     }), 200
 
 
+@app.route("/metrics", methods=["GET"])
+def metrics():
+    return jsonify(admission.stats()), 200
+
+
 if __name__ == "__main__":
     app.run(host="0.0.0.0", port=3000)
@@ -1,10 +1,13 @@
 import os
 import hmac
 import hashlib
-from datetime import datetime
+from datetime import datetime, timezone
 from flask import Flask, request, abort, jsonify
 from supabase import create_client
 from dotenv import load_dotenv
+from admission_control import AdmissionQueue
+from payload_decoder import decode, PUSH_SCHEMA
+from push_backfill import PushBackfill
 load_dotenv()
 
 
@@ -41,52 +44,78 @@ def verify_signature(req):
         abort(401)
 
 
-@app.route("/webhook", methods=["POST"])
-def webhook():
-    verify_signature(request)
+def insert_rows(rows):
+    # Redelivered commits are skipped row by row instead of failing the batch.
+    supabase.table("commits").upsert(
+        rows, on_conflict="repo_name,commit_sha", ignore_duplicates=True
+    ).execute()
 
-    event_type = request.headers.get("X-GitHub-Event")
-    payload = request.get_json()
-
-    if event_type != "push":
-        return jsonify({"status": "ignored", "event": event_type}), 200
 
+def build_rows(payload, commits):
     repo_name = payload["repository"]["full_name"]
     branch = payload["ref"].replace("refs/heads/", "")
 
-    rows = []
-
-    for commit in payload.get("commits", []):
-        rows.append({
-            "event_type": event_type,
+    return [
+        {
+            "event_type": "push",
             "commit_sha": commit["id"],
             "commit_timestamp": commit["timestamp"],
             "repo_name": repo_name,
             "author": commit["author"]["name"],
             "branch": branch,
-            "ingested_at": datetime.utcnow().isoformat()
-        })
+            "ingested_at": datetime.now(timezone.utc).isoformat()
+        }
+        for commit in commits
+    ]
+
+
+def insert_backfilled(payload, commits):
+    insert_rows(build_rows(payload, commits))
+
+
+admission = AdmissionQueue(insert_rows).start()
+backfill = PushBackfill(insert_backfilled)
+
+
+@app.route("/webhook", methods=["POST"])
+def webhook():
+    verify_signature(request)
+
+    event_type = request.headers.get("X-GitHub-Event")
+
+    if event_type != "push":
+        return jsonify({"status": "ignored", "event": event_type}), 200
+
+    try:
+        payload = decode(request.get_data(), PUSH_SCHEMA)
+    except ValueError:
+        abort(400)
+
+    rows = build_rows(payload, payload["commits"])
 
     if not rows:
         return jsonify({"status": "no_commits"}), 200
 
-    try:
-        supabase.table("commits").insert(rows).execute()
-    except Exception as e:
-        error_msg = str(e).lower()
+    if not admission.offer(rows):
+        return (
+            jsonify({"status": "overloaded"}),
+            503,
+            {"Retry-After": str(admission.retry_after)},
+        )
 
-        if "duplicate key" in error_msg or "unique constraint" in error_msg:
-            # Idempotency working as intended
-            pass
-        else:
-            # Log real failures
-            print("Supabase insert failed:", e)
+    # Payload capped at 20 commits: fetch the rest in the background.
+    backfill.maybe_submit(payload)
 
     return jsonify({
         "status": "received",
-        "insert_attempted": len(rows)
+        "insert_queued": len(rows)
     }), 200
 
 
+@app.route("/metrics", methods=["GET"])
+def metrics():
+    return jsonify({**admission.stats(), **backfill.stats()}), 200
+
+
 if __name__ == "__main__":
     app.run(host="0.0.0.0", port=3000)
@@ -0,0 +1,8 @@
+import os
+import sys
+
+# The modules are top-level scripts, imported from the repository root.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# github_client refuses to import without a token; no test makes a request.
+os.environ.setdefault("ACCESS_TOKEN", "test-token")
@@ -0,0 +1,57 @@
+import pytest
+
+from admission_control import AdmissionQueue
+
+
+def take(admission, n):
+    # Stand-in for the sink workers, which these tests do not start.
+    for _ in range(n):
+        admission._queue.get_nowait()
+        admission._queue.task_done()
+
+
+def test_sheds_at_high_water_until_drained_to_low_water():
+    admission = AdmissionQueue(lambda item: None, high_water=4, low_water=2)
+
+    assert all(admission.offer(i) for i in range(4))
+    assert not admission.offer(4)
+    assert admission.stats()["shedding"]
+
+    # Below high water but above low water: still shedding.
+    take(admission, 1)
+    assert not admission.offer(5)
+
+    take(admission, 1)
+    assert admission.offer(6)
+    assert not admission.stats()["shedding"]
+
+    assert admission.accepted == 5
+    assert admission.shed == 2
+
+
+def test_workers_feed_the_sink():
+    received = []
+    admission = AdmissionQueue(received.append, high_water=100, low_water=10).start()
+
+    for i in range(20):
+        assert admission.offer(i)
+
+    assert admission.drain(timeout=5)
+    assert sorted(received) == list(range(20))
+    assert admission.processed == 20
+
+
+def test_sink_errors_are_counted_not_raised():
+    def sink(item):
+        raise OSError("disk full")
+
+    admission = AdmissionQueue(sink, high_water=10, low_water=5).start()
+    admission.offer("event")
+
+    assert admission.drain(timeout=5)
+    assert admission.sink_errors == 1
+
+
+def test_low_water_must_be_below_high_water():
+    with pytest.raises(ValueError):
+        AdmissionQueue(lambda item: None, high_water=5, low_water=5)
@@ -0,0 +1,41 @@
+import pytest
+
+import analytics_export
+import json_store
+
+
+@pytest.fixture(autouse=True)
+def export_dir(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(analytics_export, "EXPORT_DIR", str(tmp_path / "analytics"))
+    monkeypatch.setattr(
+        analytics_export, "STATE_FILE", str(tmp_path / "analytics" / "export_state.json")
+    )
+
+
+def commit(sha):
+    return {
+        "event_type": "commit",
+        "commit_sha": sha,
+        "commit_timestamp": "2024-05-01T10:00:00Z",
+        "repo_owner": "acme",
+        "repo_name": "app",
+        "branch": "main",
+        "parent_shas": [],
+    }
+
+
+@pytest.mark.parametrize("fmt", ["arrow", "parquet"])
+def test_load_reads_the_format_the_dataset_was_exported_in(fmt, monkeypatch):
+    json_store.save_records([commit("a" * 40), commit("b" * 40)], "github_commits_branch_aware.json")
+
+    state = {}
+    analytics_export.export_dataset("commits", state, fmt=fmt)
+    analytics_export.save_state(state, analytics_export.STATE_FILE)
+
+    # The configured format has changed since the export.
+    other = "parquet" if fmt == "arrow" else "arrow"
+    monkeypatch.setattr(analytics_export, "EXPORT_FORMAT", other)
+
+    table = analytics_export.load("commits", columns=["commit_sha"], repo="acme__app")
+    assert sorted(table.column("commit_sha").to_pylist()) == ["a" * 40, "b" * 40]
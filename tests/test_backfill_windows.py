@@ -0,0 +1,83 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+import multi_repo_commit_fetcher as fetcher
+
+
+def fake_history(times):
+    """A probe_commits stand-in over commits at the given times."""
+    newest_first = sorted(times, reverse=True)
+
+    def probe(repo_name, branch, since=None, until=None, page=1):
+        selected = [
+            t
+            for t in newest_first
+            if (since is None or t >= fetcher._parse(since))
+            and (until is None or t <= fetcher._parse(until))
+        ]
+        commit = None
+        if 0 < page <= len(selected):
+            date = fetcher._format(selected[page - 1])
+            commit = {"commit": {"committer": {"date": date}}}
+        return len(selected), commit
+
+    return probe
+
+
+@pytest.fixture
+def small_windows(monkeypatch):
+    monkeypatch.setattr(fetcher, "BACKFILL_WINDOW_COMMITS", 10)
+    monkeypatch.setattr(fetcher, "MAX_WINDOW_COMMITS", 20)
+
+
+def plan(monkeypatch, times):
+    monkeypatch.setattr(fetcher, "probe_commits", fake_history(times))
+    with ThreadPoolExecutor(4) as pool:
+        return fetcher.plan_windows("repo", "main", pool)
+
+
+def window_count(times, window):
+    count, _ = fake_history(times)("repo", "main", *window)
+    return count
+
+
+def assert_contiguous(windows):
+    assert windows[0][0] is None and windows[-1][1] is None
+    for (_, hi), (lo, _) in zip(windows, windows[1:]):
+        assert hi == lo
+
+
+def test_short_history_is_one_open_window(monkeypatch, small_windows):
+    start = datetime(2026, 1, 1, tzinfo=timezone.utc)
+    times = [start + timedelta(hours=i) for i in range(10)]
+
+    assert plan(monkeypatch, times) == [(None, None)]
+
+
+def test_even_history_is_split_by_density(monkeypatch, small_windows):
+    start = datetime(2026, 1, 1, tzinfo=timezone.utc)
+    times = [start + timedelta(hours=i) for i in range(100)]
+
+    windows = plan(monkeypatch, times)
+
+    assert_contiguous(windows)
+    assert len(windows) == 10
+    assert all(window_count(times, w) <= 20 for w in windows)
+
+
+def test_dense_bursts_are_halved(monkeypatch, small_windows):
+    start = datetime(2026, 1, 1, tzinfo=timezone.utc)
+    times = [start + timedelta(days=i) for i in range(60)]
+    burst = start + timedelta(days=30)
+    times += [burst + timedelta(minutes=5 * i) for i in range(120)]
+
+    windows = plan(monkeypatch, times)
+
+    assert_contiguous(windows)
+    for since, until in windows:
+        lo = fetcher._parse(since) if since else min(times)
+        hi = fetcher._parse(until) if until else max(times)
+        # Over the cap only where MIN_WINDOW stopped the halving.
+        assert window_count(times, (since, until)) <= 20 or hi - lo <= 2 * fetcher.MIN_WINDOW
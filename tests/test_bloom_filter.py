@@ -0,0 +1,51 @@
+from bloom_filter import ScalableBloomFilter
+
+
+def keys(prefix, n):
+    return [f"{prefix}-{i}".encode() for i in range(n)]
+
+
+def test_no_false_negatives_across_layers():
+    bloom = ScalableBloomFilter(fp_rate=0.01, initial_capacity=100)
+    added = keys("sha", 1000)
+    bloom.update(added)
+
+    assert len(bloom.layers) > 1
+    assert all(k in bloom for k in added)
+
+
+def test_false_positive_rate_stays_near_target():
+    bloom = ScalableBloomFilter(fp_rate=0.01, initial_capacity=500)
+    bloom.update(keys("sha", 5000))
+
+    false_positives = sum(k in bloom for k in keys("absent", 20000))
+
+    assert false_positives / 20000 < 0.02
+
+
+def test_duplicate_adds_are_not_counted():
+    bloom = ScalableBloomFilter(initial_capacity=100)
+    bloom.update(keys("sha", 50))
+    bloom.update(keys("sha", 50))
+
+    assert len(bloom) == 50
+
+
+def test_save_and_load_round_trip(tmp_path):
+    path = str(tmp_path / "filter.bloom")
+    bloom = ScalableBloomFilter(fp_rate=0.01, initial_capacity=100)
+    bloom.update(keys("sha", 300))
+    bloom.save(path)
+
+    loaded = ScalableBloomFilter.load(path)
+
+    assert len(loaded.layers) == len(bloom.layers)
+    assert len(loaded) == len(bloom)
+    assert all(k in loaded for k in keys("sha", 300))
+
+
+def test_load_missing_file_gives_an_empty_filter(tmp_path):
+    bloom = ScalableBloomFilter.load(str(tmp_path / "missing.bloom"))
+
+    assert len(bloom) == 0
+    assert b"anything" not in bloom
@@ -0,0 +1,76 @@
+import pytest
+
+import commit_graph
+from commit_graph import CommitGraph, GraphUpdates, load_graph
+
+A, B, C, D = (c * 40 for c in "abcd")
+
+
+@pytest.fixture(autouse=True)
+def graph_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(commit_graph, "GRAPH_DIR", str(tmp_path / "graphs"))
+
+
+def record(sha, parents, owner="acme", repo="app"):
+    return {"repo_owner": owner, "repo_name": repo, "commit_sha": sha, "parent_shas": parents}
+
+
+def test_ancestry_and_range():
+    graph = CommitGraph()
+    # Newest first, as the commits API pages.
+    graph.add_commits([(D, [B, C]), (C, [A]), (B, [A]), (A, [])])
+
+    assert graph.is_ancestor(A, D)
+    assert not graph.is_ancestor(B, C)
+    assert sorted(graph.range(B, D)) == sorted([D, C])
+
+
+def test_graphs_are_kept_per_owner():
+    updates = GraphUpdates()
+    updates.add([record(A, [], owner="acme"), record(B, [], owner="other")])
+    updates.save()
+
+    assert A in load_graph("acme", "app") and B not in load_graph("acme", "app")
+    assert B in load_graph("other", "app") and A not in load_graph("other", "app")
+
+
+def test_runs_saving_concurrently_keep_each_others_edges():
+    first, second = GraphUpdates(), GraphUpdates()
+    first.add([record(B, [A]), record(A, [])])
+    second.add([record(C, [B])])
+
+    second.save()
+    first.save()
+
+    graph = load_graph("acme", "app")
+    assert all(sha in graph for sha in (A, B, C))
+    assert graph.is_ancestor(A, C)
+
+
+def test_graph_is_written_once_per_save(monkeypatch):
+    saves = []
+    original = CommitGraph.save
+    monkeypatch.setattr(
+        CommitGraph, "save", lambda self, path: (saves.append(path), original(self, path))
+    )
+
+    updates = GraphUpdates()
+    for sha, parent in ((B, A), (C, B), (D, C)):
+        updates.add([record(sha, [parent])])
+    updates.save()
+
+    assert len(saves) == 1
+
+
+def test_legacy_graph_of_the_default_owner_is_read(tmp_path):
+    legacy = CommitGraph()
+    legacy.add_commit(A, [])
+    (tmp_path / "graphs").mkdir()
+    legacy.save(str(tmp_path / "graphs" / "app.bin"))
+
+    updates = GraphUpdates()
+    updates.add([record(B, [A], owner=commit_graph.REPO_OWNER)])
+    updates.save()
+
+    graph = load_graph(commit_graph.REPO_OWNER, "app")
+    assert A in graph and graph.is_ancestor(A, B)
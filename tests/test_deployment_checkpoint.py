@@ -0,0 +1,62 @@
+from incremental_deployments_fetch import REPO_OWNER, build_checkpoint, mark_unlisted
+from timestamps import normalize, to_epoch_us
+
+COMPLETE = {
+    "commit_sha": "abc",
+    "ref": "main",
+    "deployment_created_at": "2024-05-01T10:00:00Z",
+    "environment": "production",
+}
+
+
+def record(deployment_id, **fields):
+    r = {
+        "deployment_id": deployment_id,
+        "repo_owner": REPO_OWNER,
+        "repo_name": "app",
+        "ingested_at": "2024-05-01T10:00:00+00:00",
+    }
+    r.update(fields)
+    return normalize(r)
+
+
+def polled(deployment_id):
+    return record(deployment_id, reconciled=True, **COMPLETE)
+
+
+def webhook(deployment_id, **fields):
+    return record(deployment_id, source="webhook", status="success", **fields)
+
+
+def test_unreconciled_webhook_record_holds_the_checkpoint():
+    records = [polled(10), webhook(12), polled(11)]
+
+    assert build_checkpoint(records) == {"app": 11}
+
+
+def test_reconciled_complete_webhook_record_advances_it():
+    records = [polled(10), webhook(12, reconciled=True, **COMPLETE)]
+
+    assert build_checkpoint(records) == {"app": 12}
+
+
+def test_unlisted_record_stops_holding():
+    records = [polled(10), polled(13), webhook(12, unlisted=True)]
+
+    assert build_checkpoint(records) == {"app": 13}
+
+
+def test_mark_unlisted_only_records_the_listing_should_have_returned():
+    listed_from_us = to_epoch_us("2024-05-02T00:00:00Z")
+    records = [
+        polled(10),
+        webhook(11),  # returned by the listing
+        webhook(12),  # deleted
+        webhook(9),  # below last_id, not listed this time
+        webhook(14, ingested_at="2024-05-03T00:00:00+00:00"),  # after the listing
+        webhook(15, reconciled=True, **COMPLETE),  # not held
+    ]
+
+    updates = mark_unlisted(records, "app", REPO_OWNER, 10, {11}, listed_from_us)
+
+    assert updates == [{"deployment_id": 12, "unlisted": True}]
@@ -0,0 +1,123 @@
+import random
+
+import dora_rollups
+from timestamps import from_epoch_us
+
+HOUR_US = 3600 * 1_000_000
+START_US = 1_767_225_600 * 1_000_000  # 2026-01-01T00:00:00Z
+
+
+def deployment(deployment_id, hours, status, environment="production", status_after_hours=0.1):
+    created_us = START_US + int(hours * HOUR_US)
+    return {
+        "deployment_id": deployment_id,
+        "repo_name": "repo",
+        "environment": environment,
+        "deployment_created_at": from_epoch_us(created_us),
+        "status": status,
+        "status_created_at": from_epoch_us(created_us + int(status_after_hours * HOUR_US)),
+    }
+
+
+def history(n=200, seed=7):
+    rng = random.Random(seed)
+    records, hours = [], 0.0
+    for i in range(n):
+        hours += rng.randint(1, 30)
+        records.append(
+            deployment(
+                i,
+                hours,
+                rng.choice(["success", "success", "inactive", "failure", "error"]),
+                rng.choice(["production", "staging"]),
+            )
+        )
+    return records
+
+
+def test_restore_time_runs_from_the_first_failure(tmp_path):
+    path = str(tmp_path / "rollups.sqlite")
+    dora_rollups.update(
+        [
+            deployment(1, 0, "failure"),
+            deployment(2, 1, "error"),
+            deployment(3, 3, "success"),
+        ],
+        path,
+    )
+
+    (row,) = dora_rollups.rollups("weekly", path=path)
+
+    assert row["deployments"] == 3
+    assert row["failures"] == 2
+    assert row["change_failure_rate"] == 2 / 3
+    assert row["restores"] == 1
+    assert row["mttr_seconds"] == 3 * 3600
+
+
+def test_inactive_restores_at_its_creation_time(tmp_path):
+    path = str(tmp_path / "rollups.sqlite")
+    dora_rollups.update(
+        [
+            deployment(1, 0, "failure"),
+            # Superseded a day later; that is not when it restored service.
+            deployment(2, 2, "inactive", status_after_hours=24),
+        ],
+        path,
+    )
+
+    (row,) = dora_rollups.rollups("weekly", path=path)
+
+    assert row["mttr_seconds"] == 2 * 3600 - 0.1 * 3600
+
+
+def test_folding_is_idempotent_and_skips_pending(tmp_path):
+    path = str(tmp_path / "rollups.sqlite")
+    records = [deployment(1, 0, "success"), deployment(2, 1, "in_progress")]
+
+    assert dora_rollups.update(records, path) == 1
+    assert dora_rollups.update(records, path) == 0
+
+    records[1]["status"] = "failure"
+    assert dora_rollups.update(records, path) == 1
+
+
+def test_out_of_order_folds_match_a_rebuild(tmp_path):
+    records = history()
+    rebuilt = str(tmp_path / "rebuilt.sqlite")
+    incremental = str(tmp_path / "incremental.sqlite")
+
+    dora_rollups.rebuild(records, rebuilt)
+
+    shuffled = records[:]
+    random.Random(3).shuffle(shuffled)
+    for i in range(0, len(shuffled), 9):
+        dora_rollups.update(shuffled[i : i + 9], incremental)
+
+    for period in dora_rollups.PERIODS:
+        assert dora_rollups.rollups(period, path=incremental) == dora_rollups.rollups(
+            period, path=rebuilt
+        )
+
+
+def test_late_failure_refolds_the_restore(tmp_path):
+    path = str(tmp_path / "rollups.sqlite")
+    dora_rollups.update([deployment(2, 2, "success")], path)
+    assert dora_rollups.rollups("weekly", path=path)[0]["restores"] == 0
+
+    # A webhook for an earlier failed deployment arrives late.
+    dora_rollups.update([deployment(1, 0, "failure")], path)
+
+    (row,) = dora_rollups.rollups("weekly", path=path)
+    assert row["restores"] == 1
+    assert row["mttr_seconds"] == 2 * 3600
+
+
+def test_fold_events_carries_the_open_failure():
+    buckets, open_failure = dora_rollups.fold_events(
+        [(START_US, START_US + 10, True), (START_US + HOUR_US, START_US + HOUR_US, True)]
+    )
+
+    assert open_failure == START_US + 10
+    daily = [b for (period, _, _), b in buckets.items() if period == "daily"]
+    assert daily[0]["failures"] == 2
@@ -0,0 +1,100 @@
+import json_store
+
+
+def test_page_log_merges_every_n_pages(tmp_path):
+    path = str(tmp_path / "records.json")
+    merges = []
+
+    def merge(records):
+        merges.append(len(records))
+        return json_store.append_unique(records, path, "id")
+
+    log = json_store.PageLog(path, merge, every=3)
+
+    assert log.append([{"id": 1}]) == 0
+    assert log.append([{"id": 2}, {"id": 1}]) == 0
+    assert json_store.load_records(path) == []
+
+    assert log.append([{"id": 3}]) == 3
+    assert merges == [4]
+    assert [r["id"] for r in json_store.load_records(path)] == [1, 2, 3]
+
+    assert log.flush() == 0
+    assert merges == [4]
+
+
+def test_page_log_recovers_pages_of_a_dead_run(tmp_path):
+    path = str(tmp_path / "records.json")
+
+    def merge(records):
+        return json_store.append_unique(records, path, "id")
+
+    json_store.PageLog(path, merge).append([{"id": 1}])
+    # The run died mid-write of its next page.
+    with open(f"{path}.pages", "a", encoding="utf-8") as f:
+        f.write('{"id": 2, "na')
+
+    log = json_store.PageLog(path, merge)
+    log.append([{"id": 3}])
+
+    assert log.flush() == 2
+    assert [r["id"] for r in json_store.load_records(path)] == [1, 3]
+
+
+def test_save_records_layouts_load_back(tmp_path):
+    records = [{"id": 1, "name": "ä"}, {"id": 2, "nested": {"a": [1, 2]}}]
+
+    for pretty in (False, True):
+        path = str(tmp_path / f"records-{pretty}.json")
+        json_store.save_records(records, path, pretty=pretty)
+        assert json_store.load_records(path) == records
+
+
+def test_load_tail_reads_records_appended_after_an_offset(tmp_path):
+    for pretty in (False, True):
+        path = str(tmp_path / f"records-{pretty}.json")
+        json_store.save_records([], path, pretty=pretty)
+        empty_end = json_store.array_end(path)
+
+        json_store.save_records([{"id": 1}], path, pretty=pretty)
+        end = json_store.array_end(path)
+        json_store.save_records([{"id": 1}, {"id": 2}, {"id": 3}], path, pretty=pretty)
+
+        assert json_store.load_tail(path, empty_end)[0] == [{"id": 1}, {"id": 2}, {"id": 3}]
+        records, new_end = json_store.load_tail(path, end)
+        assert records == [{"id": 2}, {"id": 3}]
+        assert new_end == json_store.array_end(path)
+        assert json_store.load_tail(path, new_end) == ([], new_end)
+
+
+def test_append_records_matches_save_records_layout(tmp_path):
+    for pretty in (False, True):
+        appended = str(tmp_path / f"appended-{pretty}.json")
+        saved = str(tmp_path / f"saved-{pretty}.json")
+
+        json_store.save_records([], appended, pretty=pretty)
+        json_store.append_records([{"id": 1}], appended, pretty=pretty)
+        json_store.append_records([{"id": 2}, {"id": 3}], appended, pretty=pretty)
+        json_store.save_records([{"id": 1}, {"id": 2}, {"id": 3}], saved, pretty=pretty)
+
+        with open(appended, "rb") as a, open(saved, "rb") as s:
+            assert a.read() == s.read()
+
+
+def test_torn_append_is_cut_off(tmp_path):
+    path = str(tmp_path / "records.json")
+    json_store.save_records([{"id": 1}], path)
+
+    # An append that died mid-write.
+    end = json_store.array_end(path)
+    with open(f"{path}.append", "w", encoding="utf-8") as f:
+        f.write(str(end))
+    with open(path, "r+b") as f:
+        f.seek(end)
+        f.write(b',\n{"id":2,"na')
+        f.truncate()
+
+    assert json_store.load_records(path) == [{"id": 1}]
+
+    json_store.append_records([{"id": 3}], path)
+    assert json_store.load_records(path) == [{"id": 1}, {"id": 3}]
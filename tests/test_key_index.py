@@ -0,0 +1,98 @@
+import json
+
+import pytest
+
+import json_store
+from key_index import ID_WIDTH, KeyIndex, id_key
+
+
+def record(n, repo="app"):
+    return {"repo_name": repo, "id": n}
+
+
+def update_meta(meta, records):
+    meta["max_id"] = max([meta.get("max_id", 0)] + [r["id"] for r in records])
+
+
+@pytest.fixture
+def source(tmp_path):
+    path = str(tmp_path / "records.json")
+    json_store.save_records([record(1), record(2)], path)
+    return path
+
+
+def make_index(source, tmp_path):
+    return KeyIndex(
+        "records",
+        source,
+        ID_WIDTH,
+        repo_of=lambda r: r["repo_name"],
+        key_of=lambda r: id_key(r["id"]),
+        update_meta=update_meta,
+        directory=str(tmp_path / "indexes"),
+    )
+
+
+def test_records_appended_by_other_writers_are_indexed_from_the_tail(
+    source, tmp_path, monkeypatch
+):
+    assert make_index(source, tmp_path).open()
+
+    json_store.append_unique([record(3), record(4, repo="lib")], source, "id")
+
+    index = make_index(source, tmp_path)
+    loads = []
+    monkeypatch.setattr(json_store, "load_records", lambda path: loads.append(path))
+
+    assert not index.open()
+    assert loads == []
+    assert index.contains("app", id_key(3)) and index.contains("lib", id_key(4))
+    assert index.contains("app", id_key(1))
+    assert index.meta["max_id"] == 4
+
+
+def test_rewritten_source_is_rebuilt(source, tmp_path):
+    make_index(source, tmp_path).open()
+
+    json_store.save_records([record(5)], source)
+
+    index = make_index(source, tmp_path)
+    assert index.open()
+    assert index.contains("app", id_key(5))
+    assert not index.contains("app", id_key(1))
+
+
+def test_append_writes_only_records_not_indexed(source, tmp_path, monkeypatch):
+    index = make_index(source, tmp_path)
+    index.open()
+    json_store.append_unique([record(3)], source, "id")
+
+    monkeypatch.setattr(json_store, "load_records", None)
+    monkeypatch.setattr(json_store, "save_records", None)
+    assert index.append([record(2), record(3), record(4), record(4)]) == 1
+
+    monkeypatch.undo()
+    assert [r["id"] for r in json_store.load_records(source)] == [1, 2, 3, 4]
+    assert index.meta["max_id"] == 4
+    assert not make_index(source, tmp_path).open()
+
+
+def test_appends_from_two_processes_are_not_duplicated(source, tmp_path):
+    first, second = make_index(source, tmp_path), make_index(source, tmp_path)
+    first.open()
+    second.open()
+
+    assert first.append([record(3)]) == 1
+    assert second.append([record(3), record(4)]) == 1
+    assert first.append([record(4), record(5)]) == 1
+
+    assert [r["id"] for r in json_store.load_records(source)] == [1, 2, 3, 4, 5]
+
+
+def test_manifest_from_before_offsets_is_rebuilt(source, tmp_path):
+    index = make_index(source, tmp_path)
+    index.open()
+    with open(index.manifest_path, "w", encoding="utf-8") as f:
+        json.dump({"source": [123, 456], "meta": {}}, f)
+
+    assert make_index(source, tmp_path).open()
@@ -0,0 +1,95 @@
+import commit_graph
+from lead_time_metrics import commit_lead_times, pr_lead_times
+from timestamps import normalize
+
+SHA_A = "a" * 40
+SHA_B = "b" * 40
+
+
+def commit(sha, ts, owner="acme", **fields):
+    c = {
+        "repo_owner": owner,
+        "repo_name": "app",
+        "commit_sha": sha,
+        "branch": "main",
+        "commit_timestamp": ts,
+    }
+    c.update(fields)
+    return normalize(c)
+
+
+def deployment(deployment_id, sha, ts, owner="acme"):
+    return normalize(
+        {
+            "deployment_id": deployment_id,
+            "repo_owner": owner,
+            "repo_name": "app",
+            "environment": "production",
+            "ref": "main",
+            "commit_sha": sha,
+            "deployment_created_at": ts,
+            "status": "success",
+        }
+    )
+
+
+def graph_of(*commits):
+    graph = commit_graph.CommitGraph()
+    graph.add_commits(commits)
+    return graph
+
+
+def test_exact_sha_match_is_not_relabelled_by_ancestry():
+    commits = [commit(SHA_A, "2024-05-01T10:00:00Z")]
+    deployments = [deployment(1, SHA_A, "2024-05-01T11:00:00Z")]
+    graphs = {("acme", "app"): graph_of((SHA_A, []))}
+
+    [row] = commit_lead_times(commits, deployments, graphs)
+
+    assert row["match"] == "sha"
+    assert row["lead_time_seconds"] == 3600
+
+
+def test_ancestry_outranks_branch_fallback():
+    commits = [commit(SHA_A, "2024-05-01T10:00:00Z")]
+    deployments = [deployment(1, SHA_B, "2024-05-01T12:00:00Z")]
+    graphs = {("acme", "app"): graph_of((SHA_A, []), (SHA_B, [SHA_A]))}
+
+    [row] = commit_lead_times(commits, deployments, graphs)
+
+    assert row["match"] == "ancestry"
+    assert row["deployment_id"] == 1
+
+
+def test_same_repo_name_under_another_owner_does_not_match():
+    commits = [commit(SHA_A, "2024-05-01T10:00:00Z", owner="acme")]
+    deployments = [deployment(1, SHA_A, "2024-05-01T11:00:00Z", owner="other")]
+
+    [row] = commit_lead_times(commits, deployments)
+
+    assert row["repo_owner"] == "acme"
+    assert row["deployment_id"] is None
+
+
+def test_records_without_a_usable_timestamp_are_skipped():
+    commits = [
+        commit(SHA_A, "2024-05-01T10:00:00Z"),
+        commit(SHA_B, None),
+        {"repo_owner": "acme", "repo_name": "app", "commit_sha": "c" * 40,
+         "branch": "main", "commit_timestamp": "not a time"},
+    ]
+    deployments = [
+        deployment(1, SHA_A, "2024-05-01T11:00:00Z"),
+        {**deployment(2, SHA_A, "2024-05-01T09:00:00Z"),
+         "deployment_created_at": "bad", "deployment_created_at_us": None},
+    ]
+    prs = [
+        {"repo_owner": "acme", "repo_name": "app", "pr_id": 1, "pr_number": 1,
+         "merge_commit_sha": SHA_A, "target_branch": "main", "merged_at": None},
+    ]
+
+    rows = commit_lead_times(commits, deployments)
+
+    assert [r["commit_sha"] for r in rows] == [SHA_A]
+    assert rows[0]["deployment_id"] == 1
+    assert pr_lead_times(prs, deployments) == []
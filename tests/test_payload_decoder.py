@@ -0,0 +1,60 @@
+import json
+
+import pytest
+
+import payload_decoder
+from payload_decoder import DEPLOYMENT_SCHEMA, PUSH_SCHEMA, decode
+
+
+@pytest.fixture(params=["msgspec", "projection"])
+def decoder_path(request, monkeypatch):
+    if request.param == "projection":
+        monkeypatch.setattr(payload_decoder, "msgspec", None)
+    elif payload_decoder.msgspec is None:
+        pytest.skip("msgspec is not installed")
+    return request.param
+
+
+def test_keeps_only_schema_fields(decoder_path):
+    raw = json.dumps(
+        {
+            "ref": "refs/heads/main",
+            "after": "abc",
+            "sender": {"login": "octocat"},
+            "repository": {"full_name": "o/r", "private": False},
+            "commits": [{"id": "abc", "message": "m"}],
+        }
+    ).encode()
+
+    payload = decode(raw, PUSH_SCHEMA)
+
+    assert "sender" not in payload
+    assert payload["repository"]["full_name"] == "o/r"
+    assert "private" not in payload["repository"]
+    assert payload["commits"][0]["id"] == "abc"
+    assert "message" not in payload["commits"][0]
+
+
+def test_null_stands_for_a_missing_field(decoder_path):
+    payload = decode(b'{"deployment": null, "repository": {"full_name": null}}', DEPLOYMENT_SCHEMA)
+
+    assert payload["deployment"] is None
+    assert payload["repository"]["full_name"] is None
+
+
+@pytest.mark.parametrize(
+    "raw",
+    [
+        b'{"deployment": {"id": "12"}}',
+        b'{"deployment": {"id": true}}',
+        b'{"deployment": []}',
+        b'{"ref": "x", "commits": {"id": "abc"}}',
+        b'[]',
+        b'{"ref": ',
+    ],
+)
+def test_type_mismatch_raises_value_error(decoder_path, raw):
+    schema = PUSH_SCHEMA if b"commits" in raw else DEPLOYMENT_SCHEMA
+
+    with pytest.raises(ValueError):
+        decode(raw, schema)
@@ -0,0 +1,49 @@
+import pytest
+
+from repo_discovery import HashRing, parse_shard, repos_for_shard
+
+REPOS = [f"owner-{i % 7}/repo-{i}" for i in range(2000)]
+
+
+def test_shard_for_is_deterministic_and_in_range():
+    ring = HashRing(4)
+
+    shards = [ring.shard_for(name) for name in REPOS]
+
+    assert shards == [HashRing(4).shard_for(name) for name in REPOS]
+    assert set(shards) == {0, 1, 2, 3}
+
+
+def test_load_is_roughly_balanced():
+    ring = HashRing(4)
+    counts = [0] * 4
+    for name in REPOS:
+        counts[ring.shard_for(name)] += 1
+
+    assert max(counts) < 1.5 * len(REPOS) / 4
+
+
+def test_adding_a_shard_only_moves_repos_to_it():
+    before = HashRing(4)
+    after = HashRing(5)
+
+    moved = [name for name in REPOS if before.shard_for(name) != after.shard_for(name)]
+
+    assert all(after.shard_for(name) == 4 for name in moved)
+    assert len(moved) < len(REPOS) / 3
+
+
+def test_repos_for_shard_partitions_the_list():
+    owned = [repos_for_shard(REPOS, i, 3) for i in range(3)]
+
+    assert sorted(sum(owned, [])) == sorted(REPOS)
+    assert repos_for_shard(REPOS, 0, 1) == REPOS
+
+
+def test_parse_shard():
+    assert parse_shard(None) == (0, 1)
+    assert parse_shard("2/8") == (2, 8)
+    with pytest.raises(ValueError):
+        parse_shard("8/8")
+    with pytest.raises(ValueError):
+        HashRing(0)
@@ -0,0 +1,56 @@
+from timestamps import (
+    as_epoch_us,
+    epoch_of,
+    from_epoch_us,
+    later,
+    normalize,
+    to_epoch_us,
+)
+
+
+def test_to_epoch_us_forms_agree():
+    us = to_epoch_us("2026-01-12T10:00:00Z")
+
+    assert us == 1768212000 * 1_000_000
+    assert to_epoch_us("2026-01-12T15:30:00+05:30") == us
+    # Naive values were written as UTC.
+    assert to_epoch_us("2026-01-12T10:00:00") == us
+
+
+def test_to_epoch_us_keeps_microseconds():
+    assert to_epoch_us("2026-01-12T10:00:00.000123Z") % 1_000_000 == 123
+
+
+def test_from_epoch_us_round_trips():
+    for ts in ("2026-01-12T10:00:00Z", "2026-01-12T10:00:00.250000Z", "1969-12-31T23:59:59Z"):
+        assert from_epoch_us(to_epoch_us(ts)) == ts
+
+
+def test_as_epoch_us_accepts_ints_strings_and_none():
+    assert as_epoch_us(None) is None
+    assert as_epoch_us(42) == 42
+    assert as_epoch_us("1970-01-01T00:00:01Z") == 1_000_000
+
+
+def test_normalize_adds_epoch_columns():
+    record = normalize({"commit_timestamp": "2026-01-12T10:00:00Z", "merged_at": None})
+
+    assert record["commit_timestamp_us"] == to_epoch_us("2026-01-12T10:00:00Z")
+    assert record["merged_at_us"] is None
+    assert "created_at_us" not in record
+
+
+def test_epoch_of_falls_back_to_the_string():
+    assert epoch_of({"created_at": "1970-01-01T00:00:02Z"}, "created_at") == 2_000_000
+    assert epoch_of({"created_at_us": 5, "created_at": "ignored"}, "created_at") == 5
+    assert epoch_of({}, "created_at") is None
+
+
+def test_later_compares_instants_not_strings():
+    # "+05:30" sorts after "Z" as a string but is the earlier instant.
+    a = "2026-01-12T12:00:00+05:30"
+    b = "2026-01-12T10:00:00Z"
+
+    assert later(a, b) == b
+    assert later(None, b) == b
+    assert later(a, None) == a
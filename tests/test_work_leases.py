@@ -0,0 +1,75 @@
+import sqlite3
+
+import pytest
+
+from work_leases import LeaseStore, SQLiteLeaseStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    return SQLiteLeaseStore(str(tmp_path / "leases.db"))
+
+
+def test_lease_store_is_abstract():
+    with pytest.raises(TypeError):
+        LeaseStore()
+
+
+def test_claimed_item_is_not_claimable_until_released(store):
+    lease = store.claim("commits", ["app"])
+
+    assert lease.repo_name == "app"
+    assert store.claim("commits", ["app"]) is None
+
+    assert lease.release({"since": 1})
+    again = store.claim("commits", ["app"])
+    assert again.checkpoint == {"since": 1}
+
+
+def test_least_recently_completed_item_goes_first(store):
+    store.claim("commits", ["a", "b"]).release({"n": 1})
+
+    assert store.claim("commits", ["a", "b"]).repo_name == "b"
+
+
+def test_expired_lease_is_reclaimed_and_fenced(store):
+    stale = store.claim("commits", ["app"], ttl=-1)
+    fresh = store.claim("commits", ["app"])
+
+    assert fresh is not None and fresh.token != stale.token
+    assert not stale.heartbeat()
+    assert not stale.release({"since": 99})
+    assert fresh.release({"since": 2})
+    assert store.claim("commits", ["app"]).checkpoint == {"since": 2}
+
+
+def test_min_age_skips_recently_completed_items(store):
+    store.claim("commits", ["app"]).release({})
+
+    assert store.claim("commits", ["app"], min_age=3600) is None
+
+
+def test_connections_are_closed(store, monkeypatch):
+    opened = []
+
+    class Tracked(sqlite3.Connection):
+        closed = False
+
+        def close(self):
+            self.closed = True
+            super().close()
+
+    def connect():
+        conn = sqlite3.connect(store.path, isolation_level=None, factory=Tracked)
+        opened.append(conn)
+        return conn
+
+    monkeypatch.setattr(store, "_connect", connect)
+
+    lease = store.claim("commits", ["app"])
+    for _ in range(3):
+        lease.heartbeat()
+    lease.release({})
+
+    assert len(opened) == 5
+    assert all(conn.closed for conn in opened)
@@ -0,0 +1,105 @@
+"""
+Epoch-microsecond normalization of event timestamps
+
+Timestamps arrive as ISO strings in mixed forms: "Z" from the REST API,
+"+05:30" offsets from webhook payloads, and naive UTC from older writers.
+Compared as strings they mis-order silently. Each record keeps its original
+string, and normalize() adds an integer <field>_us next to it (microseconds
+since the Unix epoch, UTC). Watermarks, sorting and windowing compare those
+integers.
+"""
+
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, Iterator, Optional
+
+# -----------------------------
+# CONFIG
+# -----------------------------
+
+US_PER_SECOND = 1_000_000
+SUFFIX = "_us"
+
+# Timestamp fields of the commit, deployment and PR records.
+TIMESTAMP_FIELDS = (
+    "commit_timestamp",
+    "deployment_created_at",
+    "status_created_at",
+    "created_at",
+    "updated_at",
+    "merged_at",
+    "ingested_at",
+)
+
+# -----------------------------
+# CONVERSION
+# -----------------------------
+
+
+def to_epoch_us(ts: str) -> int:
+    dt = datetime.fromisoformat(ts.replace("Z", "+00:00"))
+    if dt.tzinfo is None:
+        # Naive values were written as UTC (datetime.utcnow()).
+        dt = dt.replace(tzinfo=timezone.utc)
+    return int(dt.timestamp()) * US_PER_SECOND + dt.microsecond
+
+
+def as_epoch_us(value: Any) -> Optional[int]:
+    """Epoch microseconds from an int, an ISO string (older checkpoints) or None."""
+    if value is None or isinstance(value, int):
+        return value
+    return to_epoch_us(value)
+
+
+def from_epoch_us(us: int) -> str:
+    """ISO 8601 in UTC with a "Z" suffix, the form the GitHub API takes."""
+    dt = datetime.fromtimestamp(us // US_PER_SECOND, timezone.utc)
+    dt = dt.replace(microsecond=us % US_PER_SECOND)
+    return dt.isoformat(timespec="microseconds" if dt.microsecond else "seconds").replace(
+        "+00:00", "Z"
+    )
+
+
+def now_iso() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+def base_field(key: str) -> str:
+    """The string field an epoch column belongs to (key itself otherwise)."""
+    if key.endswith(SUFFIX) and key[: -len(SUFFIX)] in TIMESTAMP_FIELDS:
+        return key[: -len(SUFFIX)]
+    return key
+
+
+# -----------------------------
+# RECORDS
+# -----------------------------
+
+
+def normalize(record: Dict[str, Any]) -> Dict[str, Any]:
+    """Add <field>_us for each timestamp field present, in place."""
+    for field in TIMESTAMP_FIELDS:
+        if field in record:
+            value = record[field]
+            record[field + SUFFIX] = to_epoch_us(value) if value else None
+    return record
+
+
+def normalize_all(records: Iterable[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+    for r in records:
+        yield normalize(r)
+
+
+def epoch_of(record: Dict[str, Any], field: str) -> Optional[int]:
+    """The epoch column of a record, computed for records written before it."""
+    us = record.get(field + SUFFIX)
+    if us is not None:
+        return us
+    value = record.get(field)
+    return to_epoch_us(value) if value else None
+
+
+def later(a: Optional[str], b: Optional[str]) -> Optional[str]:
+    """The later of two ISO timestamps (either may be None)."""
+    if not a or not b:
+        return a or b
+    return a if to_epoch_us(a) >= to_epoch_us(b) else b
@@ -1,5 +1,6 @@
 from flask import Flask, request, jsonify
-from datetime import datetime
+from datetime import datetime, timezone
+from payload_decoder import decode, EVENT_SUMMARY_SCHEMA
 
 app = Flask(__name__)
 
@@ -14,14 +15,23 @@ def webhook():
         }), 200
 
     event = request.headers.get("X-GitHub-Event", "unknown")
-    payload = request.get_json(silent=True) or {}
+    body = request.get_data()
+    raw = None
+    try:
+        payload = decode(body, EVENT_SUMMARY_SCHEMA)
+    except ValueError:
+        # This endpoint logs whatever arrives; keep the body it can't read.
+        payload = {}
+        raw = body.decode("utf-8", errors="replace")
 
     record = {
         "event": event,
-        "repo": payload.get("repository", {}).get("full_name"),
+        "repo": (payload.get("repository") or {}).get("full_name"),
         "action": payload.get("action"),
-        "timestamp": datetime.utcnow().isoformat()
+        "timestamp": datetime.now(timezone.utc).isoformat()
     }
+    if raw is not None:
+        record["raw"] = raw
 
     EVENT_STORE.append(record)
 
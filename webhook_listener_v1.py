@@ -1,8 +1,12 @@
 import hmac
 import hashlib
-import json
-from datetime import datetime
 from flask import Flask, request, abort, jsonify
+from admission_control import AdmissionQueue
+from ingest_triggers import TriggerQueue
+from push_backfill import PushBackfill
+from payload_decoder import decode, PUSH_SCHEMA
+from timestamps import normalize, now_iso
+from json_store import dumps
 
 app = Flask(__name__)
 
@@ -27,9 +31,40 @@ def verify_signature(req):
         abort(401)
 
 
-def persist_event(record):
+def persist_events(records):
     with open(EVENT_LOG_FILE, "a") as f:
-        f.write(json.dumps(record) + "\n")
+        f.writelines(dumps(r) + "\n" for r in records)
+
+
+def build_records(payload, commits):
+    repo_name = payload["repository"]["full_name"]
+    branch = payload["ref"].replace("refs/heads/", "")
+
+    # commit["timestamp"] carries the pusher's offset (+05:30); the
+    # commit_timestamp_us column makes it comparable with API timestamps.
+    return [
+        normalize({
+            "event_type": "push",
+            "commit_sha": commit["id"],
+            "commit_timestamp": commit["timestamp"],
+            "repo_name": repo_name,
+            "author": commit["author"]["name"],
+            "branch": branch,
+            "ingested_at": now_iso()
+        })
+        for commit in commits
+    ]
+
+
+def persist_backfilled(payload, commits):
+    persist_events(build_records(payload, commits))
+
+
+admission = AdmissionQueue(persist_events).start()
+triggers = TriggerQueue().start()
+backfill = PushBackfill(persist_backfilled)
+
+ZERO_SHA = "0" * 40
 
 
 @app.route("/webhook", methods=["POST"])
@@ -37,36 +72,47 @@ def webhook():
     verify_signature(request)
 
     event_type = request.headers.get("X-GitHub-Event")
-    payload = request.get_json()
 
     if event_type != "push":
         return jsonify({"status": "ignored", "event": event_type}), 200
 
+    try:
+        payload = decode(request.get_data(), PUSH_SCHEMA)
+    except ValueError:
+        abort(400)
+
+    records = build_records(payload, payload["commits"])
+
+    # Shed before anything is started: GitHub redelivers the push.
+    if records and not admission.offer(records):
+        return (
+            jsonify({"status": "overloaded"}),
+            503,
+            {"Retry-After": str(admission.retry_after)},
+        )
+
     repo_name = payload["repository"]["full_name"]
     branch = payload["ref"].replace("refs/heads/", "")
 
-    stored = 0
+    # Targeted API fetch for this branch only (branch deletions and tag
+    # pushes have nothing to ingest).
+    if payload["ref"].startswith("refs/heads/") and payload["after"] != ZERO_SHA:
+        triggers.enqueue("commits", repo_name, branch)
 
-    for commit in payload.get("commits", []):
-        record = {
-            "event_type": event_type,
-            "commit_sha": commit["id"],
-            "commit_timestamp": commit["timestamp"],
-            "repo_name": repo_name,
-            "author": commit["author"]["name"],
-            "branch": branch,
-            "ingested_at": datetime.utcnow().isoformat()
-        }
-
-        persist_event(record)
-        stored += 1
+    # Payload capped at 20 commits: fetch the rest in the background.
+    backfill.maybe_submit(payload)
 
     return jsonify({
         "status": "received",
-        "stored_events": stored
+        "stored_events": len(records)
     }), 200
 
 
+@app.route("/metrics", methods=["GET"])
+def metrics():
+    return jsonify({**admission.stats(), **triggers.stats(), **backfill.stats()}), 200
+
+
 if __name__ == "__main__":
     app.run(host="0.0.0.0", port=3000)
 
@@ -0,0 +1,337 @@
+"""
+Lease-based coordination of (source, repo) work items across ingestion nodes
+
+A worker claims one work item at a time with an expiring lease, heartbeats
+it while fetching, and releases it together with the item's updated
+checkpoint. A lease that is not heartbeated (crashed or stalled worker)
+expires and the item becomes claimable again. Heartbeat and release carry
+the lease token, so a worker whose lease was reclaimed cannot overwrite the
+new holder's checkpoint.
+
+Two interchangeable backends:
+  SQLiteLeaseStore    one file, for local runs and tests
+  SupabaseLeaseStore  the work_items table and RPCs in schema.sql
+"""
+
+import os
+import abc
+import json
+import uuid
+import socket
+import sqlite3
+import threading
+from contextlib import closing
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional
+
+# -----------------------------
+# CONFIG
+# -----------------------------
+
+LEASE_BACKEND = os.getenv("LEASE_BACKEND")
+LEASE_DB_FILE = os.getenv("LEASE_DB_FILE", "work_leases.db")
+LEASE_TTL_SECONDS = int(os.getenv("LEASE_TTL_SECONDS", "300"))
+
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+# -----------------------------
+# LEASE
+# -----------------------------
+
+
+class Lease:
+    def __init__(
+        self,
+        store: "LeaseStore",
+        source: str,
+        repo_name: str,
+        token: str,
+        checkpoint: Optional[Dict[str, Any]],
+        ttl: int,
+    ) -> None:
+        self.store = store
+        self.source = source
+        self.repo_name = repo_name
+        self.token = token
+        self.checkpoint = checkpoint or {}
+        self.ttl = ttl
+
+        self.lost = False
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def heartbeat(self) -> bool:
+        if not self.store.heartbeat(self, self.ttl):
+            self.lost = True
+        return not self.lost
+
+    def release(self, checkpoint: Optional[Dict[str, Any]] = None) -> bool:
+        self._stop.set()
+        if self.lost:
+            return False
+        return self.store.release(self, checkpoint)
+
+    def _keep_alive(self) -> None:
+        while not self._stop.wait(self.ttl / 3):
+            try:
+                if not self.heartbeat():
+                    print(f"Lease lost: {self.source}:{self.repo_name}")
+                    return
+            except Exception as e:
+                # Retried on the next tick; the lease outlives a few misses.
+                print("Lease heartbeat failed:", e)
+
+    def __enter__(self) -> "Lease":
+        self._thread = threading.Thread(
+            target=self._keep_alive, name="lease-heartbeat", daemon=True
+        )
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        # Released explicitly with a checkpoint on success; on failure the
+        # lease is dropped without one so the next claimer resumes from the
+        # previous checkpoint.
+        self._stop.set()
+        if not self.lost and exc[0] is not None:
+            self.store.release(self, None)
+
+
+class LeaseStore(abc.ABC):
+    @abc.abstractmethod
+    def claim(
+        self,
+        source: str,
+        repos: List[str],
+        ttl: int = LEASE_TTL_SECONDS,
+        min_age: int = 0,
+        owner: str = WORKER_ID,
+    ) -> Optional[Lease]:
+        """
+        Claim the least recently completed unleased item among repos, skipping
+        items completed less than min_age seconds ago. None when nothing is
+        claimable.
+        """
+
+    @abc.abstractmethod
+    def heartbeat(self, lease: Lease, ttl: int) -> bool:
+        """Extend the lease by ttl seconds. False once it has been lost."""
+
+    @abc.abstractmethod
+    def release(self, lease: Lease, checkpoint: Optional[Dict[str, Any]]) -> bool:
+        """
+        Give the item up, completed with checkpoint or (None) as it was.
+        False once the lease has been lost.
+        """
+
+
+# -----------------------------
+# SQLITE BACKEND
+# -----------------------------
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+class SQLiteLeaseStore(LeaseStore):
+    def __init__(self, path: str = LEASE_DB_FILE) -> None:
+        self.path = path
+        with closing(self._connect()) as conn:
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS work_items (
+                  source TEXT NOT NULL,
+                  repo_name TEXT NOT NULL,
+                  checkpoint TEXT,
+                  lease_owner TEXT,
+                  lease_token TEXT,
+                  lease_expires_at TEXT,
+                  last_completed_at TEXT,
+                  attempts INTEGER NOT NULL DEFAULT 0,
+                  PRIMARY KEY (source, repo_name)
+                )
+                """
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        # Autocommit mode; transactions are opened explicitly below. Every
+        # caller closes its connection (a connection's "with" only commits).
+        return sqlite3.connect(self.path, timeout=30, isolation_level=None)
+
+    def claim(self, source, repos, ttl=LEASE_TTL_SECONDS, min_age=0, owner=WORKER_ID):
+        now = _now()
+        token = uuid.uuid4().hex
+
+        conn = self._connect()
+        try:
+            # IMMEDIATE takes the write lock up front: one claimer at a time.
+            conn.execute("BEGIN IMMEDIATE")
+            conn.executemany(
+                "INSERT OR IGNORE INTO work_items (source, repo_name) VALUES (?, ?)",
+                [(source, repo) for repo in repos],
+            )
+
+            placeholders = ",".join("?" for _ in repos)
+            row = conn.execute(
+                f"""
+                SELECT repo_name, checkpoint FROM work_items
+                WHERE source = ?
+                  AND repo_name IN ({placeholders})
+                  AND (lease_expires_at IS NULL OR lease_expires_at < ?)
+                  AND (last_completed_at IS NULL OR last_completed_at < ?)
+                ORDER BY last_completed_at IS NOT NULL, last_completed_at
+                LIMIT 1
+                """,
+                [
+                    source,
+                    *repos,
+                    now.isoformat(),
+                    (now - timedelta(seconds=min_age)).isoformat(),
+                ],
+            ).fetchone()
+
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+
+            repo_name, checkpoint = row
+            conn.execute(
+                """
+                UPDATE work_items
+                SET lease_owner = ?, lease_token = ?, lease_expires_at = ?,
+                    attempts = attempts + 1
+                WHERE source = ? AND repo_name = ?
+                """,
+                (
+                    owner,
+                    token,
+                    (now + timedelta(seconds=ttl)).isoformat(),
+                    source,
+                    repo_name,
+                ),
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+        return Lease(
+            self, source, repo_name, token, json.loads(checkpoint or "null"), ttl
+        )
+
+    def heartbeat(self, lease, ttl):
+        with closing(self._connect()) as conn:
+            cur = conn.execute(
+                """
+                UPDATE work_items SET lease_expires_at = ?
+                WHERE source = ? AND repo_name = ? AND lease_token = ?
+                """,
+                (
+                    (_now() + timedelta(seconds=ttl)).isoformat(),
+                    lease.source,
+                    lease.repo_name,
+                    lease.token,
+                ),
+            )
+            return cur.rowcount == 1
+
+    def release(self, lease, checkpoint):
+        with closing(self._connect()) as conn:
+            if checkpoint is None:
+                cur = conn.execute(
+                    """
+                    UPDATE work_items
+                    SET lease_owner = NULL, lease_token = NULL, lease_expires_at = NULL
+                    WHERE source = ? AND repo_name = ? AND lease_token = ?
+                    """,
+                    (lease.source, lease.repo_name, lease.token),
+                )
+            else:
+                cur = conn.execute(
+                    """
+                    UPDATE work_items
+                    SET lease_owner = NULL, lease_token = NULL, lease_expires_at = NULL,
+                        checkpoint = ?, last_completed_at = ?
+                    WHERE source = ? AND repo_name = ? AND lease_token = ?
+                    """,
+                    (
+                        json.dumps(checkpoint),
+                        _now().isoformat(),
+                        lease.source,
+                        lease.repo_name,
+                        lease.token,
+                    ),
+                )
+            return cur.rowcount == 1
+
+
+# -----------------------------
+# SUPABASE BACKEND
+# -----------------------------
+
+
+class SupabaseLeaseStore(LeaseStore):
+    def __init__(self, supabase: Any) -> None:
+        self.supabase = supabase
+
+    def claim(self, source, repos, ttl=LEASE_TTL_SECONDS, min_age=0, owner=WORKER_ID):
+        res = self.supabase.rpc(
+            "claim_work_item",
+            {
+                "p_source": source,
+                "p_repos": repos,
+                "p_owner": owner,
+                "p_ttl_seconds": ttl,
+                "p_min_age_seconds": min_age,
+            },
+        ).execute()
+
+        if not res.data:
+            return None
+
+        row = res.data[0]
+        return Lease(
+            self, source, row["repo_name"], row["lease_token"], row["checkpoint"], ttl
+        )
+
+    def heartbeat(self, lease, ttl):
+        res = self.supabase.rpc(
+            "heartbeat_work_item",
+            {
+                "p_source": lease.source,
+                "p_repo": lease.repo_name,
+                "p_token": lease.token,
+                "p_ttl_seconds": ttl,
+            },
+        ).execute()
+        return bool(res.data)
+
+    def release(self, lease, checkpoint):
+        res = self.supabase.rpc(
+            "release_work_item",
+            {
+                "p_source": lease.source,
+                "p_repo": lease.repo_name,
+                "p_token": lease.token,
+                "p_checkpoint": checkpoint,
+            },
+        ).execute()
+        return bool(res.data)
+
+
+def open_store(supabase: Any = None) -> LeaseStore:
+    """LEASE_BACKEND picks the backend; default Supabase when a client is given."""
+    backend = LEASE_BACKEND or ("supabase" if supabase is not None else "sqlite")
+
+    if backend == "supabase":
+        if supabase is None:
+            raise RuntimeError("LEASE_BACKEND=supabase needs a Supabase client")
+        return SupabaseLeaseStore(supabase)
+
+    if backend == "sqlite":
+        return SQLiteLeaseStore()
+
+    raise RuntimeError(f"Unknown LEASE_BACKEND: {backend}")